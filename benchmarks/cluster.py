@@ -0,0 +1,285 @@
+"""
+Starts a cluster of nodes on localhost, drives transaction load at it and reports how it copes
+
+Each node gets its own project directory (me.json, users.json, nodes.json)
+under the cluster directory and is configured through the BLOCKCHAIN_*
+environment variables, so no node ever talks to the real bootnode. Each
+transaction is posted either to all the nodes, as the web client does, or to
+one node after the other.
+
+Reported:
+    confirmation latency: from posting a transaction until every node has it in its chain
+    fork rate: share of the blocks seen in some node's chain that did not end up in the final chain
+    convergence time: from the last post until every node has the same chain
+
+Blocks are only seen when the nodes are polled, so short lived forks can be
+missed and the fork rate is a lower bound.
+
+Run from the project directory:
+    python -m benchmarks.cluster [--nodes N] [--rate tx/sec] [--duration seconds] [--post-to all|one]
+                                 [--save results.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+from Cryptodome.Hash import SHA3_512
+
+from benchmarks.keys import KEY_FILE, load_keys
+
+INITIAL_BALANCE = 10 ** 9
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def user_files(keys):
+    """
+    :return: (users.json contents, me.json contents of each user)
+    """
+    users, mes = [], []
+    for index, (public_key, private_key) in enumerate(keys):
+        unhashed_id = f'benchmark{index}'
+        user = {'alias': f'bench{index}', 'hashed_id': SHA3_512.new(unhashed_id.encode()).hexdigest(),
+                'public_key': public_key, 'initial_balance': INITIAL_BALANCE}
+        users.append(user)
+        mes.append({'alias': user['alias'], 'hashed_id': user['hashed_id'], 'unhashed_id': unhashed_id,
+                    'public_key': public_key, 'private_key': private_key})
+    return users, mes
+
+
+def write_project(directory, me, users, nodes):
+    os.makedirs(directory, exist_ok=True)
+    for name, contents in (('me.json', me), ('users.json', users), ('nodes.json', nodes)):
+        with open(os.path.join(directory, name), 'w') as f:
+            json.dump(contents, f)
+
+
+def node_environment(port, bootnode):
+    environment = dict(os.environ,
+                       BLOCKCHAIN_HOST='127.0.0.1',
+                       BLOCKCHAIN_PORT=str(port),
+                       BLOCKCHAIN_BOOTNODE=bootnode,
+                       BLOCKCHAIN_START_FROM_BOOTNODE='0')
+    environment['PYTHONPATH'] = os.pathsep.join([PROJECT] + [path for path in [os.environ.get('PYTHONPATH')] if path])
+    return environment
+
+
+def start_nodes(directory, urls, users, mes):
+    """
+    Writes a project directory for every node and starts it
+
+    Returns:
+        :return: list of Popen of the nodes
+    """
+    processes = []
+    for index, url in enumerate(urls):
+        project = os.path.join(directory, f'node{index}')
+        write_project(project, mes[index % len(mes)], users, [other for other in urls if other != url])
+        with open(os.path.join(project, 'log.txt'), 'w') as log:
+            processes.append(subprocess.Popen([sys.executable, os.path.join(PROJECT, 'run.py')], cwd=project,
+                                              env=node_environment(url.rsplit(':', 1)[1], urls[0]),
+                                              stdout=log, stderr=subprocess.STDOUT))
+    return processes
+
+
+def wait_until_up(urls, timeout):
+    deadline = time.time() + timeout
+    for url in urls:
+        while True:
+            try:
+                requests.get(f'{url}/api/nodes', timeout=1)
+                break
+            except requests.RequestException:
+                if time.time() > deadline:
+                    raise TimeoutError(f'{url} did not come up, see its log.txt')
+                time.sleep(0.2)
+
+
+class Observer:
+    """
+    Polls the chain of every node and remembers every block it has seen
+
+    Attributes:
+        chains: node url -> list of block hashes of its chain when last polled
+        transactions: block hash -> set of the hashes of its transactions
+        confirmed: transaction hash -> time it was first seen in the chain of every node
+    """
+
+    def __init__(self, urls, transaction_hash, session):
+        self.urls = urls
+        self.transaction_hash = transaction_hash
+        self.session = session
+        self.chains = {url: [] for url in urls}
+        self.transactions = dict()
+        self.confirmed = dict()
+
+    def _headers(self, url):
+        headers = []
+        while True:
+            page = self.session.get(f'{url}/api/headers', params={'from_height': len(headers)}, timeout=5).json()
+            headers += page
+            if not page:
+                return headers
+
+    def _body(self, url, block_hash):
+        answer = self.session.get(f'{url}/api/block/{block_hash}', timeout=5)
+        if answer.status_code != 200:
+            #  The node moved on to another fork since its headers were read
+            return None
+        return {self.transaction_hash(transaction) for transaction in answer.json()['block']['transactions']}
+
+    def poll(self):
+        for url in self.urls:
+            try:
+                hashes = [header['hash'] for header in self._headers(url)]
+                for block_hash in hashes:
+                    if block_hash not in self.transactions:
+                        body = self._body(url, block_hash)
+                        if body is not None:
+                            self.transactions[block_hash] = body
+                self.chains[url] = hashes
+            except (requests.RequestException, ValueError):
+                continue
+        now = time.time()
+        everywhere = None
+        for hashes in self.chains.values():
+            included = set()
+            for block_hash in hashes:
+                included |= self.transactions.get(block_hash, set())
+            everywhere = included if everywhere is None else everywhere & included
+        for transaction_hash in everywhere or ():
+            self.confirmed.setdefault(transaction_hash, now)
+
+    def converged(self):
+        chains = list(self.chains.values())
+        return all([chain == chains[0] for chain in chains])
+
+    def stale_blocks(self):
+        """
+        :return: (blocks seen that are not in the chain of the first node, blocks seen)
+        """
+        final = set(self.chains[self.urls[0]])
+        return len([block_hash for block_hash in self.transactions if block_hash not in final]), len(self.transactions)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else None
+
+
+def drive(urls, signers, rate, duration, settle, poll_interval, post_to='all'):
+    """
+    Posts rate transactions a second for duration seconds, then waits for the nodes to agree
+
+    Args:
+        :param post_to: 'all' posts every transaction to every node, 'one' to the nodes in turn
+    Returns:
+        :return: dictionary of the results
+    """
+    #  Imported here, after the caller made a project directory the current one
+    from blockchain.classes import to_json, transaction_from_dict
+    from blockchain.gossip import broadcast, new_session
+    from benchmarks.synthetic import signed_transactions
+
+    session = new_session()
+    observer = Observer(urls, lambda transaction: transaction_from_dict(transaction).hash(), session)
+    submitted, rejected = dict(), 0
+    start = time.time()
+    next_post, next_poll, count = start, start, 0
+    while time.time() < start + duration:
+        now = time.time()
+        if now >= next_post:
+            transaction = signed_transactions(signers, 1, count)[0]
+            count += 1
+            targets = urls if post_to == 'all' else [urls[count % len(urls)]]
+            yes, no, reason = broadcast(targets, 'accept_transaction', to_json(transaction), session=session)
+            if yes > no:
+                submitted[transaction.hash()] = now
+            else:
+                rejected += 1
+            next_post += 1 / rate
+        if now >= next_poll:
+            observer.poll()
+            next_poll = time.time() + poll_interval
+        time.sleep(max(0, min(next_post, next_poll) - time.time()))
+    last_post = time.time()
+
+    convergence = None
+    while time.time() < last_post + settle:
+        observer.poll()
+        if observer.converged() and all([key in observer.confirmed for key in submitted]):
+            convergence = time.time() - last_post
+            break
+        time.sleep(poll_interval)
+
+    latencies = [observer.confirmed[key] - posted for key, posted in submitted.items() if key in observer.confirmed]
+    stale, seen = observer.stale_blocks()
+    return {'posted': count,
+            'accepted': len(submitted),
+            'rejected': rejected,
+            'confirmed': len(latencies),
+            'latency_p50_s': percentile(latencies, 0.5),
+            'latency_p95_s': percentile(latencies, 0.95),
+            'latency_max_s': max(latencies) if latencies else None,
+            'blocks_seen': seen,
+            'stale_blocks': stale,
+            'fork_rate': stale / seen if seen else 0.0,
+            'final_height': len(observer.chains[urls[0]]),
+            'convergence_s': convergence}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--users', type=int, default=6)
+    parser.add_argument('--port', type=int, default=5300, help='port of the first node, the others follow it')
+    parser.add_argument('--rate', type=float, default=2.0, help='transactions posted per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to post transactions for')
+    parser.add_argument('--settle', type=float, default=60.0, help='most seconds to wait for the nodes to agree')
+    parser.add_argument('--post-to', choices=['all', 'one'], default='one',
+                        help='post each transaction to every node, or to one node after the other')
+    parser.add_argument('--poll', type=float, default=0.5, help='seconds between polls of the chains')
+    parser.add_argument('--directory', help='where the nodes keep their files, a new temporary directory by default')
+    parser.add_argument('--save', help='write the results to this json file')
+    args = parser.parse_args(argv)
+
+    directory = os.path.abspath(args.directory or tempfile.mkdtemp(prefix='blockchain-cluster-'))
+    save = os.path.abspath(args.save) if args.save else None
+    key_file = os.path.abspath(KEY_FILE)
+    users, mes = user_files(load_keys(args.users, key_file))
+    urls = [f'http://127.0.0.1:{args.port + index}' for index in range(args.nodes)]
+    print(f'Starting {args.nodes} nodes in {directory}')
+    processes = start_nodes(directory, urls, users, mes)
+    try:
+        wait_until_up(urls, timeout=60)
+        #  The load generator is a node that is never served, so it can build and sign transactions
+        client = os.path.join(directory, 'client')
+        write_project(client, mes[0], users, [])
+        os.environ.update(BLOCKCHAIN_START_FROM_BOOTNODE='0', BLOCKCHAIN_BOOTNODE=urls[0])
+        os.chdir(client)
+        from benchmarks.synthetic import users as signing_users
+        signers = signing_users(args.users, key_file)
+        print(f'Posting {args.rate} transactions a second for {args.duration} seconds')
+        results = drive(urls, signers, args.rate, args.duration, args.settle, args.poll, args.post_to)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    for name, value in results.items():
+        print(f'{name:<16} {value:.3f}' if isinstance(value, float) else f'{name:<16} {value}')
+    if save:
+        with open(save, 'w') as f:
+            json.dump({'meta': {'nodes': args.nodes, 'users': args.users, 'rate': args.rate,
+                                'duration': args.duration, 'post_to': args.post_to},
+                       'results': results}, f, indent=2)
+    return 0 if results['convergence_s'] is not None else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
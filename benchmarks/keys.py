@@ -0,0 +1,34 @@
+"""
+Cache of RSA key pairs for the benchmarks
+
+Only imports Cryptodome, so it can be used before a project directory is set
+up, e.g. by the cluster launcher.
+"""
+import json
+import os
+
+from Cryptodome.PublicKey import RSA
+
+KEY_FILE = 'benchmark_keys.json'
+
+
+def load_keys(count, path=KEY_FILE, bits=2048):
+    """
+    Args:
+        :param count: number of key pairs wanted
+        :param path: json file the keys are cached in, only the missing ones are generated
+        :param bits: size of newly generated keys
+    Returns:
+        :return: list of count (public PEM, private PEM) pairs
+    """
+    keys = []
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            keys = json.load(f)
+    if len(keys) < count:
+        for _ in range(count - len(keys)):
+            key = RSA.generate(bits)
+            keys.append([key.publickey().export_key().decode(), key.export_key().decode()])
+        with open(path, 'w') as f:
+            json.dump(keys, f)
+    return keys[:count]
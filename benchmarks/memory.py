@@ -0,0 +1,74 @@
+"""
+Memory held by a chain received over the wire, with and without the compact in-memory model
+
+Run from the project directory of a configured node (me.json, users.json, nodes.json):
+    python -m benchmarks.memory [number of transactions] [transactions per block]
+"""
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+from blockchain.classes import registry, blockchain_from_dict
+
+
+def random_user(index):
+    #  Sized like a 2048 bit PEM public key, the contents are never looked at
+    return {'alias': f'bench{index}', 'hashed_id': os.urandom(64).hex(),
+            'public_key': os.urandom(225).hex(), 'private_key': None}
+
+
+def wire_chain(num_transactions, per_block, users):
+    #  Signatures are never verified here, so random ones of the right size will do
+    chain = []
+    for start in range(0, num_transactions, per_block):
+        transactions = [{'sender': users[i % len(users)], 'recipient': users[(i + 1) % len(users)],
+                         'value': i, 'fee': 1, 'time': '2020-01-01 00:00:00',
+                         'signature': os.urandom(256).hex()}
+                        for i in range(start, min(start + per_block, num_transactions))]
+        chain.append({'prev_hash': os.urandom(64).hex(), 'miner': users[start % len(users)],
+                      'transactions': transactions, 'nonce': start, 'time': '2020-01-01 00:00:00',
+                      'signature': os.urandom(256).hex()})
+    return json.dumps({'chain': chain, 'transactions': []})
+
+
+def held(wire, compact):
+    """
+    :return: (bytes held by the parsed and hashed chain, the chain)
+    """
+    gc.collect()
+    tracemalloc.start()
+    blockchain = blockchain_from_dict(json.loads(wire))
+    for block in blockchain.chain:
+        #  What validating and indexing the chain leaves cached
+        block.hash()
+        for transaction in block.transactions:
+            transaction.hash()
+        if compact:
+            block.compact()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, blockchain
+
+
+def main(num_transactions=100000, per_block=100, num_users=50):
+    num_transactions, per_block = int(num_transactions), int(per_block)
+    strangers = [random_user(i) for i in range(num_users)]
+    members = [random_user(i) for i in range(num_users)]
+    for user in members:
+        registry.add(dict(user, initial_balance=0))
+    cases = [('users not in the registry', strangers, False),
+             ('interned users', members, False),
+             ('interned users, compacted', members, True)]
+    print(f'{num_transactions} transactions in blocks of {per_block}')
+    print(f'{"case":<28} {"MB":>8} {"bytes/tx":>9}')
+    for name, users, compact in cases:
+        size, blockchain = held(wire_chain(num_transactions, per_block, users), compact)
+        del blockchain
+        print(f'{name:<28} {size / 2 ** 20:>8.1f} {size / num_transactions:>9.0f}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,25 @@
+"""
+Hashes per second of the proof of work miner as the number of worker processes grows
+
+Run from the project directory of a configured node (me.json, users.json, nodes.json):
+    python -m benchmarks.mining [seconds per run]
+"""
+import sys
+
+from blockchain import me, chain_settings
+from blockchain.classes import Block, to_json
+from blockchain.miner import hash_rate
+
+
+def main(seconds=3.0):
+    json_str = to_json(Block(prev_hash='0', miner=me, transactions=[]))
+    print(f'{"workers":>8} {"hashes/sec":>12} {"speedup":>8}')
+    base = None
+    for workers in range(1, chain_settings.MINING_WORKERS + 1):
+        rate = hash_rate(json_str, workers, seconds)
+        base = base or rate
+        print(f'{workers:>8} {rate:>12.0f} {rate / base:>8.2f}')
+
+
+if __name__ == '__main__':
+    main(*map(float, sys.argv[1:]))
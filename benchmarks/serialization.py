@@ -0,0 +1,70 @@
+"""
+Schema driven serializer against the reflective to_dict/json.dumps path it replaced
+
+Run from the project directory of a configured node (me.json, users.json, nodes.json):
+    python -m benchmarks.serialization [number of transactions] [transactions per block]
+"""
+import json
+import os
+import sys
+from timeit import default_timer
+
+from blockchain.classes import User, Transaction, Block, Blockchain
+from blockchain.serializer import to_dict, to_json, reflective_to_dict
+
+
+def synthetic_chain(num_transactions, per_block, num_users=50):
+    #  Serialization never looks inside keys or signatures, so random hex of the right size will do
+    users = [User(f'user{i}', os.urandom(64).hex(), os.urandom(225).hex(), None)
+             for i in range(num_users)]
+    chain = []
+    for start in range(0, num_transactions, per_block):
+        transactions = [Transaction(sender=users[i % num_users],
+                                    recipient=users[(i + 1) % num_users],
+                                    value=i, fee=1, signature=os.urandom(256).hex())
+                        for i in range(start, min(start + per_block, num_transactions))]
+        chain.append(Block(prev_hash=os.urandom(64).hex(), miner=users[start % num_users],
+                           transactions=transactions, nonce=start, signature=os.urandom(256).hex()))
+    return Blockchain(chain)
+
+
+def clear_caches(blockchain):
+    for block in blockchain.chain:
+        block.unseal()
+        block.miner.__dict__.pop('_json', None)
+        for transaction in block.transactions:
+            transaction.unseal()
+            transaction.sender.__dict__.pop('_json', None)
+            transaction.recipient.__dict__.pop('_json', None)
+
+
+def measure(function, obj, reset=None, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = default_timer()
+        function(obj)
+        best = min(best, default_timer() - start)
+    return best
+
+
+def main(num_transactions=10000, per_block=100):
+    blockchain = synthetic_chain(int(num_transactions), int(per_block))
+    reflective_json = lambda obj: json.dumps(reflective_to_dict(obj), sort_keys=True)
+    cases = [('to_json(blockchain)', blockchain, reflective_json, to_json),
+             ('to_dict(blockchain)', blockchain, reflective_to_dict, to_dict),
+             ('to_json(block)', blockchain.chain[0], reflective_json, to_json)]
+    print(f'{num_transactions} transactions in blocks of {per_block}')
+    print('cold: caches cleared before every run, warm: objects serialized before')
+    print(f'{"case":<22} {"reflective (s)":>15} {"cold (s)":>9} {"warm (s)":>9} {"cold speedup":>13}')
+    for name, obj, old, new in cases:
+        assert old(obj) == new(obj)
+        old_time = measure(old, obj)
+        cold_time = measure(new, obj, lambda: clear_caches(blockchain))
+        warm_time = measure(new, obj)
+        print(f'{name:<22} {old_time:>15.4f} {cold_time:>9.4f} {warm_time:>9.4f} {old_time / cold_time:>13.2f}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,178 @@
+"""
+Latency and throughput of the hot paths on a synthetic chain, saved as a json baseline
+
+Every case is run several times and its latencies are summarized. Results can
+be saved as a json baseline, and a later run compared against it fails if any
+case got slower than the tolerance allows.
+
+Run from the project directory of a configured node (me.json, users.json, nodes.json):
+    python -m benchmarks.suite [--blocks N] [--per-block N] [--save baseline.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime
+from timeit import default_timer
+
+from blockchain import app, chain_state, chain_settings
+from blockchain.classes import Block, blockchain_from_dict, to_json
+from benchmarks.serialization import clear_caches
+from benchmarks.synthetic import users, signed_transactions, mined_chain
+
+
+def measure(function, repeat, setup=None):
+    """
+    Args:
+        :param function: called with what setup returned, or with nothing
+        :param repeat: number of timed calls
+        :param setup: untimed function run before each call
+    Returns:
+        :return: list of seconds each call took
+    """
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = default_timer()
+        function() if setup is None else function(argument)
+        times.append(default_timer() - start)
+    return times
+
+
+def summarize(times, items):
+    """
+    :param times: seconds of each call
+    :param items: number of transactions, blocks or requests handled per call
+    :return: dictionary of latency statistics in milliseconds and throughput per second
+    """
+    ordered = sorted(times)
+    mean = sum(ordered) / len(ordered)
+    return {'runs': len(ordered),
+            'items': items,
+            'min_ms': ordered[0] * 1000,
+            'mean_ms': mean * 1000,
+            'p50_ms': ordered[len(ordered) // 2] * 1000,
+            'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+            'items_per_sec': items / mean if mean else float('inf')}
+
+
+def chain_cases(signers, blockchain, repeat):
+    num_transactions = sum([len(block.transactions) for block in blockchain.chain])
+    wire = to_json(blockchain)
+    template = signed_transactions(signers, len(blockchain.chain[-1].transactions), num_transactions)
+
+    def new_template():
+        return Block(prev_hash=blockchain.tip_hash(), miner=signers[0].public_version(), transactions=template)
+
+    yield 'Block.mine', summarize(measure(lambda block: block.mine(), repeat, new_template), 1)
+    yield 'Blockchain.is_valid', summarize(measure(blockchain.is_valid, repeat), num_transactions)
+    yield 'Blockchain.compute_balances', summarize(measure(blockchain.compute_balances, repeat), 1)
+    yield 'to_json (cold)', summarize(measure(lambda _: to_json(blockchain), repeat,
+                                              lambda: clear_caches(blockchain)), num_transactions)
+    yield 'to_json (warm)', summarize(measure(lambda: to_json(blockchain), repeat), num_transactions)
+    yield 'blockchain_from_dict', summarize(measure(lambda: blockchain_from_dict(json.loads(wire)), repeat),
+                                            num_transactions)
+
+
+def endpoint_cases(signers, blockchain, repeat):
+    block = blockchain.chain[len(blockchain.chain) // 2]
+    transaction = block.transactions[0]
+    public_key = signers[0].public_key
+    urls = [('GET /api/chain', '/api/chain'),
+            ('GET /api/chain (page)', '/api/chain?from_height=0&limit=100'),
+            ('GET /api/headers', '/api/headers?from_height=0'),
+            ('GET /api/blocks', '/api/blocks?from_height=0'),
+            ('GET /api/block/<hash>', f'/api/block/{block.hash()}'),
+            ('GET /api/tx/<hash>', f'/api/tx/{transaction.hash()}'),
+            ('GET /api/address/<key>/history', f'/api/address/{public_key}/history')]
+    #  Our own chain is not long enough to replace ours, so it is turned down without changing anything
+    rejected_chain = json.dumps(to_json(blockchain))
+    #  Serve the synthetic chain without touching the node's own chain or its block store
+    live = chain_state.blockchain
+    chain_state.blockchain = blockchain
+    chain_state.publish()
+    try:
+        client = app.test_client()
+        for name, url in urls:
+            def get():
+                response = client.get(url)
+                assert response.status_code == 200, f'{url} answered {response.status_code}'
+                response.get_data()
+            yield name, summarize(measure(get, repeat), 1)
+
+        def post():
+            response = client.post('/api/accept_chain', data=rejected_chain, content_type='application/json')
+            assert response.status_code == 407, f'/api/accept_chain answered {response.status_code}'
+        yield 'POST accept_chain (too short)', summarize(measure(post, repeat), 1)
+    finally:
+        chain_state.blockchain = live
+        chain_state.publish()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Args:
+        :param results: results of this run
+        :param baseline: results of an earlier run
+        :param tolerance: largest accepted ratio of this run's fastest latency to the baseline's,
+                          the fastest run being the one least disturbed by the rest of the machine
+    Returns:
+        :return: list of (case, ratio) of the cases that regressed
+    """
+    regressions = []
+    print(f'{"case (fastest run)":<32} {"baseline ms":>12} {"now ms":>10} {"ratio":>7}')
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = result['min_ms'] / before['min_ms'] if before['min_ms'] else 1.0
+        flag = '  REGRESSION' if ratio > tolerance else ''
+        print(f'{name:<32} {before["min_ms"]:>12.3f} {result["min_ms"]:>10.3f} {ratio:>7.2f}{flag}')
+        if ratio > tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--blocks', type=int, default=20)
+    parser.add_argument('--per-block', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--save', help='write the results to this json baseline')
+    parser.add_argument('--compare', help='json baseline to compare against, exits with 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    signers = users(args.users)
+    blockchain = mined_chain(signers, args.blocks, args.per_block)
+    results = dict()
+    print(f'{args.blocks} blocks of {args.per_block} transactions, {args.users} users, {args.repeat} runs each')
+    print(f'{"case":<32} {"p50 ms":>10} {"p95 ms":>10} {"items/sec":>12}')
+    for cases in (chain_cases, endpoint_cases):
+        for name, result in cases(signers, blockchain, args.repeat):
+            results[name] = result
+            print(f'{name:<32} {result["p50_ms"]:>10.3f} {result["p95_ms"]:>10.3f} {result["items_per_sec"]:>12.1f}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'meta': {'time': datetime.now().isoformat(timespec='seconds'),
+                                'python': platform.python_version(),
+                                'machine': platform.machine(),
+                                'difficulty': chain_settings.DIFFICULTY,
+                                'key_bits': chain_settings.NUM_KEY_BITS,
+                                'users': args.users,
+                                'blocks': args.blocks,
+                                'per_block': args.per_block,
+                                'repeat': args.repeat},
+                       'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Generators of synthetic users, signed transactions and mined blocks for the benchmarks
+
+RSA keys take a while to generate, so they are kept in KEY_FILE and only the
+missing ones are generated on later runs.
+"""
+from Cryptodome.Hash import SHA3_512
+
+from blockchain.chain_settings import *
+from blockchain.classes import User, Transaction, Block, Blockchain, registry
+from blockchain.difficulty import INITIAL_TARGET
+from benchmarks.keys import KEY_FILE, load_keys
+
+INITIAL_BALANCE = 10 ** 9
+
+
+def users(count, path=KEY_FILE):
+    """
+    Makes users with private keys and adds them to the registry with a large balance
+
+    Args:
+        :param count: number of users
+        :param path: json file the keys are cached in
+    Returns:
+        :return: list of Users that can sign
+    """
+    made = []
+    for index, (public_key, private_key) in enumerate(load_keys(count, path, NUM_KEY_BITS)):
+        hashed_id = SHA3_512.new(f'benchmark{index}'.encode()).hexdigest()
+        if not registry.find(public_key):
+            registry.add({'alias': f'bench{index}', 'hashed_id': hashed_id,
+                          'public_key': public_key, 'initial_balance': INITIAL_BALANCE})
+        made.append(User(f'bench{index}', hashed_id, public_key, private_key))
+    return made
+
+
+def signed_transactions(signers, count, start=0):
+    """
+    Args:
+        :param signers: Users from users()
+        :param count: number of transactions
+        :param start: offset that keeps the transactions of several calls distinct
+    Returns:
+        :return: list of signed Transactions between neighbouring signers
+    """
+    transactions = []
+    for i in range(start, start + count):
+        transaction = Transaction(sender=signers[i % len(signers)].public_version(),
+                                  recipient=signers[(i + 1) % len(signers)].public_version(),
+                                  value=i, fee=1)
+        signers[i % len(signers)].sign(transaction)
+        transactions.append(transaction)
+    return transactions
+
+
+def mined_block(signers, prev_hash, transactions, miner=0, target=INITIAL_TARGET):
+    """
+    :return: Block of the transactions on top of prev_hash, mined for target and signed by signers[miner]
+    """
+    block = Block(prev_hash=prev_hash, miner=signers[miner].public_version(), transactions=transactions)
+    block.mine(target=target)
+    signers[miner].sign(block)
+    return block
+
+
+def mined_chain(signers, num_blocks, per_block):
+    """
+    Args:
+        :param signers: Users from users()
+        :param num_blocks: length of the chain
+        :param per_block: transactions in each block
+    Returns:
+        :return: valid, indexed Blockchain that is not attached to a store
+    """
+    blockchain = Blockchain()
+    for height in range(num_blocks):
+        transactions = signed_transactions(signers, per_block, height * per_block)
+        blockchain.add_block(mined_block(signers, blockchain.tip_hash(), transactions,
+                                         height % len(signers), blockchain.next_target()))
+    blockchain.build_index()
+    return blockchain
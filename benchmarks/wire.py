@@ -0,0 +1,48 @@
+"""
+Bytes on the wire and encode/decode time of a chain, in JSON and in the binary format
+
+Run from the project directory of a configured node (me.json, users.json, nodes.json):
+    python -m benchmarks.wire [number of transactions] [transactions per block]
+"""
+import json
+import sys
+from timeit import default_timer
+
+from blockchain import wire
+from blockchain.classes import registry
+from benchmarks.memory import random_user, wire_chain
+
+
+def timed(function, *args):
+    start = default_timer()
+    result = function(*args)
+    return result, default_timer() - start
+
+
+def main(num_transactions=10000, per_block=100, num_users=50):
+    num_transactions, per_block = int(num_transactions), int(per_block)
+    users = [random_user(i) for i in range(num_users)]
+    for user in users:
+        registry.add(dict(user, initial_balance=0))
+    message = json.loads(wire_chain(num_transactions, per_block, users))
+
+    #  What nodes sent before the binary format: a json string holding the json of the message
+    body, encode_time = timed(lambda: json.dumps(json.dumps(message)).encode())
+    _, decode_time = timed(wire.loads, body, wire.JSON)
+    rows = [('json (double encoded)', len(body), encode_time, decode_time)]
+    compressions = [None, 'zlib'] + (['zstd'] if wire.zstandard is not None else [])
+    for compression in compressions:
+        body, encode_time = timed(wire.encode, message, compression)
+        decoded, decode_time = timed(wire.loads, body, wire.BINARY)
+        assert decoded == message
+        rows.append((f'binary, {compression or "uncompressed"}', len(body), encode_time, decode_time))
+
+    print(f'{num_transactions} transactions in blocks of {per_block}')
+    print(f'{"format":<24} {"KB":>9} {"bytes/tx":>9} {"encode ms":>10} {"decode ms":>10}')
+    for name, size, encode_time, decode_time in rows:
+        print(f'{name:<24} {size / 1024:>9.1f} {size / num_transactions:>9.0f} '
+              f'{encode_time * 1000:>10.1f} {decode_time * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
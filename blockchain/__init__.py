@@ -1,6 +1,8 @@
 import requests
 import os
 import json
+from collections import deque
+from threading import Lock
 from flask import Flask
 
 from blockchain.chain_settings import *
@@ -16,11 +18,15 @@ else:
     exit('Please provide a me.json')
 
 
+_nodes_lock = Lock()
+
+
 def add_node(node):
-    if node in NODES:
-        return False
-    else:
-        NODES.append(node)
+    with _nodes_lock:
+        if node in NODES:
+            return False
+        else:
+            NODES.append(node)
 
 
 if not START_FROM_BOOTNODE:
@@ -43,24 +49,54 @@ if not START_FROM_BOOTNODE:
                 exit('Please provide a valid users.json')
     else:
         exit('Please provide a users.json')
-    log = []
+    log = deque(maxlen=LOG_SIZE)
 else:
     USERS = requests.get(f'{BOOTNODE}/api/users').json()
     NODES = requests.get(f'{BOOTNODE}/api/nodes').json()
-    log = requests.get(f'{BOOTNODE}/api/nodes').json()
+    log = deque(requests.get(f'{BOOTNODE}/api/log').json(), maxlen=LOG_SIZE)
 
 
 from blockchain.classes import *
+from blockchain.miner import start_miners
+from blockchain.verifier import start_pool
+
+#  Fork the miners and the signature verifiers while this is still the only thread
+#  (the miners first, the verifiers' Pool starts threads of its own)
+start_miners()
+start_pool()
 
 app = Flask(__name__, instance_relative_config=False)
 app.config.from_pyfile('config.py')
 
 me = user_from_dict(ME)
 
-if START_FROM_BOOTNODE:
-    my_chain = blockchain_from_dict(requests.get(f'{BOOTNODE}/api/chain').json())
+from blockchain.store import BlockStore, blockchain_from_store
+
+block_store = BlockStore()
+if len(block_store) > 0:
+    my_chain = blockchain_from_store(block_store)
 else:
     my_chain = Blockchain()
+    my_chain.attach(block_store)
+    my_chain.build_index()
+
+if START_FROM_BOOTNODE:
+    #  Download whatever the bootnode has past our stored chain, from every peer we know of
+    from blockchain.sync import ChainSync, serves_headers, download_chain
+
+    if serves_headers(BOOTNODE):
+        synced = ChainSync(my_chain, [BOOTNODE] + [node for node in NODES if node != BOOTNODE]).run()
+    else:
+        #  The bootnode predates headers-first sync and only sends its whole chain
+        synced = download_chain(BOOTNODE)
+    if synced is not None and synced is not my_chain \
+            and takes_over(synced.chain, len(my_chain.chain), my_chain.tip_hash()) and synced.is_valid():
+        my_chain.replace_chain(synced.chain)
+
+from blockchain.state import ChainState
+
+#  Change my_chain only inside chain_state.write(), read chain_state.snapshot instead
+chain_state = ChainState(my_chain)
 
 import blockchain.views.client
 import blockchain.views.api
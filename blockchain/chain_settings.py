@@ -1,6 +1,51 @@
-#  Cryptographic strength constants
+from os import cpu_count, environ
+
+#  Cryptographic strength constants (DIFFICULTY is the leading hex zeros of the first blocks' hashes)
 DIFFICULTY = 1
 NUM_KEY_BITS = 2048
+KEY_CACHE_SIZE = 1024
+
+#  Difficulty retargeting: every RETARGET_INTERVAL blocks the target is scaled towards blocks
+#  TARGET_BLOCK_TIME seconds apart, by at most MAX_RETARGET_FACTOR, and never easier than
+#  DIFFICULTY. A RETARGET_INTERVAL of 0 keeps every block at DIFFICULTY
+RETARGET_INTERVAL = 100
+TARGET_BLOCK_TIME = 60
+MAX_RETARGET_FACTOR = 4
+
+#  Block timestamps: a block's time may not be before the median time of the MEDIAN_TIME_BLOCKS
+#  blocks before it, nor more than MAX_FUTURE_BLOCK_TIME seconds ahead of our clock
+MEDIAN_TIME_BLOCKS = 11
+MAX_FUTURE_BLOCK_TIME = 2 * 60 * 60
+
+#  Mining
+MINING_WORKERS = cpu_count() or 1
+MINING_CHUNK = 10000
+PARALLEL_MINING_DIFFICULTY = 3
+CANCEL_POLL = 0.1
+
+#  Signature verification
+VERIFICATION_WORKERS = cpu_count() or 1
+PARALLEL_VERIFICATION_MIN = 64
+
+#  Gossip
+GOSSIP_WORKERS = 16
+GOSSIP_TIMEOUT = 5
+
+#  Wire format between nodes (compression is None, 'zlib' or 'zstd')
+WIRE_COMPRESSION = 'zlib'
+WIRE_COMPRESS_MIN = 256
+
+#  Headers-first sync
+MAX_HEADERS = 2000
+MAX_BLOCKS = 100
+SYNC_WINDOW = 8
+
+#  Observability: entries kept in /api/log and latency buckets (seconds) of /api/metrics
+LOG_SIZE = 1000
+METRIC_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+#  Mempool
+MAX_BLOCK_TRANSACTIONS = 1000
 
 #  Blockchain acceptance conditions
 TRANSACTION_MIN_VALUE = 0
@@ -9,11 +54,18 @@ TOTAL_TRANSACTION_FEE = 1
 LENGTH_DIFFERENCE = 1
 BASE_MINER_REWARD = 10
 
+#  On-disk block store, relative to the project directory (BLOCKCHAIN_STORE_DIR overrides it).
+#  Only the digests of the blocks are kept in memory, plus the STORE_CACHE_BLOCKS last read blocks
+BLOCK_STORE_DIR = environ.get('BLOCKCHAIN_STORE_DIR', 'blocks')
+STORE_CACHE_BLOCKS = 1000
+SEGMENT_BLOCKS = 1000
+CHECKPOINT_INTERVAL = 100
+
 #  Name of private blockchain to display in html
 CHAIN_NAME = 'Private Blockchain'
 
-# Bootnode
-BOOTNODE = 'http://67.205.129.210:80'
+# Bootnode, can be set per process with BLOCKCHAIN_BOOTNODE
+BOOTNODE = environ.get('BLOCKCHAIN_BOOTNODE', 'http://67.205.129.210:80')
 
-# Pull values from Bootnode at startup
-START_FROM_BOOTNODE = True
+# Pull values from Bootnode at startup, BLOCKCHAIN_START_FROM_BOOTNODE=0 starts from our own files
+START_FROM_BOOTNODE = environ.get('BLOCKCHAIN_START_FROM_BOOTNODE', '1').lower() not in ('0', 'false', 'no')
@@ -1,15 +1,22 @@
-from copy import deepcopy
-from dataclasses import dataclass
+from collections import deque
+from collections.abc import Sequence
+from dataclasses import dataclass, replace, InitVar
 from datetime import datetime
 from time import time
 from typing import List
 
 from Cryptodome.Hash import SHA3_512
 from Cryptodome.PublicKey import RSA
-from Cryptodome.Signature import pkcs1_15
 
 from blockchain.chain_settings import *
-from blockchain import USERS
+from blockchain import USERS, miner, verifier
+from blockchain.difficulty import INITIAL_TARGET, TargetSchedule, meets_target, parse_block_time, block_seconds, \
+    median_time, time_valid
+from blockchain.index import ChainIndex
+from blockchain.keys import KEYS
+from blockchain.mempool import Mempool
+from blockchain.metrics import timed
+from blockchain.serializer import to_dict, to_json, to_signing_bytes
 
 import json
 
@@ -18,40 +25,6 @@ def valid_type(obj, *args):
     return type(obj).__name__ in args
 
 
-#  stack overflow
-def to_dict(obj, class_key=None):
-    if isinstance(obj, dict):
-        data = {}
-        for (k, v) in obj.items():
-            data[k] = to_dict(v, class_key)
-        return data
-    elif hasattr(obj, "_ast"):
-        return to_dict(obj._ast())
-    elif hasattr(obj, "__iter__") and not isinstance(obj, str):
-        return [to_dict(v, class_key) for v in obj]
-    elif hasattr(obj, "__dict__"):
-        data = dict([(key, to_dict(value, class_key))
-                     for key, value in obj.__dict__.items()
-                     if not callable(value) and not key.startswith('_')])
-        if class_key is not None and hasattr(obj, "__class__"):
-            data[class_key] = obj.__class__.__name__
-        return data
-    else:
-        return obj
-
-
-def to_json(obj) -> str:
-    """
-    Converts obj to dictionary and json dumps it
-
-    Args:
-        :param obj: object to convert to json string
-    Returns:
-        :return: jsonified string of obj (NOT flask response)
-    """
-    return json.dumps(to_dict(obj), sort_keys=True)
-
-
 def hasher(obj):
     """
     Creates a SHA3_512 hasher object updated with the obj param
@@ -65,10 +38,11 @@ def hasher(obj):
     return SHA3_512.new().update(obj if type(obj) == bytes else to_json(obj).encode())
 
 
-@dataclass
+@dataclass(frozen=True)
 class User:
     """
     This stores user variables and allows for easy data manipulation
+    Users are immutable, so the same object can be shared between lookups
 
     Attributes:
         alias (str): Alias of user for ease of identification
@@ -84,13 +58,17 @@ class User:
 
     def generate_key_pair(self):
         """
-        Creates and sets public/private keys of user
+        Creates public/private keys for a user that has none
+
+        Returns:
+            :return: Copy of user with the new keys
         """
         assert self.public_key is None, 'This user already has a public key'
         assert self.private_key is None, 'This user already has a private key'
         key_pair = RSA.generate(NUM_KEY_BITS)
-        self.private_key = key_pair.export_key().decode()
-        self.public_key = key_pair.publickey().export_key().decode()
+        return replace(self,
+                       private_key=key_pair.export_key().decode(),
+                       public_key=key_pair.publickey().export_key().decode())
 
     def sign(self, obj):
         """
@@ -102,10 +80,9 @@ class User:
         """
         assert valid_type(obj, 'Transaction', 'Block')
         assert obj.signature is None, 'This Message is already signed'
-        key = RSA.import_key(self.private_key)
-        assert RSA.RsaKey.has_private(key), 'Invalid private key'
-        signer = pkcs1_15.new(key)
-        obj.signature = signer.sign(hasher(obj)).hex()
+        signer = KEYS.scheme(self.private_key)
+        assert signer.can_sign(), 'Invalid private key'
+        obj.signature = signer.sign(obj.hasher())
 
     def public_version(self):
         """
@@ -115,20 +92,130 @@ class User:
             :return: Copy of user without private key
         """
         #  this will be used in various post-inits
-        copy = deepcopy(self)
-        copy.private_key = None
-        return copy
+        if self.private_key is None:
+            return self
+        return replace(self, private_key=None)
+
+
+class UserRegistry:
+    """
+    Indexes the users list by public key and by hashed id
+
+    Attributes:
+        users: List of user dictionaries, as served by /api/users
+    """
+
+    def __init__(self, users):
+        self.users = users
+        self._by_hashed_id = dict()
+        self._by_public_key = dict()
+        self._users = dict()
+        self._by_reference = dict()
+        for user in users:
+            self._index(user)
+
+    def _index(self, user):
+        self._by_hashed_id[user['hashed_id']] = user
+        if user.get('public_key') is not None:
+            self._by_public_key[user['public_key']] = user
+            shared = User(user['alias'], user['hashed_id'], user['public_key'], None)
+            self._users[user['public_key']] = shared
+            self._by_reference[self._reference(shared)] = shared
+
+    @staticmethod
+    def _reference(user):
+        return hasher(json.dumps([user.public_key, user.alias, user.hashed_id]).encode()).digest()[:8]
+
+    def reference(self, public_key, alias, hashed_id):
+        """
+        Args:
+            :param public_key: public key of a user
+            :param alias: alias of the user
+            :param hashed_id: hashed id of the user
+        Returns:
+            :return: 8 byte reference that stands for exactly this user, or None if the registry
+                     has no such user
+        """
+        user = self._users.get(public_key)
+        if user is None or user.alias != alias or user.hashed_id != hashed_id:
+            return None
+        return self._reference(user)
+
+    def find_by_reference(self, reference):
+        """
+        :return: shared public User with that reference, or False
+        """
+        return self._by_reference.get(reference, False)
+
+    def find(self, public_key):
+        """
+        Args:
+            :param public_key: public key of a claimed user
+        Returns:
+            :return: shared public User object, or False if no user has the key
+        """
+        return self._users.get(public_key, False)
+
+    def add(self, user):
+        """
+        Indexes a user dictionary that was not in the list the registry was made from
+
+        Args:
+            :param user: user dictionary with at least a hashed_id and initial_balance
+        """
+        self.users.append(user)
+        self._index(user)
+
+    def intern(self, user):
+        """
+        Swaps a public User for the equal one the registry already holds, so
+        every transaction of a user shares one object and one copy of its key
+
+        Args:
+            :param user: public User
+        Returns:
+            :return: the shared User, or user itself if the registry has no equal one
+        """
+        shared = self._users.get(user.public_key)
+        return shared if shared == user else user
+
+    def find_by_id(self, unhashed_id):
+        """
+        Args:
+            :param unhashed_id: secret id of a user
+        Returns:
+            :return: user dictionary whose hashed id matches, or None
+        """
+        return self._by_hashed_id.get(hasher(unhashed_id.encode()).hexdigest())
+
+    def initial_balance(self, public_key):
+        user = self._by_public_key.get(public_key)
+        return 0 if user is None else user['initial_balance']
+
+    def initial_balances(self):
+        return {public_key: user['initial_balance']
+                for public_key, user in self._by_public_key.items()}
+
+    def claim(self, user, public_key, alias):
+        """
+        Associates a public key and alias with an unclaimed user
+
+        Args:
+            :param user: user dictionary from find_by_id
+            :param public_key: PEM public key of the claimer
+            :param alias: alias chosen by the claimer
+        """
+        user['public_key'] = public_key
+        user['alias'] = alias
+        user['private_key'] = None
+        self._index(user)
+
+
+registry = UserRegistry(USERS)
 
 
 def find_user(public_key):
-    for user in USERS:
-        if 'public_key' in user and public_key == user['public_key']:
-            return User(user['alias'],
-                        user['hashed_id'],
-                        user['public_key'],
-                        'None')
-    else:
-        return False
+    return registry.find(public_key)
 
 
 def user_from_dict(user_dict):
@@ -146,6 +233,89 @@ def user_from_dict(user_dict):
                 private_key=user_dict['private_key'])
 
 
+class Sealed:
+    """
+    Caches the bytes a Transaction or Block is signed over, their hash,
+    and the object's json
+
+    The cache is filled the first time it is needed and dropped whenever a
+    field is assigned (the signature only affects the json). Changing a
+    field in place (for example appending to Block.transactions) is not
+    noticed, so call unseal after doing that.
+
+    Once an object is settled, e.g. its block is part of our chain, compact
+    drops everything but the 64 byte digest. From then on the json and the
+    signing bytes are worked out again whenever they are needed, and are
+    not kept.
+    """
+
+    def __setattr__(self, name, value):
+        if not name.startswith('_'):
+            self.__dict__.pop('_json', None)
+            if name != 'signature':
+                self.__dict__.pop('_signing_bytes', None)
+                self.__dict__.pop('_hasher', None)
+                self.__dict__.pop('_digest', None)
+        object.__setattr__(self, name, value)
+
+    def unseal(self):
+        """
+        Drops the cached serialization and hash
+        """
+        self.__dict__.pop('_json', None)
+        self.__dict__.pop('_signing_bytes', None)
+        self.__dict__.pop('_hasher', None)
+        self.__dict__.pop('_digest', None)
+
+    def compact(self):
+        """
+        Keeps only the digest, dropping the caches used while signing, mining and verifying
+        """
+        self.digest()
+        self.__dict__.pop('_json', None)
+        self.__dict__.pop('_signing_bytes', None)
+        self.__dict__.pop('_hasher', None)
+        self.__dict__['_settled'] = True
+
+    def signing_bytes(self):
+        """
+        :return: canonical json of the object without its signature, as bytes
+        """
+        message = self.__dict__.get('_signing_bytes')
+        if message is None:
+            message = to_signing_bytes(self)
+            if '_settled' not in self.__dict__:
+                self._signing_bytes = message
+        return message
+
+    def hasher(self):
+        """
+        :return: finalized SHA3_512 hasher of the signing bytes (do not update it)
+        """
+        h = self.__dict__.get('_hasher')
+        if h is None:
+            h = hasher(self.signing_bytes())
+            if '_settled' not in self.__dict__:
+                self._hasher = h
+        return h
+
+    def digest(self):
+        """
+        :return: SHA3_512 digest of the signing bytes
+        """
+        digest = self.__dict__.get('_digest')
+        if digest is None:
+            digest = self._digest = self.hasher().digest()
+        return digest
+
+    def hash(self):
+        """
+        :return: hex digest of the signing bytes, e.g. what prev_hash points at
+        """
+        return self.digest().hex()
+
+
+@timed('blockchain_valid_signature_seconds', 'Checking the signature of one transaction or block')
 def valid_signature(obj):
     """
     Validates the signature of object with 'signature' field
@@ -161,23 +331,37 @@ def valid_signature(obj):
         sender = obj.sender
     else:
         sender = obj.miner
-    public_key = RSA.import_key(sender.public_key)
-    verifier = pkcs1_15.new(public_key)
-    copy = deepcopy(obj)
-    copy.signature = None
-    try:
-        verifier.verify(hasher(copy), bytearray.fromhex(obj.signature))
-    except ValueError:
-        return False
-    return True
+    return verifier.verify(sender.public_key, obj.hasher(), obj.signature)
+
+
+def signature_bytes(signature):
+    """
+    Args:
+        :param signature: signature as bytes, hex, 'None' or None
+    Returns:
+        :return: signature as bytes, or None if unsigned.
+                 Text that is not hex is kept so that it fails verification
+    """
+    if signature is None or signature == 'None':
+        return None
+    if isinstance(signature, str):
+        try:
+            return bytes.fromhex(signature)
+        except ValueError:
+            return signature
+    return signature
 
 
-def timestamp():
-    return datetime.utcfromtimestamp(time()).strftime('%Y-%m-%d %H:%M:%S')
+def timestamp(seconds=None):
+    """
+    :param seconds: seconds since the epoch, or None for now
+    :return: the time in the format of Block.time and Transaction.time
+    """
+    return datetime.utcfromtimestamp(time() if seconds is None else seconds).strftime('%Y-%m-%d %H:%M:%S')
 
 
 @dataclass
-class Transaction:
+class Transaction(Sealed):
     """
     Class for storing transactions to allow for easy verification
 
@@ -198,19 +382,20 @@ class Transaction:
     signature: str = None
 
     def __post_init__(self):
-        self.sender = self.sender.public_version()
-        self.recipient = self.recipient.public_version()
-        if self.signature == 'None':
-            self.signature = None
+        self.sender = registry.intern(self.sender.public_version())
+        self.recipient = registry.intern(self.recipient.public_version())
+        self.signature = signature_bytes(self.signature)
         if self.time == 'None':
             self.time = None
         if self.time is None:
             self.time = timestamp()
 
-    def is_valid(self):
+    def is_valid(self, check_signature=True):
         """
         Is the transaction (by itself) valid
 
+        Args:
+            :param check_signature: False if the signature was already batch verified
         Returns:
             :return: Transaction value is acceptable,
                      signature is valid,
@@ -218,7 +403,7 @@ class Transaction:
         """
         if self.value < TRANSACTION_MIN_VALUE:
             return False
-        if not valid_signature(self):
+        if check_signature and not valid_signature(self):
             return False
         return find_user(self.sender.public_key)\
                and find_user(self.recipient.public_key)
@@ -239,7 +424,7 @@ def transaction_from_dict(transaction_dict):
 
 
 @dataclass
-class Block:
+class Block(Sealed):
     """
     Block that stores proof of work
 
@@ -248,7 +433,9 @@ class Block:
         miner: User (without private key) to whom the transaction fee's will go to
         transactions: List of transactions in block
         nonce: Nonce used for mining the block
-        time: Timestamp at the time of creation, not used for verification
+        time: Timestamp at the time of creation. It sets the proof of work target of
+              later blocks, so it may not be before the median time of the blocks before it
+              nor too far in the future, see difficulty.time_valid
         signature: Miner's signature of this block
     """
 
@@ -260,7 +447,8 @@ class Block:
     signature: str = None
 
     def __post_init__(self):
-        self.miner = self.miner.public_version()
+        self.miner = registry.intern(self.miner.public_version())
+        self.signature = signature_bytes(self.signature)
         if self.time == 'None':
             self.time = None
         if self.time is None:
@@ -268,49 +456,73 @@ class Block:
         if self.nonce == '0':
             self.nonce = 0
 
-    def transactions_valid(self):
+    def transactions_valid(self, check_signatures=True):
         total = 0
         for transaction in self.transactions:
-            if not transaction.is_valid():
+            if not transaction.is_valid(check_signatures):
                 return False
             total += transaction.fee
         return total >= TOTAL_TRANSACTION_FEE
 
-    def difficulty_valid(self, premade_json_str=None):
-        for_mining = premade_json_str is not None
-        if for_mining:
-            h = hasher(premade_json_str.encode()).hexdigest()
-        else:
-            temp, self.signature = self.signature, None
-            h = hasher(self).hexdigest()
-            self.signature = temp
-        return h[:DIFFICULTY] == '0' * DIFFICULTY
+    def difficulty_valid(self, target=INITIAL_TARGET):
+        """
+        :param target: proof of work target of the block's height, see Blockchain.target
+        :return: if the raw digest, read as a number, is below the target
+        """
+        return meets_target(self.digest(), target)
 
-    def is_valid(self):
+    def header(self, height):
         """
+        Summary of the block that is enough to check proof of work and linkage
+
+        Args:
+            :param height: height of the block in its chain
+        Returns:
+            :return: dictionary of height, hash, prev_hash, nonce and time
+        """
+        return {'height': height,
+                'hash': self.hash(),
+                'prev_hash': self.prev_hash,
+                'nonce': self.nonce,
+                'time': self.time}
+
+    def is_valid(self, check_signatures=True, target=INITIAL_TARGET):
+        """
+        :param check_signatures: False if the signatures were already batch verified
+        :param target: proof of work target of the block's height, see Blockchain.target
         :return: if all the transactions are valid
                     and the hash has appropriate proof of work
         """
-        if not self.difficulty_valid():
+        if not self.difficulty_valid(target):
             return False
-        if not self.transactions_valid():
+        if not self.transactions_valid(check_signatures):
             return False
-        if not valid_signature(self):
+        if check_signatures and not valid_signature(self):
             return False
         return find_user(self.miner.public_key)
 
-    def mine(self):
+    def compact(self):
+        """
+        Compacts the block and its transactions, e.g. once the block is part of our chain
+        """
+        for transaction in self.transactions:
+            transaction.compact()
+        Sealed.compact(self)
+
+    @timed('blockchain_block_mine_seconds', 'Mining a block, including cancelled attempts')
+    def mine(self, cancel=None, target=INITIAL_TARGET):
+        """
+        :param cancel: threading.Event that abandons mining when set
+        :param target: proof of work target of the height the block is mined for
+        :return: False if mining was cancelled before a nonce was found
+        """
         assert self.transactions_valid(), 'You cannot mine an invalid block'
         assert self.nonce == 0, 'The nonce has already been modified'
-        premade_json_str = to_json(self)
-        nonce_str = '"nonce": '
-        nonce_index = int(premade_json_str.find(nonce_str)) + len(nonce_str)
-        nonce = 0
-        while not self.difficulty_valid(premade_json_str):
-            premade_json_str = premade_json_str[:nonce_index] + \
-                               premade_json_str[nonce_index:].replace(str(nonce), str(nonce + 1), 1)
-            nonce += 1
+        nonce = miner.mine(self.signing_bytes().decode(), target, cancel=cancel)
+        if nonce is None:
+            return False
         self.nonce = nonce
+        return True
 
 
 def block_from_dict(block_dict):
@@ -323,6 +535,257 @@ def block_from_dict(block_dict):
                  signature=block_dict['signature'])
 
 
+class InvalidBlock(ValueError):
+    """
+    A received block is missing fields or has fields of the wrong type
+    """
+
+
+class ChainView(Sequence):
+    """
+    Blocks of a received chain, only built into Block objects when they are looked at
+
+    A chain a peer sends is mostly the same as ours, and is often turned down
+    for being too short. The view holds the block dictionaries as they were
+    received. Only the blocks that validation reaches are built, so a rejected
+    chain, or the part a chain shares with ours, costs next to nothing.
+
+    The hash of a block can be read without building it. A block whose
+    dictionary is not exactly in canonical form may hash differently than the
+    Block built from it. That only makes the part shared with our chain look
+    shorter than it is, which is safe.
+    """
+
+    def __init__(self, block_dicts):
+        if not isinstance(block_dicts, list):
+            raise InvalidBlock('The chain is not a list of blocks')
+        self._dicts = block_dicts
+        self._blocks = [None] * len(block_dicts)
+        self._hashes = [None] * len(block_dicts)
+
+    def __len__(self):
+        return len(self._dicts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[height] for height in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        block = self._blocks[index]
+        if block is None:
+            try:
+                block = self._blocks[index] = block_from_dict(self._dicts[index])
+            except (KeyError, TypeError, ValueError, AttributeError):
+                raise InvalidBlock(f'Block {index} is malformed')
+        return block
+
+    def hash_at(self, height):
+        """
+        :return: hash of the block at height, without building the block unless it was already built
+        """
+        if self._blocks[height] is not None:
+            return self._blocks[height].hash()
+        block_hash = self._hashes[height]
+        if block_hash is None:
+            try:
+                message = json.dumps(dict(self._dicts[height], signature=None), sort_keys=True).encode()
+            except (TypeError, ValueError):
+                raise InvalidBlock(f'Block {height} is malformed')
+            block_hash = self._hashes[height] = hasher(message).hexdigest()
+        return block_hash
+
+    def time_at(self, height):
+        """
+        :return: timestamp of the block at height, without building the block
+        """
+        if self._blocks[height] is not None:
+            return self._blocks[height].time
+        try:
+            return self._dicts[height]['time']
+        except (KeyError, TypeError):
+            raise InvalidBlock(f'Block {height} is malformed')
+
+
+class ChainPrefix(Sequence):
+    """
+    The first height blocks of another chain, followed by blocks appended to this one only
+
+    Lets a copy of our chain be extended, e.g. by a sync, without copying
+    the blocks it shares with our chain or reading them from disk.
+    """
+
+    def __init__(self, chain, height):
+        self._chain = chain
+        self._height = height
+        self._appended = []
+
+    def __len__(self):
+        return self._height + len(self._appended)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[height] for height in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < self._height:
+            return self._chain[index]
+        return self._appended[index - self._height]
+
+    def append(self, block):
+        self._appended.append(block)
+
+    def hash_at(self, height):
+        """
+        :return: hash of the block at height, without reading a block of the other chain
+        """
+        if height < self._height:
+            return block_hash(self._chain, height)
+        return self._appended[height - self._height].hash()
+
+    def time_at(self, height):
+        """
+        :return: timestamp of the block at height
+        """
+        if height < self._height:
+            return block_time(self._chain, height)
+        return self._appended[height - self._height].time
+
+
+def block_hash(chain, height):
+    """
+    :return: hash of the block at height of a list of blocks or of a lazy chain
+             (ChainView, ChainPrefix or store.StoredChain), without building or reading the block
+    """
+    if isinstance(chain, list):
+        return chain[height].hash()
+    return chain.hash_at(height)
+
+
+def block_time(chain, height):
+    """
+    :return: timestamp of the block at height of a list of blocks or of a lazy chain
+    """
+    if isinstance(chain, list):
+        return chain[height].time
+    return chain.time_at(height)
+
+
+def block_json(chain, height):
+    """
+    :return: canonical json of the block at height of a list of blocks or of a lazy chain,
+             read straight from disk for a store.StoredChain
+    """
+    json_at = getattr(chain, 'json_at', None)
+    if json_at is not None:
+        return json_at(height)
+    return to_json(chain[height])
+
+
+def common_prefix_length(chain, other_chain):
+    """
+    Finds how many blocks two chains share from genesis onwards
+
+    Each block's hash covers the hash of the block before it, so the chains
+    are compared from the shorter one's tip backwards, and only as far as
+    they differ.
+
+    Args:
+        :param chain: list of blocks
+        :param other_chain: list of blocks
+    Returns:
+        :return: height of the first block at which the chains differ
+    """
+    height = min(len(chain), len(other_chain))
+    while height > 0 and block_hash(chain, height - 1) != block_hash(other_chain, height - 1):
+        height -= 1
+    return height
+
+
+def chain_wins(length, other_tip_hash, height, tip_hash):
+    """
+    Fork choice between a peer's chain and ours, from their lengths and tips alone
+
+    A chain LENGTH_DIFFERENCE blocks longer than ours wins. If a chain one
+    block longer already wins (LENGTH_DIFFERENCE of at most 1), of two equally
+    long chains the one whose tip has the lower hash wins too, so nodes that
+    mined competing blocks at the same time all settle on the same one
+    without waiting for a longer chain. With a larger LENGTH_DIFFERENCE an
+    equally long chain never wins, or it would beat a longer one that does not.
+
+    Args:
+        :param length: number of blocks of the peer's chain
+        :param other_tip_hash: hash of the tip of the peer's chain
+        :param height: number of blocks of our chain
+        :param tip_hash: hash of the tip of our chain
+    Returns:
+        :return: if the peer's chain should replace ours (once it is found valid)
+    """
+    if length == height and height > 0 and LENGTH_DIFFERENCE <= 1:
+        return other_tip_hash < tip_hash
+    return length - height >= LENGTH_DIFFERENCE and length != height
+
+
+def takes_over(other_chain, height, tip_hash):
+    """
+    Fork choice between a peer's chain and ours, see chain_wins
+
+    Args:
+        :param other_chain: list of blocks or ChainView of the peer's chain
+        :param height: number of blocks of our chain
+        :param tip_hash: hash of the tip of our chain
+    Returns:
+        :return: if the peer's chain should replace ours (once it is found valid)
+    """
+    length = len(other_chain)
+    return chain_wins(length, block_hash(other_chain, length - 1) if length else None, height, tip_hash)
+
+
+class Ledger:
+    """
+    Running record of how the blocks of a chain changed each balance,
+    so balances never have to be recomputed from genesis
+
+    Attributes:
+        deltas: Public key -> net change in balance caused by the applied blocks
+        changed: public keys whose delta changed since it was last cleared, or None when not tracked
+    """
+
+    def __init__(self, blocks=(), deltas=None):
+        self.deltas = dict() if deltas is None else deltas
+        self.changed = None
+        for block in blocks:
+            self.apply(block)
+
+    def _add(self, public_key, amount):
+        self.deltas[public_key] = self.deltas.get(public_key, 0) + amount
+        if self.changed is not None:
+            self.changed.add(public_key)
+
+    def apply(self, block, direction=1):
+        """
+        Adds the transfers and miner reward of a block to the ledger
+
+        Args:
+            :param block: Block to apply
+            :param direction: 1 to apply the block, -1 to undo it
+        """
+        reward = 0
+        for transaction in block.transactions:
+            self._add(transaction.sender.public_key, -direction * (transaction.value + transaction.fee))
+            self._add(transaction.recipient.public_key, direction * transaction.value)
+            reward += transaction.fee
+        self._add(block.miner.public_key, direction * (reward + BASE_MINER_REWARD))
+
+    def revert(self, block):
+        """
+        Undoes a block previously applied with apply
+
+        Args:
+            :param block: Block to undo
+        """
+        self.apply(block, -1)
+
+
 @dataclass
 class Blockchain:
     """
@@ -330,65 +793,311 @@ class Blockchain:
 
     Attributes:
         chain: List of mined blocks
-        transactions: List of unmined transactions (private)
+        transactions: Mempool of unmined transactions (private)
     """
 
     chain: List[Block] = None
-    transactions: List[Transaction] = None
+    transactions: Mempool = None
+    ledger: InitVar[Ledger] = None
 
-    def __post_init__(self):
+    def __post_init__(self, ledger):
         if self.chain is 'None':
             self.chain = None
         if self.transactions is 'None':
             self.transactions = None
-        if self.transactions is None:
-            self.transactions = []
+        if not isinstance(self.transactions, Mempool):
+            self.transactions = Mempool(self.transactions or ())
         if self.chain is None:
             self.chain = []
+        self._ledger_cache = ledger
+        self._store = None
+        self._index = None
+        self._schedule = TargetSchedule(lambda height: block_time(self.chain, height))
+
+    @property
+    def _ledger(self):
+        #  Built on first use, so a received chain that is turned down never builds its blocks for it
+        if self._ledger_cache is None:
+            self._ledger_cache = Ledger(self.chain)
+        return self._ledger_cache
 
+    @timed('blockchain_compute_balances_seconds', 'Merging the initial balances with the ledger')
     def compute_balances(self):
-        users = dict()
-        for user in USERS:
-            if 'public_key' in user:
-                users[user['public_key']] = user['initial_balance']
-        for block in self.chain:
-            reward = 0
+        """
+        Merges the initial balances of the users with the running ledger
+
+        Returns:
+            :return: dictionary of public key to balance
+        """
+        balances = registry.initial_balances()
+        for public_key, delta in self._ledger.deltas.items():
+            balances[public_key] = balances.get(public_key, 0) + delta
+        return balances
+
+    def balance(self, public_key):
+        """
+        Looks up a single balance without materializing every balance
+
+        Args:
+            :param public_key: public key of the user
+        Returns:
+            :return: balance of the user at the tip of the chain
+        """
+        return registry.initial_balance(public_key) + self._ledger.deltas.get(public_key, 0)
+
+    def target(self, height):
+        """
+        Args:
+            :param height: height of a block of this chain, or of the next block
+        Returns:
+            :return: number the digest of the block at that height has to be below
+        """
+        return self._schedule.target(height)
+
+    def next_target(self):
+        """
+        :return: proof of work target of the next block
+        """
+        return self.target(len(self.chain))
+
+    def tip_hash(self):
+        """
+        :return: hash the next block's prev_hash has to point at
+        """
+        return '0' * DIFFICULTY if not self.chain else block_hash(self.chain, len(self.chain) - 1)
+
+    def earlier_seconds(self, height):
+        """
+        :param height: height of a block of this chain, or of the next block
+        :return: seconds of the timestamps of the MEDIAN_TIME_BLOCKS blocks before it
+        """
+        return [block_seconds(block_time(self.chain, earlier))
+                for earlier in range(max(0, height - MEDIAN_TIME_BLOCKS), height)]
+
+    def next_time(self):
+        """
+        :return: timestamp for the next block: now, unless the median time of the blocks before it is later
+        """
+        median = median_time(self.earlier_seconds(len(self.chain)))
+        return timestamp(max(time(), median or 0))
+
+    def valid_next_block(self, block, check_signatures=True):
+        """
+        Validates a block as the next block of this chain without revalidating the chain
+
+        Args:
+            :param block: Block to check
+            :param check_signatures: False if the block's signatures were already checked
+        Returns:
+            :return: if the block is valid, points at the tip,
+                     and leaves every sender with a positive balance
+        """
+        if block.prev_hash != self.tip_hash():
+            return False
+        if not time_valid(parse_block_time(block.time), self.earlier_seconds(len(self.chain)), time()):
+            return False
+        if not block.is_valid(check_signatures, target=self.next_target()):
+            return False
+        self._ledger.apply(block)
+        valid = all([self.balance(transaction.sender.public_key) >= 0
+                     for transaction in block.transactions])
+        self._ledger.revert(block)
+        return valid
+
+    def attach(self, store):
+        """
+        Makes a BlockStore follow every change to this chain
+
+        The chain is read back from the store from then on (see
+        store.StoredChain), so only the digests and the last read blocks are
+        held in memory.
+
+        Args:
+            :param store: BlockStore holding a prefix of this chain (usually all or none of it)
+        """
+        self._store = store
+        if getattr(self.chain, 'store', None) is store:
+            return
+        written = len(store) < len(self.chain)
+        for block in self.chain[len(store):]:
+            store.append(block)
+        self.chain = store.view()
+        if written:
+            store.checkpoint(self)
+
+    def build_index(self, index=None):
+        """
+        Indexes this chain and keeps the index up to date from now on
+
+        Args:
+            :param index: ChainIndex of a prefix of this chain, e.g. from a checkpoint,
+                          so only the blocks after it are indexed
+        Returns:
+            :return: the ChainIndex
+        """
+        if index is None:
+            index = ChainIndex()
+        for height in range(len(index), len(self.chain)):
+            index.add(self.chain[height], height)
+        self._index = index
+        return self._index
+
+    def add_block(self, block):
+        """
+        Appends a mined block to the chain and updates the ledger with it
+
+        Args:
+            :param block: Block whose prev_hash points at the current tip
+        """
+        #  Build the ledger before the block is in the chain, or it would be counted twice
+        ledger = self._ledger
+        #  A stored chain writes the block to disk as it is appended
+        self.chain.append(block)
+        ledger.apply(block)
+        if self._index is not None:
+            self._index.add(block, len(self.chain) - 1)
+        self.transactions.remove_confirmed([block])
+        if self._store is not None and len(self.chain) % CHECKPOINT_INTERVAL == 0:
+            self._store.checkpoint(self)
+
+    def replace_chain(self, chain):
+        """
+        Swaps in another chain, rolling the ledger back to the common ancestor
+        and replaying only the blocks after it
+
+        Args:
+            :param chain: list of blocks that replaces the current chain
+        """
+        ancestor = common_prefix_length(self.chain, chain)
+        self._schedule.truncate(ancestor)
+        dropped, added = self.chain[ancestor:], chain[ancestor:]
+        for block in reversed(dropped):
+            self._ledger.revert(block)
+            #  Transactions of dropped blocks are pending again, unless the new blocks have them
             for transaction in block.transactions:
-                if transaction.sender.public_key not in users:
-                    users[transaction.sender.public_key] = -(transaction.value + transaction.fee)
-                else:
-                    users[transaction.sender.public_key] -= (transaction.value + transaction.fee)
-                if transaction.recipient.public_key not in users:
-                    users[transaction.recipient.public_key] = transaction.value
-                else:
-                    users[transaction.recipient.public_key] += transaction.value
-                reward += transaction.fee
-            if block.miner.public_key not in users:
-                users[block.miner.public_key] = reward + BASE_MINER_REWARD
-            else:
-                users[block.miner.public_key] += reward + BASE_MINER_REWARD
-        return users
-
-    def is_valid(self):
-        """
-        :return: if all the blocks are valid,
+                self.transactions.add(transaction)
+        for block in added:
+            self._ledger.apply(block)
+        self.transactions.remove_confirmed(added)
+        #  Whoever the reorg paid less may no longer afford what they have pending
+        touched = set()
+        for block in list(dropped) + list(added):
+            touched.add(block.miner.public_key)
+            for transaction in block.transactions:
+                touched.update((transaction.sender.public_key, transaction.recipient.public_key))
+        self.transactions.evict_unaffordable(self.balance, touched)
+        if self._index is not None:
+            self._index.truncate(ancestor, self.chain)
+            for height, block in enumerate(added, ancestor):
+                self._index.add(block, height)
+        #  Keep our own blocks up to the fork, they are the ones that were validated
+        if self._store is not None:
+            chain = self.chain.fork(ancestor)
+            for block in added:
+                chain.append(block)
+            self.chain = chain
+            #  A checkpoint costs as much as the whole history, so a reorg only writes one if it cut
+            #  into the last checkpoint or carried the chain past the next one
+            checkpoint_height = self._store.checkpoint_height
+            if ancestor < checkpoint_height or \
+                    len(chain) // CHECKPOINT_INTERVAL > checkpoint_height // CHECKPOINT_INTERVAL:
+                self._store.checkpoint(self)
+        else:
+            self.chain = self.chain[:ancestor] + added
+
+    def fork_ledger(self, height):
+        """
+        Args:
+            :param height: number of blocks of this chain to keep
+        Returns:
+            :return: new Ledger of the first height blocks, got by undoing the blocks after them
+        """
+        ledger = Ledger(deltas=dict(self._ledger.deltas))
+        for block in reversed(self.chain[height:]):
+            ledger.revert(block)
+        return ledger
+
+    def signatures(self, start=0, stop=None):
+        """
+        Lists every signature in the chain for batch verification
+
+        Args:
+            :param start: height of the first block to list
+            :param stop: height of the block to stop before, or None for the tip
+        Returns:
+            :return: list of (label, public_key, message, signature)
+        """
+        items = []
+        for height, block in enumerate(self.chain[start:stop], start):
+            for position, transaction in enumerate(block.transactions):
+                items.append((f'transaction {position} of block {height}',
+                              transaction.sender.public_key,
+                              transaction.signing_bytes(),
+                              transaction.signature))
+            items.append((f'block {height}',
+                          block.miner.public_key,
+                          block.signing_bytes(),
+                          block.signature))
+        return items
+
+    @timed('blockchain_chain_signatures_seconds', 'Checking every signature of a chain or suffix')
+    def invalid_signature(self, start=0, stop=None):
+        """
+        :param start: height of the first block to check
+        :param stop: height of the block to stop before, or None for the tip
+        :return: label of a block or transaction with an invalid signature,
+                 or None if every signature is valid
+        """
+        return verifier.first_invalid(self.signatures(start, stop))
+
+    @timed('blockchain_chain_is_valid_seconds', 'Validating a chain or suffix')
+    def is_valid(self, check_signatures=True, start=0, ledger=None):
+        """
+        :param check_signatures: False if invalid_signature was already checked
+        :param start: height of the first block to check, the blocks before it are trusted
+        :param ledger: Ledger of the first start blocks, if start is not 0
+        :return: if all the blocks are valid and meet the target of their height,
+                all the timestamps follow difficulty.time_valid,
                 all the hash pointers are correct,
                 all the users have a positive balance,
                 all coinbase transactions are legitimate
         """
-        genesis = self.chain[0]
-        if not genesis.is_valid():
+        if check_signatures and self.invalid_signature(start) is not None:
             return False
-        prev_block = genesis
-        for block in self.chain[1:]:
-            if not block.is_valid():
+        if start >= len(self.chain):
+            return False
+        prev_hash = block_hash(self.chain, start - 1) if start > 0 else None
+        earlier = deque(self.earlier_seconds(start), maxlen=MEDIAN_TIME_BLOCKS)
+        now = time()
+        for height, block in enumerate(self.chain[start:], start):
+            seconds = parse_block_time(block.time)
+            if not time_valid(seconds, earlier, now):
+                return False
+            earlier.append(seconds)
+            if not block.is_valid(check_signatures=False, target=self.target(height)):
                 return False
-            temp, prev_block.signature = prev_block.signature, None
-            if hasher(prev_block).hexdigest() != block.prev_hash:
+            if prev_hash is not None and prev_hash != block.prev_hash:
                 return False
-            prev_block.signature = temp
-            prev_block = block
-        return all([balance >= 0 for user, balance in self.compute_balances().items()])
+            prev_hash = block.hash()
+        if start == 0:
+            return all([balance >= 0 for user, balance in self.compute_balances().items()])
+        ledger = Ledger(self.chain[start:], dict(ledger.deltas))
+        return all([registry.initial_balance(public_key) + delta >= 0
+                    for public_key, delta in ledger.deltas.items()])
+
+
+def lazy_blockchain_from_dict(blockchain_dict):
+    """
+    Wraps a received chain without building its blocks, see ChainView
+
+    The pending transactions of the peer are left out.
+
+    Args:
+        :param blockchain_dict: dictionary with the chain as a list of block dictionaries
+    Returns:
+        :return: Blockchain over a ChainView
+    """
+    return Blockchain(ChainView(blockchain_dict['chain']))
 
 
 def blockchain_from_dict(blockchain_dict):
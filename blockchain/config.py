@@ -1,8 +1,11 @@
+from os import environ
+
 from Cryptodome.Random import get_random_bytes as rand
 
-PROTOCOL = 'http'
-HOST = '67.205.129.210'
-PORT = '80'
+#  Each can be set per process, e.g. BLOCKCHAIN_PORT=5001 python run.py
+PROTOCOL = environ.get('BLOCKCHAIN_PROTOCOL', 'http')
+HOST = environ.get('BLOCKCHAIN_HOST', '67.205.129.210')
+PORT = environ.get('BLOCKCHAIN_PORT', '80')
 DEBUG = False
 SECRET_KEY = rand(64)
 MY_URL = f'{PROTOCOL}://{HOST}:{PORT}'
@@ -0,0 +1,129 @@
+from calendar import timegm
+from datetime import datetime
+
+from blockchain.chain_settings import *
+
+#  A hex digest starting with DIFFICULTY zeros is exactly a digest below this number
+INITIAL_TARGET = 1 << (512 - 4 * DIFFICULTY)
+#  Retargeting never makes blocks easier than the configured DIFFICULTY
+MAX_TARGET = INITIAL_TARGET
+
+
+def meets_target(digest, target):
+    """
+    Args:
+        :param digest: raw SHA3_512 digest of a block
+        :param target: proof of work target of the block's height
+    Returns:
+        :return: if the digest, read as a big endian number, is below the target
+    """
+    return int.from_bytes(digest, 'big') < target
+
+
+def parse_block_time(block_time):
+    """
+    :return: seconds since the epoch of a block's timestamp, or None if it cannot be read
+    """
+    try:
+        return timegm(datetime.strptime(block_time, '%Y-%m-%d %H:%M:%S').timetuple())
+    except (TypeError, ValueError):
+        return None
+
+
+def block_seconds(block_time):
+    """
+    :return: seconds since the epoch of a block's timestamp, or 0 if it cannot be read
+    """
+    seconds = parse_block_time(block_time)
+    return 0 if seconds is None else seconds
+
+
+def median_time(earlier):
+    """
+    :param earlier: seconds of up to MEDIAN_TIME_BLOCKS blocks before a block
+    :return: their median, the earliest time the block may have, or None if there are none
+    """
+    if not earlier:
+        return None
+    return sorted(earlier)[len(earlier) // 2]
+
+
+def time_valid(seconds, earlier, now):
+    """
+    Stops a miner from choosing timestamps that make its window look slow, see retarget
+
+    Timestamps only have a resolution of a second and blocks can be mined
+    within the same second, so a block may have the median time itself.
+
+    Args:
+        :param seconds: seconds of a block's timestamp, None if it cannot be read
+        :param earlier: seconds of up to MEDIAN_TIME_BLOCKS blocks before it
+        :param now: seconds of our clock
+    Returns:
+        :return: if the timestamp could be read, is not before the median of the earlier
+                 blocks, and is at most MAX_FUTURE_BLOCK_TIME ahead of now
+    """
+    if seconds is None or seconds > now + MAX_FUTURE_BLOCK_TIME:
+        return False
+    median = median_time(earlier)
+    return median is None or seconds >= median
+
+
+def retarget(target, elapsed):
+    """
+    Scales a target by how long the last window of blocks took against how long it should have
+
+    Args:
+        :param target: target of the window that just ended
+        :param elapsed: seconds from its first block to its last
+    Returns:
+        :return: target of the next window
+    """
+    expected = TARGET_BLOCK_TIME * (RETARGET_INTERVAL - 1)
+    elapsed = min(max(elapsed, expected // MAX_RETARGET_FACTOR, 1), expected * MAX_RETARGET_FACTOR)
+    return max(1, min(target * elapsed // expected, MAX_TARGET))
+
+
+class TargetSchedule:
+    """
+    Proof of work target of every height of one chain
+
+    Heights are grouped into windows of RETARGET_INTERVAL blocks that share a
+    target. A window's target only depends on the timestamps of the blocks
+    before it, so every node works out the same targets for the same chain.
+    Targets are worked out once per window and kept until the chain is cut
+    back past them.
+
+    Attributes:
+        block_time: function from a height to the timestamp of the chain's block at that height
+    """
+
+    def __init__(self, block_time):
+        self.block_time = block_time
+        self._targets = [INITIAL_TARGET]
+
+    def target(self, height):
+        """
+        Args:
+            :param height: height of a block, up to one past the tip of the chain
+        Returns:
+            :return: number the block's digest has to be below
+        """
+        if RETARGET_INTERVAL < 2:
+            return INITIAL_TARGET
+        window = height // RETARGET_INTERVAL
+        while len(self._targets) <= window:
+            last = len(self._targets) * RETARGET_INTERVAL - 1
+            first = last - RETARGET_INTERVAL + 1
+            elapsed = block_seconds(self.block_time(last)) - block_seconds(self.block_time(first))
+            self._targets.append(retarget(self._targets[-1], elapsed))
+        return self._targets[window]
+
+    def truncate(self, height):
+        """
+        Forgets the targets that depend on the blocks from height onwards
+
+        Args:
+            :param height: number of blocks of the chain that are kept
+        """
+        del self._targets[max(1, height // max(RETARGET_INTERVAL, 1) + 1):]
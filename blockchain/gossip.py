@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+import json
+
+from blockchain.chain_settings import *
+from blockchain import wire
+from blockchain.metrics import counter, histogram
+
+
+def new_session(pool_size=GOSSIP_WORKERS):
+    """
+    :return: requests Session that keeps up to pool_size connections per peer alive
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+SESSION = new_session()
+EXECUTOR = ThreadPoolExecutor(max_workers=GOSSIP_WORKERS, thread_name_prefix='gossip')
+
+POST_SECONDS = histogram('blockchain_gossip_post_seconds', 'Posting a message to one peer, until its answer')
+POSTS = counter('blockchain_gossip_posts_total', 'Messages posted to peers, by how the peer answered')
+
+#  Peers whose answers said they take posts in the binary format
+BINARY_PEERS = set()
+
+
+def binary_message(nodes, json_data):
+    """
+    :return: json_data in the binary format if any of the nodes takes it, otherwise None
+    """
+    if not any([node in BINARY_PEERS for node in nodes]):
+        return None
+    return wire.encode(json.loads(json_data) if isinstance(json_data, str) else json_data)
+
+
+def post(node, api_url, json_data, timeout=GOSSIP_TIMEOUT, session=SESSION, binary_data=None):
+    """
+    Posts a message to one peer
+
+    The binary form is only sent to peers known to take it. Anyone else, or a
+    peer that could not resolve the binary form, gets the json form.
+
+    Args:
+        :param json_data: json string of the message
+        :param binary_data: the message in the binary format, or None
+    Returns:
+        :return: (status code, message) of the answer, or None if the peer could not be reached
+    """
+    url = f'{node}/api/{api_url}'
+    outcome = 'unreachable'
+    try:
+        with POST_SECONDS.time(endpoint=api_url):
+            r = None
+            if binary_data is not None and node in BINARY_PEERS:
+                r = session.post(url, data=binary_data, headers={'Content-Type': wire.BINARY}, timeout=timeout)
+            if r is None or r.status_code == 415:
+                r = session.post(url, json=json_data, timeout=timeout)
+        if wire.BINARY in r.headers.get('Accept-Post', ''):
+            BINARY_PEERS.add(node)
+        outcome = 'accepted' if r.status_code == 200 else 'rejected'
+        return r.status_code, r.json()['message']
+    except (RequestException, ValueError, KeyError, TypeError):
+        return None
+    finally:
+        POSTS.inc(endpoint=api_url, outcome=outcome)
+
+
+def broadcast(nodes, api_url, json_data, on_answer=None,
+              timeout=GOSSIP_TIMEOUT, session=SESSION, executor=EXECUTOR):
+    """
+    Posts a message to every peer at once and tallies their answers
+
+    Only as many answers as it takes to settle the vote are waited for:
+    once more than half of the peers accept, or at least half reject, the
+    outcome can no longer change. Posts that are still in flight carry on
+    in the background and are still reported to on_answer.
+
+    Args:
+        :param nodes: urls of the peers
+        :param api_url: endpoint under /api/ to post to
+        :param json_data: body of the post
+        :param on_answer: called with (node, status code, message) for every answer
+        :param timeout: seconds to wait on each peer
+        :param session: requests Session to post with
+        :param executor: executor the posts run on
+    Returns:
+        :return: (number accepted, number rejected, message of the last rejection or None)
+    """
+    binary_data = binary_message(nodes, json_data)
+
+    def post_and_report(node):
+        answer = post(node, api_url, json_data, timeout, session, binary_data)
+        if answer is not None and on_answer is not None:
+            on_answer(node, *answer)
+        return answer
+
+    yes, no, reason = 0, 0, None
+    futures = [executor.submit(post_and_report, node) for node in nodes]
+    for future in as_completed(futures):
+        answer = future.result()
+        if answer is None:
+            continue
+        status, message = answer
+        if status == 200:
+            yes += 1
+        else:
+            no += 1
+            reason = message
+        if 2 * yes > len(nodes) or 2 * no >= len(nodes):
+            break
+    return yes, no, reason
@@ -0,0 +1,83 @@
+class ChainIndex:
+    """
+    Lookup tables from hashes and public keys to where things are in a chain
+
+    The index is kept up to date by the Blockchain it belongs to, block by
+    block, and cut back to the fork point when the chain is replaced. Entries
+    are only ever added for a height after the ones already there, so a reader
+    holding an older snapshot just ignores entries at or past its height.
+
+    Attributes:
+        blocks: block hash -> height
+        transactions: transaction hash -> (height, position in block) of its first occurrence
+        addresses: public key -> list of (height, position) of the transactions it sent or received,
+                   in chain order
+    """
+
+    def __init__(self, blocks=()):
+        self.blocks = dict()
+        self.transactions = dict()
+        self.addresses = dict()
+        self._height = 0
+        for height, block in enumerate(blocks):
+            self.add(block, height)
+
+    def __len__(self):
+        return self._height
+
+    def add(self, block, height):
+        """
+        Args:
+            :param block: Block at height
+            :param height: number of blocks already indexed
+        """
+        for position, transaction in enumerate(block.transactions):
+            reference = (height, position)
+            #  A transaction sent again keeps pointing at where it was first confirmed
+            self.transactions.setdefault(transaction.hash(), reference)
+            self.addresses.setdefault(transaction.sender.public_key, []).append(reference)
+            if transaction.recipient.public_key != transaction.sender.public_key:
+                self.addresses.setdefault(transaction.recipient.public_key, []).append(reference)
+        self.blocks[block.hash()] = height
+        self._height = height + 1
+
+    def truncate(self, height, chain):
+        """
+        Forgets every block from height onwards
+
+        Args:
+            :param height: number of blocks to keep
+            :param chain: list of blocks the index was built from
+        """
+        for block in reversed(chain[height:self._height]):
+            self._height -= 1
+            if self.blocks.get(block.hash()) == self._height:
+                del self.blocks[block.hash()]
+            for position, transaction in enumerate(block.transactions):
+                if self.transactions.get(transaction.hash()) == (self._height, position):
+                    del self.transactions[transaction.hash()]
+                for public_key in {transaction.sender.public_key, transaction.recipient.public_key}:
+                    references = self.addresses[public_key]
+                    references.pop()
+                    if not references:
+                        del self.addresses[public_key]
+
+
+def index_from_dict(index_dict, digests):
+    """
+    Rebuilds a ChainIndex without looking at the blocks, e.g. from a checkpoint
+
+    Args:
+        :param index_dict: dictionary with the transactions and addresses tables of a ChainIndex
+        :param digests: digests of the blocks that were indexed, in order
+    Returns:
+        :return: ChainIndex of those blocks
+    """
+    index = ChainIndex()
+    index.blocks = {digest.hex(): height for height, digest in enumerate(digests)}
+    index.transactions = {transaction_hash: tuple(reference)
+                          for transaction_hash, reference in index_dict['transactions'].items()}
+    index.addresses = {public_key: [tuple(reference) for reference in references]
+                       for public_key, references in index_dict['addresses'].items()}
+    index._height = len(digests)
+    return index
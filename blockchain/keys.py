@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from threading import Lock
+
+from Cryptodome.PublicKey import RSA
+from Cryptodome.Signature import pkcs1_15
+
+from blockchain.chain_settings import *
+
+
+class KeyCache:
+    """
+    Bounded LRU cache of parsed RSA keys, so each PEM is only decoded once
+
+    Attributes:
+        size (int): Most keys kept before the least recently used is evicted
+        hits (int): Lookups answered from the cache
+        misses (int): Lookups that had to parse the PEM
+    """
+
+    def __init__(self, size=KEY_CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._schemes = OrderedDict()
+        self._lock = Lock()
+
+    def scheme(self, pem):
+        """
+        Fetches the pkcs1_15 signature scheme for a key
+
+        Args:
+            :param pem: PEM encoded public or private key
+        Returns:
+            :return: pkcs1_15 scheme that verifies with (and, for private keys, signs with) the key
+        """
+        with self._lock:
+            scheme = self._schemes.get(pem)
+            if scheme is not None:
+                self._schemes.move_to_end(pem)
+                self.hits += 1
+                return scheme
+            self.misses += 1
+        scheme = pkcs1_15.new(RSA.import_key(pem))
+        with self._lock:
+            self._schemes[pem] = scheme
+            if len(self._schemes) > self.size:
+                self._schemes.popitem(last=False)
+        return scheme
+
+    def invalidate(self, pem):
+        """
+        Drops a key so the next lookup parses it again
+
+        Args:
+            :param pem: PEM encoded key
+        """
+        with self._lock:
+            self._schemes.pop(pem, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'keys': len(self._schemes)}
+
+
+KEYS = KeyCache()
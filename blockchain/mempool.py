@@ -0,0 +1,193 @@
+from itertools import count
+import heapq
+
+from blockchain.chain_settings import *
+
+
+def cost(transaction):
+    """
+    :return: how much a transaction takes out of its sender's balance
+    """
+    if transaction.recipient.public_key == transaction.sender.public_key:
+        return transaction.fee
+    return transaction.value + transaction.fee
+
+
+def fee_rate(transaction):
+    """
+    :return: fee paid per byte of the transaction
+    """
+    return transaction.fee / len(transaction.signing_bytes())
+
+
+class Mempool:
+    """
+    Pending transactions, ordered by fee rate
+
+    Transactions are kept in a heap keyed on fee rate, so the best paying ones
+    can be taken for a block without sorting the whole pool. Removed transactions
+    are only dropped from the heap when they reach its top. The total of the fees
+    and how much each sender has pending are kept up to date as transactions
+    come and go.
+
+    Iterating gives the transactions in the order they were added.
+
+    Attributes:
+        total_fees: sum of the fees of every pending transaction
+        changed: hashes of the transactions added or removed since it was last cleared,
+                 or None when not tracked
+    """
+
+    def __init__(self, transactions=()):
+        self.total_fees = 0
+        self.changed = None
+        self._pending = dict()
+        self._heap = []
+        self._spend = dict()
+        self._order = count()
+        for transaction in transactions:
+            self.add(transaction)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __iter__(self):
+        return iter(list(self._pending.values()))
+
+    def __contains__(self, transaction):
+        return transaction.hash() in self._pending
+
+    def pending(self):
+        """
+        :return: the dictionary of pending transactions by hash, in the order they were added (do not change it)
+        """
+        return self._pending
+
+    def get(self, transaction_hash):
+        """
+        :return: pending Transaction with that hash, or None
+        """
+        return self._pending.get(transaction_hash)
+
+    def spend(self, public_key):
+        """
+        Args:
+            :param public_key: public key of a sender
+        Returns:
+            :return: how much the sender's pending transactions take out of their balance
+        """
+        return self._spend.get(public_key, 0)
+
+    def add(self, transaction):
+        """
+        Args:
+            :param transaction: valid Transaction
+        Returns:
+            :return: False if the transaction is already pending
+        """
+        key = transaction.hash()
+        if key in self._pending:
+            return False
+        self._pending[key] = transaction
+        if self.changed is not None:
+            self.changed.add(key)
+        heapq.heappush(self._heap, (-fee_rate(transaction), next(self._order), key))
+        sender = transaction.sender.public_key
+        self._spend[sender] = self._spend.get(sender, 0) + cost(transaction)
+        self.total_fees += transaction.fee
+        return True
+
+    def remove(self, transaction):
+        """
+        Drops a transaction if it is pending, e.g. because it made it into a block
+
+        Args:
+            :param transaction: Transaction to drop
+        """
+        transaction = self._pending.pop(transaction.hash(), None)
+        if transaction is None:
+            return
+        if self.changed is not None:
+            self.changed.add(transaction.hash())
+        sender = transaction.sender.public_key
+        self._spend[sender] -= cost(transaction)
+        if self._spend[sender] == 0:
+            del self._spend[sender]
+        self.total_fees -= transaction.fee
+        if len(self._heap) > 2 * len(self._pending) + 64:
+            self._compact()
+
+    def remove_confirmed(self, blocks):
+        """
+        Args:
+            :param blocks: Blocks whose transactions are no longer pending
+        """
+        for block in blocks:
+            for transaction in block.transactions:
+                self.remove(transaction)
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if entry[2] in self._pending]
+        heapq.heapify(self._heap)
+
+    def evict_unaffordable(self, balance, senders=None):
+        """
+        Drops the pending transactions their senders can no longer pay for, e.g. after
+        a reorg took away the blocks that paid them. Each sender keeps their best paying
+        transactions that still fit in their balance.
+
+        Args:
+            :param balance: function from a public key to that user's confirmed balance
+            :param senders: public keys of the senders to check, or None for every sender
+        Returns:
+            :return: list of the Transactions that were dropped
+        """
+        senders = self._spend.keys() if senders is None else [sender for sender in senders if sender in self._spend]
+        over = {sender for sender in senders if self._spend[sender] > balance(sender)}
+        if not over:
+            return []
+        spent, evicted = dict(), []
+        #  sorted is stable, so equal fee rates keep the order they were added in, as in the heap
+        for transaction in sorted([transaction for transaction in self._pending.values()
+                                   if transaction.sender.public_key in over], key=fee_rate, reverse=True):
+            sender = transaction.sender.public_key
+            if balance(sender) - spent.get(sender, 0) < cost(transaction):
+                evicted.append(transaction)
+            else:
+                spent[sender] = spent.get(sender, 0) + cost(transaction)
+        for transaction in evicted:
+            self.remove(transaction)
+        return evicted
+
+    def assemble(self, balance, limit=MAX_BLOCK_TRANSACTIONS):
+        """
+        Picks the transactions for the next block, best fee rate first
+
+        A transaction whose sender could not afford it on top of the ones
+        already picked is dropped from the pool, since nothing it paid for
+        more than the picked ones will ever confirm. The picked transactions
+        stay pending until their block is added to the chain.
+
+        Args:
+            :param balance: function from a public key to that user's confirmed balance
+            :param limit: largest number of transactions to pick
+        Returns:
+            :return: list of Transactions
+        """
+        picked, spent = [], dict()
+        while self._heap and len(picked) < limit:
+            entry = heapq.heappop(self._heap)
+            transaction = self._pending.get(entry[2])
+            if transaction is None:
+                continue
+            sender = transaction.sender.public_key
+            if sender not in spent:
+                spent[sender] = 0
+            if balance(sender) - spent[sender] < cost(transaction):
+                self.remove(transaction)
+                continue
+            spent[sender] += cost(transaction)
+            picked.append(entry)
+        for entry in picked:
+            heapq.heappush(self._heap, entry)
+        return [self._pending[entry[2]] for entry in picked]
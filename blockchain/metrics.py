@@ -0,0 +1,167 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from time import perf_counter, time
+
+from blockchain.chain_settings import *
+
+STARTED = time()
+
+
+class Metric:
+    """
+    Named measurement kept per combination of label values
+
+    Attributes:
+        name: metric name in the text format
+        help: one line description
+    """
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = dict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join([f'{name}="{value}"' for name, value in pairs]) + '}'
+
+    def render(self):
+        """
+        :return: lines of the metric in the Prometheus text exposition format
+        """
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = [(key, self._copy(value)) for key, value in self._values.items()]
+        for key, value in sorted(values):
+            lines += self._samples(key, value)
+        return lines
+
+    def _copy(self, value):
+        return value
+
+    def _samples(self, key, value):
+        return [f'{self.name}{self._labels(key)} {value}']
+
+
+class Counter(Metric):
+    """
+    Count that only goes up, its rate is taken by whoever scrapes it
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    """
+    Distribution of durations in seconds, counted into cumulative buckets
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=METRIC_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """
+        Args:
+            :param value: seconds it took
+            :param labels: label values, e.g. the peer endpoint
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                #  One count per bucket, one for above the last bucket, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Context manager that observes how long its body took, even if it raised
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def _copy(self, value):
+        return list(value)
+
+    def _samples(self, key, counts):
+        lines, total = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            total += count
+            lines.append(f'{self.name}_bucket{self._labels(key, [("le", bound)])} {total}')
+        lines.append(f'{self.name}_sum{self._labels(key)} {counts[-1]}')
+        lines.append(f'{self.name}_count{self._labels(key)} {total}')
+        return lines
+
+
+METRICS = dict()
+
+
+def _register(metric):
+    return METRICS.setdefault(metric.name, metric)
+
+
+def counter(name, help):
+    """
+    :return: the Counter with that name, created on first use
+    """
+    return _register(Counter(name, help))
+
+
+def histogram(name, help):
+    """
+    :return: the Histogram with that name, created on first use
+    """
+    return _register(Histogram(name, help))
+
+
+def timed(name, help):
+    """
+    Decorator that observes how long each call of the function takes
+
+    Args:
+        :param name: name of the histogram
+        :param help: description of the histogram
+    """
+    metric = histogram(name, help)
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with metric.time():
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    """
+    :return: every metric in the Prometheus text exposition format
+    """
+    lines = ['# HELP blockchain_uptime_seconds Seconds since the node started',
+             '# TYPE blockchain_uptime_seconds gauge',
+             f'blockchain_uptime_seconds {time() - STARTED}']
+    for name in sorted(METRICS):
+        lines += METRICS[name].render()
+    return '\n'.join(lines) + '\n'
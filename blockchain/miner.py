@@ -0,0 +1,233 @@
+from itertools import count
+import multiprocessing
+from queue import Empty
+from threading import Lock
+from time import time
+
+from Cryptodome.Hash import SHA3_512
+
+from blockchain.chain_settings import *
+from blockchain.difficulty import INITIAL_TARGET
+
+NONCE_STR = '"nonce": '
+#  Targets at least this hard are worth spreading over several processes
+PARALLEL_MINING_TARGET = 1 << (512 - 4 * PARALLEL_MINING_DIFFICULTY)
+
+
+def split_template(json_str):
+    """
+    Splits the json of an unmined block around the digits of its nonce
+
+    Args:
+        :param json_str: to_json of the block with its signature unset
+    Returns:
+        :return: (text before the nonce digits, text after them)
+    """
+    nonce_index = json_str.find(NONCE_STR) + len(NONCE_STR)
+    end = nonce_index
+    while json_str[end].isdigit():
+        end += 1
+    return json_str[:nonce_index], json_str[end:]
+
+
+class HashTemplate:
+    """
+    Serialized block with a preallocated buffer for its nonce digits
+
+    The block is serialized once into the bytes before and after its nonce.
+    Moving to the next nonce rewrites the digits in place, so no json or
+    byte string is rebuilt per attempt, and the hashed bytes are exactly
+    what hasher(block) hashes for that nonce.
+
+    Attributes:
+        prefix (bytes): serialized block up to the nonce digits
+        suffix (bytes): serialized block after the nonce digits
+        nonce (int): nonce currently written into the buffer
+    """
+
+    def __init__(self, json_str):
+        prefix, suffix = split_template(json_str)
+        self.prefix = prefix.encode()
+        self.suffix = suffix.encode()
+        self.seek(0)
+
+    def seek(self, nonce):
+        """
+        Writes an arbitrary nonce into a freshly allocated buffer
+
+        Args:
+            :param nonce: nonce to write
+        """
+        digits = b'%d' % nonce
+        self.buffer = bytearray(self.prefix + digits + self.suffix)
+        self.start = len(self.prefix)
+        self.end = self.start + len(digits)
+        self.nonce = nonce
+
+    def increment(self):
+        """
+        Adds one to the nonce by carrying through the digits in the buffer
+        """
+        buffer = self.buffer
+        i = self.end - 1
+        while i >= self.start:
+            if buffer[i] != 57:  # ord('9')
+                buffer[i] += 1
+                self.nonce += 1
+                return
+            buffer[i] = 48  # ord('0')
+            i -= 1
+        #  Every digit was a 9, so the nonce needs one more digit
+        self.seek(self.nonce + 1)
+
+    def digest(self):
+        return SHA3_512.new(self.buffer).digest()
+
+
+def search(template, target, start, stop):
+    """
+    Tests the nonces in [start, stop) in order
+
+    Returns:
+        :return: first nonce whose digest, read as a number, is below the target, or None
+    """
+    template.seek(start)
+    for _ in range(start, stop):
+        if int.from_bytes(template.digest(), 'big') < target:
+            return template.nonce
+        template.increment()
+    return None
+
+
+def _worker(worker_id, jobs, current, results, hashes):
+    #  For each job, worker i tests chunks i, i + workers, i + 2 * workers, ... until the job is no longer current
+    while True:
+        job_id, template, target, workers, chunk = jobs.get()
+        start = worker_id * chunk
+        while current.value == job_id:
+            nonce = search(template, target, start, start + chunk)
+            if nonce is not None:
+                results.put((job_id, nonce))
+                break
+            with hashes.get_lock():
+                hashes.value += chunk
+            start += workers * chunk
+
+
+_jobs = None
+_current = None
+_results = None
+_hashes = None
+_job_ids = count(1)
+_job_lock = Lock()
+
+
+def start_miners(workers=MINING_WORKERS):
+    """
+    Forks the processes mine spreads its search over
+
+    Like verifier.start_pool, call it before the process starts any other
+    thread (and before start_pool, whose Pool starts threads of its own). A
+    forked child gets every lock in the state it had at fork time, and a lock
+    some other thread held then is never released in the child. The
+    processes live as long as the node and wait for jobs, so mining never
+    forks again.
+
+    Args:
+        :param workers: number of processes, none are started for fewer than 2
+    Returns:
+        :return: number of mining processes
+    """
+    global _jobs, _current, _results, _hashes
+    if _jobs is None and workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        _current = context.Value('q', 0)
+        _results = context.Queue()
+        _hashes = context.Value('Q', 0)
+        _jobs = [context.Queue() for _ in range(workers)]
+        for worker_id, jobs in enumerate(_jobs):
+            context.Process(target=_worker, args=(worker_id, jobs, _current, _results, _hashes), daemon=True).start()
+    return 0 if _jobs is None else len(_jobs)
+
+
+def _run(template, target, workers, chunk, timeout=None, cancel=None):
+    workers = min(workers, len(_jobs))
+    with _job_lock:
+        job_id = next(_job_ids)
+        with _hashes.get_lock():
+            _hashes.value = 0
+        _current.value = job_id
+        for jobs in _jobs[:workers]:
+            jobs.put((job_id, template, target, workers, chunk))
+        deadline = None if timeout is None else time() + timeout
+        nonce = None
+        while nonce is None:
+            if cancel is not None and cancel.is_set():
+                break
+            wait = CANCEL_POLL if deadline is None else min(CANCEL_POLL, deadline - time())
+            if wait <= 0:
+                break
+            try:
+                found_id, found = _results.get(timeout=wait)
+            except Empty:
+                continue
+            #  A worker of an earlier job may have found a nonce just before it was stopped
+            if found_id == job_id:
+                nonce = found
+        _current.value = 0
+        return nonce, _hashes.value
+
+
+def mine(json_str, target=INITIAL_TARGET, workers=MINING_WORKERS, chunk=MINING_CHUNK, cancel=None):
+    """
+    Finds a nonce that gives the block enough proof of work
+
+    The nonce space is split into chunks that are handed out round robin to
+    the processes of start_miners, and every process stops as soon as one of
+    them finds a valid nonce. Without them the search runs in this process. The hashed text is exactly what Block.difficulty_valid
+    hashes, so the result does not depend on the number of workers used.
+
+    Args:
+        :param json_str: to_json of the block with nonce 0 and no signature
+        :param target: number the digest of the block has to be below
+        :param workers: number of processes to search with, at most as many as start_miners started
+        :param chunk: number of nonces a process tests between checking in
+        :param cancel: threading.Event that stops the search when set
+    Returns:
+        :return: a valid nonce, or None if the search was cancelled
+    """
+    template = HashTemplate(json_str)
+    if workers <= 1 or target > PARALLEL_MINING_TARGET or _jobs is None:
+        start = 0
+        while cancel is None or not cancel.is_set():
+            nonce = search(template, target, start, start + chunk)
+            if nonce is not None:
+                return nonce
+            start += chunk
+        return None
+    return _run(template, target, workers, chunk, cancel=cancel)[0]
+
+
+def hash_rate(json_str, workers, seconds):
+    """
+    Measures how many hashes per second the pool gets through
+
+    Args:
+        :param json_str: to_json of a block to hash
+        :param workers: number of processes to search with
+        :param seconds: how long to search for
+    Returns:
+        :return: hashes per second
+    """
+    template = HashTemplate(json_str)
+    start = time()
+    if _jobs is None:
+        #  No mining processes were started, so only this process is measured
+        hashes = 0
+        while time() - start < seconds:
+            search(template, 0, hashes, hashes + 1000)
+            hashes += 1000
+        return hashes / (time() - start)
+    #  No digest is below 0, so the search runs until the timeout
+    hashes = _run(template, 0, workers, 1000, timeout=seconds)[1]
+    return hashes / (time() - start)
@@ -0,0 +1,201 @@
+from json.encoder import encode_basestring_ascii
+import json
+
+from blockchain.metrics import histogram
+
+
+#  stack overflow
+def reflective_to_dict(obj, class_key=None):
+    if isinstance(obj, bytes):
+        return obj.hex()
+    if isinstance(obj, dict):
+        data = {}
+        for (k, v) in obj.items():
+            data[k] = reflective_to_dict(v, class_key)
+        return data
+    elif hasattr(obj, "_ast"):
+        return reflective_to_dict(obj._ast())
+    elif hasattr(obj, "__iter__") and not isinstance(obj, str):
+        return [reflective_to_dict(v, class_key) for v in obj]
+    elif hasattr(obj, "__dict__"):
+        data = dict([(key, reflective_to_dict(value, class_key))
+                     for key, value in obj.__dict__.items()
+                     if not callable(value) and not key.startswith('_')])
+        if class_key is not None and hasattr(obj, "__class__"):
+            data[class_key] = obj.__class__.__name__
+        return data
+    else:
+        return obj
+
+
+def _is_list(value):
+    return hasattr(value, "__iter__") and not isinstance(value, (str, dict))
+
+
+def _scalar(value):
+    if type(value) is str:
+        return encode_basestring_ascii(value)
+    if value is None:
+        return 'null'
+    if type(value) is int:
+        return int.__repr__(value)
+    return json.dumps(reflective_to_dict(value), sort_keys=True)
+
+
+#  Field name -> type name of the field's value ('[Name]' for a list of Name, None for a scalar,
+#  'hex' for bytes that are written as a hex string)
+#  Fields must be listed in sorted order, as json.dumps(sort_keys=True) would emit them
+SCHEMAS = {
+    'User': (('alias', None),
+             ('hashed_id', None),
+             ('private_key', None),
+             ('public_key', None)),
+    'Transaction': (('fee', None),
+                    ('recipient', 'User'),
+                    ('sender', 'User'),
+                    ('signature', 'hex'),
+                    ('time', None),
+                    ('value', None)),
+    'Block': (('miner', 'User'),
+              ('nonce', None),
+              ('prev_hash', None),
+              ('signature', 'hex'),
+              ('time', None),
+              ('transactions', '[Transaction]')),
+    'Blockchain': (('chain', '[Block]'),
+                   ('transactions', '[Transaction]')),
+}
+
+#  Classes whose json is kept in a '_json' attribute, because they are either
+#  frozen (User) or drop '_json' whenever a field is assigned (Sealed).
+#  Sealed objects that were compacted ('_settled') are encoded but not cached again
+CACHED = {'User', 'Transaction', 'Block'}
+
+
+def _field_encoder(type_name):
+    if type_name is None:
+        return _scalar
+    if type_name == 'hex':
+        return lambda value: '"' + value.hex() + '"' if type(value) is bytes else _scalar(value)
+    if type_name.startswith('['):
+        encode = _field_encoder(type_name[1:-1])
+        return lambda values: '[' + ', '.join([encode(value) for value in values]) + ']' \
+            if _is_list(values) else _scalar(values)
+    return lambda value: ENCODERS[type(value).__name__](value) \
+        if type(value).__name__ == type_name else _scalar(value)
+
+
+def _null(value):
+    return 'null'
+
+
+def _record_encoder(fields, cached, unsigned=False):
+    keys = [encode_basestring_ascii(name) + ': ' for name, _ in fields]
+    names = [name for name, _ in fields]
+    #  An unsigned encoder writes the signature as null, the way the object was signed
+    encoders = [_null if unsigned and name == 'signature' else _field_encoder(type_name)
+                for name, type_name in fields]
+    parts = list(zip(keys, names, encoders))
+
+    def encode(obj):
+        return '{' + ', '.join([key + encode_field(getattr(obj, name))
+                                for key, name, encode_field in parts]) + '}'
+
+    def encode_cached(obj):
+        cache = obj.__dict__
+        json_str = cache.get('_json')
+        if json_str is None:
+            json_str = encode(obj)
+            if '_settled' not in cache:
+                cache['_json'] = json_str
+        return json_str
+
+    return encode_cached if cached else encode
+
+
+def _field_dicter(type_name):
+    if type_name is None or type_name == 'hex':
+        return reflective_to_dict
+    if type_name.startswith('['):
+        dicter = _field_dicter(type_name[1:-1])
+        return lambda values: [dicter(value) for value in values] \
+            if _is_list(values) else reflective_to_dict(values)
+    return lambda value: DICTERS[type(value).__name__](value) \
+        if type(value).__name__ == type_name else reflective_to_dict(value)
+
+
+def _record_dicter(fields):
+    parts = [(name, _field_dicter(type_name)) for name, type_name in fields]
+    return lambda obj: {name: dicter(getattr(obj, name)) for name, dicter in parts}
+
+
+ENCODERS = {name: _record_encoder(fields, name in CACHED) for name, fields in SCHEMAS.items()}
+UNSIGNED_ENCODERS = {name: _record_encoder(fields, False, unsigned=True) for name, fields in SCHEMAS.items()
+                     if 'signature' in dict(fields)}
+DICTERS = {name: _record_dicter(fields) for name, fields in SCHEMAS.items()}
+
+
+def to_dict(obj, class_key=None):
+    """
+    Converts obj to plain dictionaries and lists
+
+    Classes in SCHEMAS are converted field by field, anything else is walked reflectively
+
+    Args:
+        :param obj: object to convert
+        :param class_key: if given, reflectively converted objects record their class name under this key
+    Returns:
+        :return: obj as json compatible builtins
+    """
+    dicter = DICTERS.get(type(obj).__name__)
+    if dicter is not None and class_key is None:
+        return dicter(obj)
+    return reflective_to_dict(obj, class_key)
+
+
+SERIALIZE_SECONDS = histogram('blockchain_serialize_seconds', 'Writing an object as canonical json')
+
+
+def to_json(obj) -> str:
+    """
+    Converts obj to dictionary and json dumps it
+
+    Classes in SCHEMAS are written straight to json without building the
+    dictionary first. The output is identical to json.dumps(to_dict(obj), sort_keys=True)
+
+    Args:
+        :param obj: object to convert to json string
+    Returns:
+        :return: jsonified string of obj (NOT flask response)
+    """
+    type_name = type(obj).__name__
+    with SERIALIZE_SECONDS.time(type=type_name):
+        encoder = ENCODERS.get(type_name)
+        if encoder is not None:
+            return encoder(obj)
+        return json.dumps(to_dict(obj), sort_keys=True)
+
+
+def to_bytes(obj) -> bytes:
+    """
+    Args:
+        :param obj: object to serialize
+    Returns:
+        :return: canonical json of obj as bytes, the input to hasher
+    """
+    return to_json(obj).encode()
+
+
+def to_signing_bytes(obj) -> bytes:
+    """
+    Serializes an object the way it is signed, without touching it, so other
+    threads can read or serialize the same object meanwhile
+
+    Args:
+        :param obj: Transaction or Block
+    Returns:
+        :return: canonical json of obj with its signature written as null, as bytes
+    """
+    type_name = type(obj).__name__
+    with SERIALIZE_SECONDS.time(type=type_name):
+        return UNSIGNED_ENCODERS[type_name](obj).encode()
@@ -0,0 +1,228 @@
+from collections.abc import Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import RLock, local
+from typing import List
+
+from blockchain.classes import Blockchain, Block, ChainPrefix, registry, block_hash as chain_block_hash
+from blockchain.index import ChainIndex
+
+#  Marks a key that was removed in a layer of a LayeredMap
+REMOVED = object()
+
+
+class LayeredMap(Mapping):
+    """
+    Read-only mapping made of layers of changes, the newest on top
+
+    No layer is changed once it is part of a LayeredMap, so a snapshot can
+    hold one while writers carry on. A write only adds a layer with what it
+    changed, and a layer is merged into the one below it as soon as it is at
+    least as big, like carrying in a binary counter. That keeps the number of
+    layers logarithmic in the number of keys and copies each change only a
+    logarithmic number of times, instead of copying everything on every write.
+    The merged dictionary is built the first time the whole map is walked.
+    """
+
+    def __init__(self, layers=()):
+        self._layers = layers
+        self._merged = None
+
+    def with_changes(self, changes):
+        """
+        Args:
+            :param changes: dictionary of the new value of every changed key, REMOVED for
+                            removed keys, which is not changed afterwards
+        Returns:
+            :return: new LayeredMap with the changes on top
+        """
+        if not changes:
+            return self
+        layers = list(self._layers) + [changes]
+        while len(layers) > 1 and len(layers[-1]) >= len(layers[-2]):
+            top = layers.pop()
+            below = dict(layers.pop())
+            below.update(top)
+            if not layers:
+                below = {key: value for key, value in below.items() if value is not REMOVED}
+            layers.append(below)
+        return LayeredMap(tuple(layers))
+
+    def __getitem__(self, key):
+        for layer in reversed(self._layers):
+            value = layer.get(key, REMOVED)
+            if value is not REMOVED:
+                return value
+            if key in layer:
+                break
+        raise KeyError(key)
+
+    def merged(self):
+        """
+        :return: the map as one dictionary, in the order the keys were first added (do not change it)
+        """
+        merged = self._merged
+        if merged is None:
+            merged = dict()
+            for layer in self._layers:
+                merged.update(layer)
+            merged = self._merged = {key: value for key, value in merged.items() if value is not REMOVED}
+        return merged
+
+    def __iter__(self):
+        return iter(self.merged())
+
+    def __len__(self):
+        return len(self.merged())
+
+    def values(self):
+        return self.merged().values()
+
+    def items(self):
+        return self.merged().items()
+
+
+@dataclass(frozen=True)
+class ChainSnapshot:
+    """
+    Read-only view of our chain as it was after one write
+
+    Blocks are only ever appended to a chain list (or store.StoredChain), and
+    replacing the chain swaps in a new one, so a snapshot can share it with
+    the live chain and only look at its first height blocks.
+
+    Attributes:
+        chain: blocks shared with the chain, only the first height are part of the snapshot
+        height: number of blocks in the snapshot
+        tip_hash: hash the next block's prev_hash has to point at
+        deltas: LayeredMap of the ledger deltas at that height
+        transactions: LayeredMap of the pending transactions by hash, in the order they arrived
+        index: live ChainIndex of the chain, whose entries at or past height are not part of the snapshot
+    """
+
+    chain: List[Block]
+    height: int
+    tip_hash: str
+    deltas: LayeredMap
+    transactions: LayeredMap
+    index: ChainIndex = None
+
+    def blocks(self, start=0, stop=None):
+        """
+        :return: list of the blocks from height start up to stop (or the tip)
+        """
+        stop = self.height if stop is None else min(stop, self.height)
+        return self.chain[start:stop]
+
+    def view(self):
+        """
+        :return: ChainPrefix of the blocks of the snapshot, which reads a block only when it is looked at
+        """
+        return ChainPrefix(self.chain, self.height)
+
+    def find_block(self, block_hash):
+        """
+        :return: height of the block with that hash, or None if it is not in the snapshot
+        """
+        height = self.index.blocks.get(block_hash)
+        if height is None or height >= self.height or chain_block_hash(self.chain, height) != block_hash:
+            return None
+        return height
+
+    def find_transaction(self, transaction_hash):
+        """
+        :return: (height, position) of the transaction with that hash, or None if it is not in the snapshot
+        """
+        reference = self.index.transactions.get(transaction_hash)
+        if reference is None or reference[0] >= self.height:
+            return None
+        height, position = reference
+        transactions = self.chain[height].transactions
+        if position >= len(transactions) or transactions[position].hash() != transaction_hash:
+            return None
+        return reference
+
+    def history(self, public_key):
+        """
+        :return: list of (height, position) of the transactions the key sent or received, in chain order
+        """
+        history = []
+        for height, position in list(self.index.addresses.get(public_key, ())):
+            #  Skip what was indexed after the snapshot was taken
+            if height >= self.height or position >= len(self.chain[height].transactions):
+                continue
+            transaction = self.chain[height].transactions[position]
+            if public_key in (transaction.sender.public_key, transaction.recipient.public_key):
+                history.append((height, position))
+        return history
+
+    def balance(self, public_key):
+        return registry.initial_balance(public_key) + self.deltas.get(public_key, 0)
+
+
+class ChainState:
+    """
+    Guards our Blockchain so it can be read and written from many request threads
+
+    Writers take a lock for the whole of their change, so they never see each
+    other's half done work. When the outermost write finishes a new snapshot is
+    published. Readers only ever look at the latest snapshot, which takes no
+    lock and is never changed afterwards. A snapshot only costs what changed
+    since the last one: the ledger and the mempool note which keys they
+    changed, and only those are added to the snapshot's LayeredMaps.
+
+    Attributes:
+        blockchain: the live Blockchain, only to be touched inside write()
+        snapshot: ChainSnapshot of the last finished write
+    """
+
+    def __init__(self, blockchain: Blockchain):
+        self.blockchain = blockchain
+        self._lock = RLock()
+        self._depth = local()
+        self._ledger = None
+        self._mempool = None
+        self.snapshot = None
+        self.publish()
+
+    @contextmanager
+    def write(self):
+        """
+        Context manager that serializes writers and publishes a snapshot when the outermost one exits
+
+        Returns:
+            :return: the live Blockchain
+        """
+        with self._lock:
+            depth = getattr(self._depth, 'value', 0)
+            self._depth.value = depth + 1
+            try:
+                yield self.blockchain
+            finally:
+                self._depth.value = depth
+                if depth == 0:
+                    self.publish()
+
+    def publish(self):
+        blockchain = self.blockchain
+        ledger, mempool = blockchain._ledger, blockchain.transactions
+        if self.snapshot is None or ledger is not self._ledger or mempool is not self._mempool:
+            #  Start over from a full copy, and note every change from now on
+            self._ledger, self._mempool = ledger, mempool
+            ledger.changed, mempool.changed = set(), set()
+            deltas = LayeredMap().with_changes(dict(ledger.deltas))
+            transactions = LayeredMap().with_changes(dict(mempool.pending()))
+        else:
+            deltas = self.snapshot.deltas.with_changes({public_key: ledger.deltas[public_key]
+                                                        for public_key in ledger.changed})
+            pending = mempool.pending()
+            transactions = self.snapshot.transactions.with_changes(
+                {transaction_hash: pending.get(transaction_hash, REMOVED) for transaction_hash in mempool.changed})
+            ledger.changed.clear()
+            mempool.changed.clear()
+        self.snapshot = ChainSnapshot(chain=blockchain.chain,
+                                      height=len(blockchain.chain),
+                                      tip_hash=blockchain.tip_hash(),
+                                      deltas=deltas,
+                                      transactions=transactions,
+                                      index=blockchain._index)
@@ -0,0 +1,337 @@
+from collections import OrderedDict
+from collections.abc import Sequence
+from threading import RLock
+from weakref import WeakSet
+import json
+import os
+import struct
+
+from blockchain.chain_settings import *
+from blockchain.classes import Blockchain, Ledger, block_from_dict, to_json
+from blockchain.index import index_from_dict
+
+#  (segment number, byte offset in the segment, SHA3_512 digest) of one block
+INDEX_RECORD = struct.Struct('>IQ64s')
+
+
+class BlockStore:
+    """
+    Append-only on-disk log of the blocks of our chain
+
+    Blocks are written as one json document per line into segment files of
+    about SEGMENT_BLOCKS blocks each. The index file holds a fixed size record per
+    height with the block's location and digest, so any block can be found
+    without scanning, the number of blocks is the size of the index, and every
+    hash is known without reading a block. A checkpoint of the ledger and the
+    ChainIndex is written every CHECKPOINT_INTERVAL blocks so a restart only
+    has to replay the blocks after it.
+
+    Nothing is written until the first block is, so opening a store never
+    creates files. The STORE_CACHE_BLOCKS most recently read blocks are kept in
+    memory.
+
+    Attributes:
+        directory (str): Directory holding the segments, index and checkpoint
+        checkpoint_height (int): number of blocks the last checkpoint written or loaded covers
+    """
+
+    def __init__(self, directory=BLOCK_STORE_DIR):
+        self.directory = directory
+        self._index_path = os.path.join(directory, 'heights')
+        self._checkpoint_path = os.path.join(directory, 'checkpoint.json')
+        self._lock = RLock()
+        self._cache = OrderedDict()
+        self._views = WeakSet()
+        self._length = 0
+        self.checkpoint_height = 0
+        if os.path.exists(self._index_path):
+            self._length = os.path.getsize(self._index_path) // INDEX_RECORD.size
+            self._repair()
+
+    def _repair(self):
+        #  Drops whatever a crash left half written after the last indexed block
+        with open(self._index_path, 'r+b') as f:
+            f.truncate(self._length * INDEX_RECORD.size)
+        if self._length == 0:
+            segment, end = 0, 0
+        else:
+            segment, offset = self._location(self._length - 1)
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                end = offset + len(f.readline())
+        if os.path.exists(self._segment_path(segment)):
+            with open(self._segment_path(segment), 'r+b') as f:
+                f.truncate(end)
+        self._remove_segments_after(segment)
+
+    def _remove_segments_after(self, segment):
+        later = segment + 1
+        while os.path.exists(self._segment_path(later)):
+            os.remove(self._segment_path(later))
+            later += 1
+
+    def __len__(self):
+        return self._length
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f'{segment:08d}.log')
+
+    def _record(self, height):
+        with open(self._index_path, 'rb') as f:
+            f.seek(height * INDEX_RECORD.size)
+            return INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))
+
+    def _location(self, height):
+        return self._record(height)[:2]
+
+    def digests(self):
+        """
+        :return: list of the digest of every stored block, in order, read from the index alone
+        """
+        if self._length == 0:
+            return []
+        with self._lock, open(self._index_path, 'rb') as f:
+            records = f.read(self._length * INDEX_RECORD.size)
+        return [digest for _, _, digest in INDEX_RECORD.iter_unpack(records)]
+
+    def view(self):
+        """
+        :return: StoredChain of the blocks stored now
+        """
+        return StoredChain(self, self.digests())
+
+    def append(self, block):
+        """
+        Writes a block after the last stored block
+
+        Args:
+            :param block: Block at height len(self)
+        """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            segment = self._length // SEGMENT_BLOCKS
+            if self._length > 0:
+                #  Never go back to an earlier segment, even if SEGMENT_BLOCKS was raised
+                segment = max(segment, self._location(self._length - 1)[0])
+            with open(self._segment_path(segment), 'ab') as f:
+                offset = f.tell()
+                f.write(to_json(block).encode() + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._index_path, 'ab') as f:
+                f.write(INDEX_RECORD.pack(segment, offset, block.digest()))
+                f.flush()
+                os.fsync(f.fileno())
+            self._remember(self._length, block)
+            self._length += 1
+
+    def truncate(self, height):
+        """
+        Drops every block from height onwards, e.g. when our chain is replaced
+
+        Every StoredChain that still looks at the dropped blocks keeps them in memory first.
+
+        Args:
+            :param height: number of blocks to keep
+        """
+        with self._lock:
+            if height >= self._length:
+                return
+            for view in list(self._views):
+                view.keep(height)
+            segment, offset = self._location(height)
+            with open(self._segment_path(segment), 'r+b') as f:
+                f.truncate(offset)
+            self._remove_segments_after(segment)
+            with open(self._index_path, 'r+b') as f:
+                f.truncate(height * INDEX_RECORD.size)
+            self._length = height
+            for cached in [cached for cached in self._cache if cached >= height]:
+                del self._cache[cached]
+
+    def read_json(self, height):
+        """
+        Args:
+            :param height: height of a stored block
+        Returns:
+            :return: canonical json of the block at that height, as it was written
+        """
+        with self._lock:
+            segment, offset = self._location(height)
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                return f.readline().decode().rstrip('\n')
+
+    def read(self, height):
+        """
+        Args:
+            :param height: height of a stored block
+        Returns:
+            :return: Block at that height
+        """
+        with self._lock:
+            block = self._cache.get(height)
+            if block is not None:
+                self._cache.move_to_end(height)
+                return block
+            block = block_from_dict(json.loads(self.read_json(height)))
+            self._remember(height, block)
+            return block
+
+    def _remember(self, height, block):
+        self._cache[height] = block
+        if len(self._cache) > STORE_CACHE_BLOCKS:
+            self._cache.popitem(last=False)
+
+    def checkpoint(self, blockchain):
+        """
+        Saves the ledger and the index of a chain whose blocks are all stored
+
+        Args:
+            :param blockchain: Blockchain backed by this store
+        """
+        height = len(blockchain.chain)
+        index = blockchain._index
+        temp_path = self._checkpoint_path + '.tmp'
+        os.makedirs(self.directory, exist_ok=True)
+        with open(temp_path, 'w') as f:
+            json.dump({'height': height,
+                       'tip_hash': blockchain.tip_hash(),
+                       'deltas': blockchain._ledger.deltas,
+                       'index': None if index is None else {'transactions': index.transactions,
+                                                            'addresses': index.addresses}}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._checkpoint_path)
+        self.checkpoint_height = height
+
+    def load_checkpoint(self, digests):
+        """
+        Args:
+            :param digests: digests of the stored blocks
+        Returns:
+            :return: (height, ledger deltas, ChainIndex or None) of the newest checkpoint
+                     that matches the stored blocks, or (0, {}, None) if there is none
+        """
+        try:
+            with open(self._checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return 0, {}, None
+        height = checkpoint['height']
+        if not 0 < height <= len(digests) or digests[height - 1].hex() != checkpoint['tip_hash']:
+            return 0, {}, None
+        index = checkpoint.get('index')
+        if index is not None:
+            index = index_from_dict(index, digests[:height])
+        self.checkpoint_height = height
+        return height, checkpoint['deltas'], index
+
+
+class StoredChain(Sequence):
+    """
+    Blocks of our chain as kept in a BlockStore, only read from disk when they are looked at
+
+    Only the digests are held in memory, so hashes (e.g. for
+    common_prefix_length) never touch the disk. Like the list it stands in
+    for, a StoredChain is only ever appended to, and replacing our chain makes
+    a new one (see fork), so snapshots can share it with the live chain. When
+    the store is cut back, every StoredChain that still looks at the dropped
+    blocks keeps them in memory first.
+
+    Attributes:
+        store: BlockStore the blocks are read from
+    """
+
+    def __init__(self, store, digests):
+        self.store = store
+        self._digests = digests
+        self._kept = dict()
+        with store._lock:
+            store._views.add(self)
+
+    def __len__(self):
+        return len(self._digests)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[height] for height in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Block height out of range')
+        with self.store._lock:
+            block = self._kept.get(index)
+            return block if block is not None else self.store.read(index)
+
+    def hash_at(self, height):
+        """
+        :return: hash of the block at height, without reading the block
+        """
+        return self._digests[height].hex()
+
+    def time_at(self, height):
+        """
+        :return: timestamp of the block at height
+        """
+        return self[height].time
+
+    def json_at(self, height):
+        """
+        :return: canonical json of the block at height, without building the block
+        """
+        with self.store._lock:
+            block = self._kept.get(height)
+            return to_json(block) if block is not None else self.store.read_json(height)
+
+    def append(self, block):
+        """
+        Writes a block after the last stored block, which has to be the tip of this chain
+
+        Args:
+            :param block: Block whose prev_hash points at the tip
+        """
+        self.store.append(block)
+        self._digests.append(block.digest())
+        block.compact()
+
+    def keep(self, height):
+        """
+        Reads the blocks from height onwards into memory, before the store drops them
+        """
+        for kept in range(height, len(self)):
+            if kept not in self._kept:
+                self._kept[kept] = self.store.read(kept)
+
+    def fork(self, height):
+        """
+        Cuts the store back to height blocks, e.g. when our chain is replaced
+
+        Args:
+            :param height: number of blocks to keep
+        Returns:
+            :return: new StoredChain of the blocks that were kept, to append the new blocks to
+        """
+        with self.store._lock:
+            self.store.truncate(height)
+            return StoredChain(self.store, self._digests[:height])
+
+
+def blockchain_from_store(store):
+    """
+    Reopens our chain from disk, replaying only the blocks after the checkpoint
+
+    No block before the checkpoint is read. Their hashes come from the index
+    file, and the ledger and ChainIndex from the checkpoint.
+
+    Args:
+        :param store: BlockStore with at least one block
+    Returns:
+        :return: indexed Blockchain backed by store
+    """
+    chain = store.view()
+    height, deltas, index = store.load_checkpoint(chain._digests)
+    blockchain = Blockchain(chain, ledger=Ledger(chain[height:], deltas))
+    blockchain.attach(store)
+    blockchain.build_index(index)
+    return blockchain
@@ -0,0 +1,233 @@
+from requests.exceptions import RequestException
+
+from blockchain.chain_settings import *
+from blockchain.classes import Blockchain, ChainPrefix, InvalidBlock, block_from_dict, block_hash, block_time, \
+    lazy_blockchain_from_dict
+from blockchain.difficulty import TargetSchedule, meets_target
+from blockchain.gossip import SESSION, EXECUTOR
+from blockchain import wire
+
+
+class ChainSync:
+    """
+    Headers-first download of a chain from our peers that may take over ours
+
+    The peer's chain is downloaded in windows of at most MAX_HEADERS blocks.
+    The headers of a window are fetched from the first peer and checked
+    cheaply: each one has to point at the one before it and carry enough
+    proof of work. The bodies of the window are then fetched in ranges from
+    all the peers at once, with at most SYNC_WINDOW requests in flight, and
+    a body is only kept if it hashes to its header. Each block is checked
+    and added as soon as the blocks before it are, and the window is dropped
+    before the next one is fetched, so a peer can never make us hold more
+    than one window that has not been checked. Nothing past the length the
+    peer announced is fetched.
+
+    If the peer's chain simply continues ours, the blocks are added to our
+    chain. Otherwise they are added to a copy of our chain cut back to the
+    fork. Either way calling run again after a failure picks up where the
+    last call stopped.
+
+    Attributes:
+        blockchain: Blockchain being synced
+        nodes: urls of the peers, the first of which is asked for headers
+        length: number of blocks the peer announced, or None to sync to whatever its tip is
+        fork: height of the first block where the peer's chain differs from ours
+        synced: Blockchain the blocks are added to, blockchain itself or a copy cut back to the fork
+        start: height of the first header of the window
+        headers: verified headers of the window
+        bodies: downloaded blocks of the window by height that have not been added yet
+    """
+
+    def __init__(self, blockchain, nodes, length=None, session=SESSION, executor=EXECUTOR):
+        self.blockchain = blockchain
+        self.nodes = list(nodes)
+        self.length = length
+        self.session = session
+        self.executor = executor
+        self.fork = None
+        self.synced = None
+        self.start = 0
+        self.headers = []
+        self.bodies = dict()
+
+    def _get(self, node, api_url, **params):
+        r = self.session.get(f'{node}/api/{api_url}', params=params, timeout=GOSSIP_TIMEOUT,
+                             headers={'Accept': f'{wire.BINARY}, {wire.JSON};q=0.5'})
+        r.raise_for_status()
+        return wire.loads(r.content, r.headers.get('Content-Type'))
+
+    def _find_fork(self, peer):
+        chain = self.blockchain.chain
+        start, step = len(chain), MAX_HEADERS
+        while start > 0:
+            start = max(0, start - step)
+            headers = self._get(peer, 'headers', from_height=start, limit=min(step, len(chain) - start))
+            shared = 0
+            for header in headers:
+                if header['hash'] != block_hash(chain, header['height']):
+                    break
+                shared += 1
+            if shared > 0:
+                return start + shared
+            step *= 2
+        return 0
+
+    def fetch_headers(self, peer):
+        """
+        Downloads and checks the headers of the next window, replacing those of the last one
+
+        Returns:
+            :return: False if the peer sent a header that does not check out, or more than were asked for
+        """
+        chain = self.synced.chain
+        self.start = len(chain)
+        self.headers = []
+        limit = MAX_HEADERS if self.length is None else min(MAX_HEADERS, self.length - self.start)
+        if limit <= 0:
+            return True
+        #  Targets of the peer's chain, from the blocks added so far and the headers after them
+        schedule = TargetSchedule(lambda height: block_time(chain, height) if height < self.start
+                                  else self.headers[height - self.start]['time'])
+        batch = self._get(peer, 'headers', from_height=self.start, limit=limit)
+        if len(batch) > limit:
+            return False
+        height = self.start
+        prev_hash = self.synced.tip_hash() if height > 0 else None
+        for header in batch:
+            if header['height'] != height or not meets_target(bytes.fromhex(header['hash']),
+                                                              schedule.target(height)):
+                return False
+            if prev_hash is not None and header['prev_hash'] != prev_hash:
+                return False
+            self.headers.append(header)
+            prev_hash = header['hash']
+            height += 1
+        return True
+
+    def _fetch_range(self, start, stop, attempt):
+        #  Consecutive ranges go to consecutive peers, and a retry moves on to the next peer
+        node = self.nodes[(start // MAX_BLOCKS + attempt) % len(self.nodes)]
+        blocks = [block_from_dict(block)
+                  for block in self._get(node, 'blocks', from_height=start, limit=stop - start)]
+        if len(blocks) != stop - start:
+            raise ValueError('Peer does not have the whole range')
+        for height, block in enumerate(blocks, start):
+            if block.hash() != self.headers[height - self.start]['hash']:
+                raise ValueError('Body does not match its header')
+        return blocks
+
+    def _missing_ranges(self, next_height):
+        ranges = []
+        for height in range(next_height, self.start + len(self.headers)):
+            if height in self.bodies:
+                continue
+            if ranges and ranges[-1][1] == height and height - ranges[-1][0] < MAX_BLOCKS:
+                ranges[-1][1] = height + 1
+            else:
+                ranges.append([height, height + 1])
+        return [tuple(heights) for heights in ranges]
+
+    def fetch_bodies(self, on_block=None):
+        """
+        Downloads every body of the window that is still missing, a range per request
+
+        Args:
+            :param on_block: if given, called with each block in height order as soon
+                             as it and every block before it have arrived, and the block is
+                             then dropped instead of kept in bodies. Returning False aborts.
+        Returns:
+            :return: False if some range could not be fetched from any peer, or on_block aborted
+        """
+        next_height = self.start
+        ranges = self._missing_ranges(next_height)
+        ranges.reverse()
+        in_flight = dict()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < SYNC_WINDOW:
+                start, stop = ranges.pop()
+                in_flight[(start, stop)] = (self.executor.submit(self._fetch_range, start, stop, 0), 0)
+            (start, stop), (future, attempt) = next(iter(in_flight.items()))
+            del in_flight[(start, stop)]
+            try:
+                blocks = future.result()
+            except (RequestException, ValueError, KeyError, TypeError, IndexError):
+                if attempt + 1 >= len(self.nodes):
+                    return False
+                in_flight[(start, stop)] = (self.executor.submit(self._fetch_range, start, stop, attempt + 1),
+                                            attempt + 1)
+                continue
+            for height, block in enumerate(blocks, start):
+                self.bodies[height] = block
+            if on_block is not None:
+                while next_height in self.bodies:
+                    if on_block(self.bodies.pop(next_height)) is False:
+                        return False
+                    next_height += 1
+        return True
+
+    def _extend(self, block):
+        if not self.synced.valid_next_block(block):
+            return False
+        self.synced.add_block(block)
+
+    def run(self):
+        """
+        Syncs with the peers, one window at a time
+
+        Returns:
+            :return: None if nothing was added, e.g. the peer's chain is not ahead of ours,
+                     otherwise the Blockchain the blocks were added to: our own Blockchain if the
+                     peer's chain continues it, or a copy of it cut back to the fork. Every block
+                     past the fork was checked, signatures included. A sync that fails part of
+                     the way returns what it added so far.
+        """
+        try:
+            if self.fork is None:
+                self.fork = self._find_fork(self.nodes[0])
+                if self.fork == len(self.blockchain.chain):
+                    self.synced = self.blockchain
+                else:
+                    self.synced = Blockchain(ChainPrefix(self.blockchain.chain, self.fork),
+                                             ledger=self.blockchain.fork_ledger(self.fork))
+            self.bodies.clear()
+            while self.fetch_headers(self.nodes[0]) and self.headers:
+                if not self.fetch_bodies(self._extend) or len(self.headers) < MAX_HEADERS:
+                    break
+        except (RequestException, ValueError, KeyError, TypeError, IndexError):
+            pass
+        if self.synced is None or len(self.synced.chain) == self.fork:
+            return None
+        return self.synced
+
+
+def serves_headers(node, session=SESSION):
+    """
+    Args:
+        :param node: url of a peer
+    Returns:
+        :return: False if the peer answers 404 to /api/headers, i.e. it can only send its whole chain
+    """
+    try:
+        r = session.get(f'{node}/api/headers', params={'from_height': 0, 'limit': 1}, timeout=GOSSIP_TIMEOUT)
+    except RequestException:
+        return True
+    return r.status_code != 404
+
+
+def download_chain(node, session=SESSION):
+    """
+    Downloads the whole chain of a peer that does not serve headers
+
+    Args:
+        :param node: url of a peer
+    Returns:
+        :return: Blockchain over a ChainView of the peer's chain, not validated yet,
+                 or None if it could not be downloaded
+    """
+    try:
+        r = session.get(f'{node}/api/chain', timeout=GOSSIP_TIMEOUT)
+        r.raise_for_status()
+        return lazy_blockchain_from_dict(r.json())
+    except (RequestException, ValueError, KeyError, TypeError, InvalidBlock):
+        return None
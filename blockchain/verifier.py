@@ -0,0 +1,92 @@
+import multiprocessing
+
+from Cryptodome.Hash import SHA3_512
+
+from blockchain.chain_settings import *
+from blockchain.keys import KEYS, KeyCache
+
+
+def verify(public_key, message, signature):
+    """
+    Checks a pkcs1_15 signature of the SHA3_512 hash of message
+
+    Args:
+        :param public_key: PEM public key of the signer
+        :param message: bytes that were signed, or an SHA3_512 hasher of them
+        :param signature: signature bytes, or their hex
+    Returns:
+        :return: validity of signature
+    """
+    if isinstance(message, bytes):
+        message = SHA3_512.new(message)
+    try:
+        if not isinstance(signature, bytes):
+            signature = bytes.fromhex(signature)
+        KEYS.scheme(public_key).verify(message, signature)
+    except (ValueError, IndexError, TypeError):
+        return False
+    return True
+
+
+def _verify_item(item):
+    label, public_key, message, signature = item
+    return label, verify(public_key, message, signature)
+
+
+def _fresh_keys():
+    #  A forked child starts with a copy of the parent's key cache, whose lock another thread may have held
+    global KEYS
+    KEYS = KeyCache()
+
+
+_pool = None
+_workers = 1
+
+
+def start_pool(workers=VERIFICATION_WORKERS):
+    """
+    Forks the processes first_invalid spreads its work over
+
+    Call it before the process starts any other thread. A forked child gets
+    every lock in the state it had at fork time, and a lock some other thread
+    held then is never released in the child. The children make their own key
+    cache, so they never touch a lock of the parent.
+
+    Args:
+        :param workers: number of processes, no pool is started for fewer than 2
+    Returns:
+        :return: the pool, or None if signatures are verified in this process
+    """
+    global _pool, _workers
+    if _pool is None and workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        _pool = multiprocessing.get_context('fork').Pool(workers, initializer=_fresh_keys)
+        _workers = workers
+    return _pool
+
+
+def first_invalid(items):
+    """
+    Verifies a batch of signatures, spreading them over the pool of start_pool
+
+    Large batches are handed to the pool in rounds and no round is started
+    after a failure, so a bad chain costs roughly as much as the signatures
+    checked before the failure.
+
+    Args:
+        :param items: list of (label, public_key, message, signature)
+    Returns:
+        :return: label of an invalid signature, or None if all are valid
+    """
+    if _pool is None or len(items) < PARALLEL_VERIFICATION_MIN:
+        for item in items:
+            label, valid = _verify_item(item)
+            if not valid:
+                return label
+        return None
+    step = PARALLEL_VERIFICATION_MIN * _workers
+    for first in range(0, len(items), step):
+        batch = items[first:first + step]
+        for label, valid in _pool.imap_unordered(_verify_item, batch, max(1, len(batch) // (_workers * 4))):
+            if not valid:
+                return label
+    return None
@@ -1,13 +1,90 @@
-from flask import jsonify, request
+from flask import Response, jsonify, request
+from werkzeug.routing import BaseConverter
 
 from blockchain import *
 from blockchain.classes import *
+from blockchain.difficulty import MAX_TARGET
+from blockchain.gossip import broadcast
+from blockchain.mempool import cost
+from blockchain.sync import ChainSync
+from blockchain.worker import MiningWorker
+from blockchain import wire, metrics
+
+
+class PublicKeyConverter(BaseConverter):
+    #  PEM keys span several lines and contain slashes
+    regex = r'[\s\S]+?'
+    part_isolating = False
+
+
+app.url_map.converters['public_key'] = PublicKeyConverter
+
+
+def read_message():
+    """
+    :return: body of a post from a peer or the web client, in either wire format
+    """
+    return wire.loads(request.get_data(), request.content_type)
+
+
+def respond(message):
+    """
+    Answers a GET in the binary format if the client prefers it, otherwise in json
+
+    Args:
+        :param message: json compatible builtins
+    """
+    if request.accept_mimetypes.best_match([wire.JSON, wire.BINARY]) == wire.BINARY:
+        return app.response_class(wire.encode(message), mimetype=wire.BINARY), 200
+    return jsonify(message), 200
+
+
+@app.after_request
+def advertise_binary(response):
+    #  Lets peers know they may post to us in the binary format
+    if request.path.startswith('/api/'):
+        response.headers['Accept-Post'] = wire.BINARY
+    return response
+
+
+@app.errorhandler(wire.UnknownReference)
+def unknown_reference(error):
+    return jsonify(message="Unknown user reference, send json instead"), 415
 
 
 #  GET requests go here
 @app.route('/api/chain', methods=['GET'])
 def get_chain():
-    return jsonify(to_dict(my_chain)), 200
+    if 'from_height' not in request.args and 'limit' not in request.args:
+        return app.response_class(stream_chain(chain_state.snapshot), mimetype='application/json'), 200
+    from_height, limit, error = height_range(MAX_BLOCKS)
+    if error is not None:
+        return error
+    snapshot = chain_state.snapshot
+    page = snapshot.blocks(from_height, from_height + limit)
+    next_height = from_height + len(page)
+    return respond({
+        'chain': to_dict(page),
+        'height': snapshot.height,
+        'next_height': next_height if next_height < snapshot.height else None
+    })
+
+
+def stream_chain(snapshot):
+    """
+    Writes out the json of a whole chain one block at a time, so the full
+    document never has to be held in memory
+
+    Args:
+        :param snapshot: ChainSnapshot to write out
+    Returns:
+        :return: generator of pieces of the same json to_json gives for the chain
+    """
+    yield '{"chain": ['
+    for height in range(snapshot.height):
+        yield (', ' if height else '') + block_json(snapshot.chain, height)
+    yield '], "transactions": [' + ', '.join([to_json(transaction)
+                                               for transaction in snapshot.transactions.values()]) + ']}'
 
 
 @app.route('/api/nodes', methods=['GET'])
@@ -25,25 +102,26 @@ def get_user_info():
     user_id = request.args.get('id')
     if user_id is None:
         return jsonify(message="No user id given"), 408
-    hashed_id = hasher(user_id.encode()).hexdigest()
-    for user in USERS:
-        if user['hashed_id'] == hashed_id:
-            try:
-                user_from_dict(user)
-            except KeyError:
-                return jsonify(message="User has not been initialized"), 408
-            return jsonify({
-                'alias': user['alias'],
-                'key': user['public_key'],
-                'balance': my_chain.compute_balances()[user['public_key']]
-            }), 200
-    else:
+    user = registry.find_by_id(user_id)
+    if user is None:
         return jsonify(message="User not found"), 408
+    if user.get('public_key') is None:
+        return jsonify(message="User has not been initialized"), 408
+    return jsonify({
+        'alias': user['alias'],
+        'key': user['public_key'],
+        'balance': chain_state.snapshot.balance(user['public_key'])
+    }), 200
 
 
 @app.route('/api/log', methods=['GET'])
 def get_log():
-    return jsonify(log)
+    return jsonify(list(log))
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/api/block_transactions', methods=['GET'])
@@ -55,17 +133,94 @@ def get_transaction_from_block():
         block_id = int(block_id)
     except ValueError:
         return jsonify(message="Id not an integer"), 408
-    if block_id >= len(my_chain.chain):
+    snapshot = chain_state.snapshot
+    if block_id >= snapshot.height:
         return jsonify(message="Id too large"), 408
     if block_id < 0:
         return jsonify(message="Id too small"), 408
-    return jsonify(to_dict(my_chain.chain[block_id].transactions)), 200
+    return jsonify(to_dict(snapshot.chain[block_id].transactions)), 200
+
+
+def height_range(max_limit):
+    """
+    Reads the from_height and limit query arguments
+
+    Args:
+        :param max_limit: largest limit a client may ask for
+    Returns:
+        :return: (from_height, limit, None), or (None, None, error response)
+    """
+    try:
+        from_height = int(request.args.get('from_height', 0))
+        limit = int(request.args.get('limit', max_limit))
+    except ValueError:
+        return None, None, (jsonify(message="from_height and limit must be integers"), 408)
+    if from_height < 0:
+        return None, None, (jsonify(message="from_height must not be negative"), 408)
+    if limit < 1:
+        #  An empty page would hand back a next_height the client already asked for, and it would never get further
+        return None, None, (jsonify(message="limit must be at least 1"), 408)
+    return from_height, min(limit, max_limit), None
+
+
+@app.route('/api/headers', methods=['GET'])
+def get_headers():
+    from_height, limit, error = height_range(MAX_HEADERS)
+    if error is not None:
+        return error
+    snapshot = chain_state.snapshot
+    return respond([snapshot.chain[height].header(height)
+                    for height in range(from_height, min(from_height + limit, snapshot.height))])
+
+
+@app.route('/api/blocks', methods=['GET'])
+def get_blocks():
+    from_height, limit, error = height_range(MAX_BLOCKS)
+    if error is not None:
+        return error
+    return respond(to_dict(chain_state.snapshot.blocks(from_height, from_height + limit)))
+
+
+@app.route('/api/block/<block_hash>', methods=['GET'])
+def get_block(block_hash):
+    snapshot = chain_state.snapshot
+    height = snapshot.find_block(block_hash)
+    if height is None:
+        return jsonify(message="Block not found"), 408
+    return jsonify({'height': height, 'block': to_dict(snapshot.chain[height])}), 200
+
+
+def transaction_reference(snapshot, height, position):
+    return {'height': height,
+            'position': position,
+            'block_hash': block_hash(snapshot.chain, height),
+            'confirmations': snapshot.height - height,
+            'transaction': to_dict(snapshot.chain[height].transactions[position])}
+
+
+@app.route('/api/tx/<transaction_hash>', methods=['GET'])
+def get_transaction(transaction_hash):
+    snapshot = chain_state.snapshot
+    reference = snapshot.find_transaction(transaction_hash)
+    if reference is not None:
+        return jsonify(status='confirmed', **transaction_reference(snapshot, *reference)), 200
+    pending = snapshot.transactions.get(transaction_hash)
+    if pending is not None:
+        return jsonify(status='pending', transaction=to_dict(pending)), 200
+    return jsonify(message="Transaction not found"), 408
+
+
+@app.route('/api/address/<public_key:public_key>/history', methods=['GET'])
+def get_address_history(public_key):
+    snapshot = chain_state.snapshot
+    return jsonify([transaction_reference(snapshot, height, position)
+                    for height, position in snapshot.history(public_key)]), 200
 
 
 #  POST requests go here
 @app.route('/api/accept_user', methods=['POST'])
 def accept_user():
-    args = json.loads(request.get_json())
+    args = read_message()
     if 'public_key' not in args:
         return jsonify(message="You did not provide the public key"), 408
     if 'id' not in args:
@@ -74,28 +229,28 @@ def accept_user():
         return jsonify(message="You did not provide the alias"), 408
     if 'node_url' not in args:
         return jsonify(message="You did not provide the node url"), 408
-    for user in USERS:
-        if hasher(args['id'].encode()).hexdigest() == user['hashed_id']:
-            if 'public_key' in user:
-                return jsonify(message="This user has already been registered"), 408
-            else:
-                try:
-                    RSA.import_key(args['public_key'])
-                except (ValueError, IndexError, TypeError) as e:
-                    return jsonify(message="Invalid Public Key")
-                user['public_key'] = args['public_key']
-                user['alias'] = args['alias']
-                user['private_key'] = None
-                if args['node_url'] != BOOTNODE:
-                    add_node(args['node_url'])
-                return jsonify(message="Success! User claimed"), 200
-    else:
+    user = registry.find_by_id(args['id'])
+    if user is None:
         return jsonify(message="That id did not match any hashed id's"), 408
+    if 'public_key' in user:
+        return jsonify(message="This user has already been registered"), 408
+    try:
+        RSA.import_key(args['public_key'])
+    except (ValueError, IndexError, TypeError) as e:
+        return jsonify(message="Invalid Public Key")
+    with chain_state.write():
+        if 'public_key' in user:
+            return jsonify(message="This user has already been registered"), 408
+        registry.claim(user, args['public_key'], args['alias'])
+    KEYS.invalidate(args['public_key'])
+    if args['node_url'] != BOOTNODE:
+        add_node(args['node_url'])
+    return jsonify(message="Success! User claimed"), 200
 
 
 @app.route('/api/accept_transaction', methods=['POST'])
 def accept_transaction():
-    args = json.loads(request.get_json())
+    args = read_message()
     try:
         transaction = transaction_from_dict(args)
     except KeyError:
@@ -104,46 +259,190 @@ def accept_transaction():
         return jsonify(message="Sender not found"), 408
     if not find_user(transaction.recipient.public_key):
         return jsonify(message="Recipient not found"), 408
-    balances = my_chain.compute_balances()
-    balances[transaction.recipient.public_key] += transaction.value
-    if balances[transaction.sender.public_key] < transaction.value + transaction.fee:
-        return jsonify(message="Not enough balance to send this transaction"), 408
-    if transaction.is_valid():
-        my_chain.transactions.append(transaction)
-        total = BASE_MINER_REWARD
-        for transaction in my_chain.transactions:
-            total += transaction.fee
-        if total >= TOTAL_TRANSACTION_FEE:
-            mine_transactions()
-        return jsonify(message="Success! Transaction processed!"), 200
-    else:
+    if not transaction.is_valid():
         return jsonify(message="Invalid transaction"), 408
+    with chain_state.write() as my_chain:
+        mempool = my_chain.transactions
+        sender = transaction.sender.public_key
+        if my_chain.balance(sender) - mempool.spend(sender) < cost(transaction):
+            return jsonify(message="Not enough balance to send this transaction"), 408
+        if not mempool.add(transaction):
+            return jsonify(message="Transaction already pending"), 408
+        queue_block()
+    return jsonify(message="Success! Transaction is pending until it is mined"), 200
 
 
 @app.route('/api/accept_chain', methods=['POST'])
 def accept_blockchain():
-    args = json.loads(request.get_json())
+    args = read_message()
     try:
-        other = blockchain_from_dict(args)
-    except TypeError:
+        #  Blocks are only built once validation reaches them
+        other = lazy_blockchain_from_dict(args)
+    except (InvalidBlock, KeyError, TypeError):
         return jsonify(message="Stop trying to break things")
-    if not other.is_valid():
-        return jsonify(message="Invalid Blockchain"), 408
-    elif (len(other.chain) - len(my_chain.chain)) >= LENGTH_DIFFERENCE:
-        my_chain.chain = other.chain
-        return jsonify(message="Success! We have replaced our chain with yours"), 200
-    else:
-        return jsonify(message="We are not willing to take your chain"), 407
-
-
-def mine_transactions():
-    prev_hash = '0' * DIFFICULTY if len(my_chain.chain) == 0 else my_chain.chain[-1].prev_hash
-    block = Block(prev_hash=prev_hash,
-                  miner=me,
-                  transactions=my_chain.transactions)
-    block.mine()
-    me.sign(block)
-    my_chain.chain.append(block)
-    my_chain.transactions = []
-    from blockchain.views.client import spread_message
-    spread_message('accept_chain', to_json(my_chain), '/', '/', False)
+    try:
+        message, status = consider_chain(other)
+    except InvalidBlock as e:
+        return jsonify(message=f"Invalid Blockchain: {e}"), 408
+    return jsonify(message=message), status
+
+
+@app.route('/api/accept_block', methods=['POST'])
+def accept_block():
+    args = read_message()
+    try:
+        block = block_from_dict(args['block'])
+        height = int(args['height'])
+        node_url = args['node_url']
+    except (KeyError, TypeError, ValueError):
+        return jsonify(message="Not all fields are present"), 408
+    if block.hash() != args.get('hash'):
+        return jsonify(message="Block does not match its hash"), 408
+    snapshot = chain_state.snapshot
+    extends_tip = height == snapshot.height and block.prev_hash == snapshot.tip_hash
+    if not extends_tip and not chain_wins(height + 1, block.hash(), snapshot.height, snapshot.tip_hash):
+        #  Their chain would not take over ours, see takes_over
+        return jsonify(message="We are not willing to take your block"), 407
+    if extends_tip:
+        #  Signatures are the expensive part, so they are checked before taking the lock
+        if not block.is_valid(target=MAX_TARGET):
+            return jsonify(message="Invalid block"), 408
+        with chain_state.write() as my_chain:
+            if block.prev_hash == my_chain.tip_hash():
+                if not my_chain.valid_next_block(block, check_signatures=False):
+                    return jsonify(message="Invalid block"), 408
+                my_chain.add_block(block)
+                tip_moved()
+                return jsonify(message="Success! We have added your block to our chain"), 200
+    #  We are missing blocks before this one, it is on another fork, it beats our tip, or our tip moved meanwhile
+    message, status = sync_chain(node_url, height + 1)
+    return jsonify(message=message), status
+
+
+def sync_chain(node_url, length):
+    """
+    Downloads the chain of a peer that is ahead of ours and considers it
+
+    The download extends a copy of our chain, so no lock is held while the
+    peers are asked. Only a peer we already know of is asked first for the
+    headers, any other url a poster names is ignored.
+
+    Args:
+        :param node_url: url of the peer that announced a block we could not add
+        :param length: length of the peer's chain up to that block, nothing past it is downloaded
+    Returns:
+        :return: (message, status code) to answer the peer with
+    """
+    known = list(NODES)
+    nodes = [node for node in known if node != node_url]
+    if node_url in known:
+        nodes.insert(0, node_url)
+    if not nodes:
+        return "Could not sync with you", 408
+    snapshot = chain_state.snapshot
+    local = Blockchain(snapshot.view(), ledger=Ledger(deltas=dict(snapshot.deltas)))
+    synced = ChainSync(local, nodes, length).run()
+    if synced is None:
+        return "Could not sync with you", 408
+    #  Blocks past the fork were checked one by one as they were added, signatures included
+    return consider_chain(synced, signatures_checked=True)
+
+
+def consider_chain(other, signatures_checked=False):
+    """
+    Replaces our chain with other if it is valid and wins the fork choice of takes_over
+
+    Only the blocks of other after the point where it forks from our chain
+    are validated, on top of our balances at that point. The fork choice
+    comes first, so a chain that is too short costs no validation at all.
+
+    Args:
+        :param other: Blockchain received from a peer
+        :param signatures_checked: True if every block of other past our chain had its signatures checked
+    Returns:
+        :return: (message, status code) to answer the peer with
+    """
+    if not other.chain:
+        return "Invalid Blockchain", 408
+    snapshot = chain_state.snapshot
+    if not takes_over(other.chain, snapshot.height, snapshot.tip_hash):
+        return "We are not willing to take your chain", 407
+    #  Signatures are the expensive part, so they are checked before taking the lock
+    checked = len(other.chain) if signatures_checked else common_prefix_length(snapshot.view(), other.chain)
+    invalid = other.invalid_signature(checked)
+    if invalid is not None:
+        return f"Invalid signature in {invalid}", 408
+    with chain_state.write() as my_chain:
+        if not takes_over(other.chain, len(my_chain.chain), my_chain.tip_hash()):
+            return "We are not willing to take your chain", 407
+        ancestor = common_prefix_length(my_chain.chain, other.chain)
+        if ancestor < checked and not signatures_checked:
+            #  Our chain was replaced meanwhile and other now forks from it earlier
+            invalid = other.invalid_signature(ancestor, checked)
+            if invalid is not None:
+                return f"Invalid signature in {invalid}", 408
+        if not other.is_valid(check_signatures=False, start=ancestor, ledger=my_chain.fork_ledger(ancestor)):
+            return "Invalid Blockchain", 408
+        my_chain.replace_chain(other.chain)
+        tip_moved()
+    return "Success! We have replaced our chain with yours", 200
+
+
+def queue_block():
+    """
+    Hands a template of our next block to the mining worker, if the pending
+    transactions that can still be afforded pay enough fees for one
+
+    Returns:
+        :return: if a template was queued
+    """
+    with chain_state.write() as my_chain:
+        transactions = my_chain.transactions.assemble(my_chain.balance)
+        if sum([transaction.fee for transaction in transactions]) < TOTAL_TRANSACTION_FEE:
+            return False
+        mining_worker.submit(Block(prev_hash=my_chain.tip_hash(),
+                                   miner=me,
+                                   transactions=transactions,
+                                   time=my_chain.next_time()),
+                             my_chain.next_target())
+        return True
+
+
+def tip_moved():
+    """
+    Abandons the block being mined on our old tip and starts over on the new one
+    """
+    mining_worker.cancel()
+    queue_block()
+
+
+def is_current(block):
+    return block.prev_hash == chain_state.snapshot.tip_hash
+
+
+def commit_block(block):
+    """
+    Adds a block the mining worker finished to our chain and announces it
+
+    Args:
+        :param block: mined, unsigned Block
+    """
+    with chain_state.write() as my_chain:
+        if block.prev_hash != my_chain.tip_hash():
+            #  Our tip moved while the block was being mined
+            return
+        me.sign(block)
+        my_chain.add_block(block)
+        height = len(my_chain.chain) - 1
+        queue_block()
+    from blockchain.views.client import log_answer
+    broadcast([node for node in NODES if node != app.config['MY_URL']],
+              'accept_block',
+              to_json({'block': to_dict(block),
+                       'hash': block.hash(),
+                       'height': height,
+                       'node_url': app.config['MY_URL']}),
+              on_answer=log_answer)
+
+
+mining_worker = MiningWorker(commit_block, is_current)
@@ -1,36 +1,25 @@
 from flask import render_template, redirect, flash, session
-from requests.exceptions import MissingSchema
 
 from blockchain import *
 from blockchain.classes import *
+from blockchain.gossip import broadcast
 from blockchain.forms import TransactionForm, ClaimForm
 from blockchain.views.api import find_user
 
 
+def log_answer(node, status, message):
+    log.append({'message': message, 'time': timestamp()})
+
+
 def spread_message(api_url, json_data, success_url, fail_url, include_self=True):
-    acceptance = {'yes': 0, 'no': 0}
-    # All this adding and removing is necessary for error handling
-    add_node(app.config['MY_URL'])
-    NODES.remove(app.config['MY_URL'])
-    if include_self:
-        add_node(app.config['MY_URL'])
-    for node in NODES:
-        try:
-            r = requests.post(f'{node}/api/{api_url}', json=json_data)
-            response = r.json()
-            log.append({'message': response['message'], 'time': timestamp()})
-            if r.status_code == 200:
-                acceptance['yes'] += 1
-            else:
-                acceptance['no'] += 1
-        except (MissingSchema, ValueError) as e:
-            pass
     add_node(app.config['MY_URL'])
-    if acceptance['yes'] > acceptance['no']:
+    nodes = [node for node in NODES if include_self or node != app.config['MY_URL']]
+    yes, no, reason = broadcast(nodes, api_url, json_data, on_answer=log_answer)
+    if yes > no:
         flash('Success!', 'success')
         return redirect(success_url)
     else:
-        flash('The majority did not accept. Your reason: ' + log[-1]['message'], 'danger')
+        flash('The majority did not accept. Your reason: ' + (reason or 'no node answered'), 'danger')
         return redirect(fail_url)
 
 
@@ -51,7 +40,7 @@ def base_reward():
 @app.route('/', methods=['GET'])
 @app.route('/index', methods=['GET'])
 def index():
-    return render_template('index.html', selected='home', blocks=my_chain.chain)
+    return render_template('index.html', selected='home')
 
 
 @app.route('/claim', methods=['GET', "POST"])
@@ -92,7 +81,7 @@ def submit():
             return redirect('/submit')
         else:
             fields['sender'] = to_dict(sender)
-            sender.private_key = form.s_private_key.data.encode().decode('unicode_escape')
+            sender = replace(sender, private_key=form.s_private_key.data.encode().decode('unicode_escape'))
         recipient = find_user(form.recipient_public_key.data.encode().decode('unicode_escape'))
         if not recipient:
             flash('Recipient does not exist', 'danger')
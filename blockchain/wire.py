@@ -0,0 +1,219 @@
+import json
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from blockchain.chain_settings import *
+from blockchain.classes import registry, to_dict
+from blockchain.metrics import timed
+
+#  Content type of messages in the binary format
+BINARY = 'application/x-blockchain'
+JSON = 'application/json'
+
+MAGIC = b'BC\x01'
+COMPRESSIONS = {None: 0, 'zlib': 1, 'zstd': 2}
+
+NONE, FALSE, TRUE, INT, FLOAT, STR, HEX, LIST, DICT, USER = range(10)
+DOUBLE = struct.Struct('>d')
+USER_FIELDS = {'alias', 'hashed_id', 'public_key', 'private_key'}
+
+
+class UnknownReference(ValueError):
+    """
+    A message referred to a user this node does not know
+    """
+
+
+def _varint(value, out):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _is_hex(string):
+    #  Only strings that come back exactly from bytes.hex() can be sent as bytes
+    if len(string) < 32 or len(string) % 2:
+        return False
+    try:
+        return bytes.fromhex(string).hex() == string
+    except ValueError:
+        return False
+
+
+def _encode(value, out):
+    if value is None:
+        out.append(NONE)
+    elif value is True or value is False:
+        out.append(TRUE if value else FALSE)
+    elif type(value) is int:
+        out.append(INT)
+        _varint(value << 1 if value >= 0 else (-value << 1) - 1, out)
+    elif type(value) is float:
+        out.append(FLOAT)
+        out += DOUBLE.pack(value)
+    elif type(value) is str:
+        if _is_hex(value):
+            raw = bytes.fromhex(value)
+            out.append(HEX)
+        else:
+            raw = value.encode()
+            out.append(STR)
+        _varint(len(raw), out)
+        out += raw
+    elif type(value) is dict:
+        reference = None
+        if value.keys() == USER_FIELDS and value['private_key'] is None:
+            reference = registry.reference(value['public_key'], value['alias'], value['hashed_id'])
+        if reference is not None:
+            out.append(USER)
+            out += reference
+            return
+        out.append(DICT)
+        _varint(len(value), out)
+        for key, item in value.items():
+            raw = key.encode()
+            _varint(len(raw), out)
+            out += raw
+            _encode(item, out)
+    elif type(value) in (list, tuple):
+        out.append(LIST)
+        _varint(len(value), out)
+        for item in value:
+            _encode(item, out)
+    else:
+        raise TypeError(f'Cannot encode {type(value).__name__}')
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def take(self, size):
+        start = self.position
+        self.position += size
+        if self.position > len(self.data):
+            raise ValueError('Message ends early')
+        return self.data[start:self.position]
+
+    def varint(self):
+        value, shift = 0, 0
+        while True:
+            byte = self.take(1)[0]
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def value(self):
+        tag = self.take(1)[0]
+        if tag == NONE:
+            return None
+        if tag == FALSE:
+            return False
+        if tag == TRUE:
+            return True
+        if tag == INT:
+            value = self.varint()
+            return value >> 1 if not value & 1 else -((value + 1) >> 1)
+        if tag == FLOAT:
+            return DOUBLE.unpack(self.take(DOUBLE.size))[0]
+        if tag == STR:
+            return self.take(self.varint()).decode()
+        if tag == HEX:
+            return self.take(self.varint()).hex()
+        if tag == LIST:
+            return [self.value() for _ in range(self.varint())]
+        if tag == DICT:
+            result = dict()
+            for _ in range(self.varint()):
+                key = self.take(self.varint()).decode()
+                result[key] = self.value()
+            return result
+        if tag == USER:
+            user = registry.find_by_reference(self.take(8))
+            if not user:
+                raise UnknownReference('Unknown user reference')
+            return to_dict(user)
+        raise ValueError(f'Unknown tag {tag}')
+
+
+@timed('blockchain_wire_encode_seconds', 'Writing a message in the binary format')
+def encode(message, compression=WIRE_COMPRESSION):
+    """
+    Writes a message of json compatible builtins in the binary format
+
+    Users the registry knows are replaced by an 8 byte reference to their key,
+    and hex strings such as hashes and signatures are written as raw bytes.
+    Messages of at least WIRE_COMPRESS_MIN bytes are compressed.
+
+    Args:
+        :param message: dictionaries, lists, strings, numbers, booleans and None
+        :param compression: None, 'zlib' or 'zstd' (falls back to zlib if zstandard is not installed)
+    Returns:
+        :return: bytes of the message
+    """
+    out = bytearray()
+    _encode(message, out)
+    if compression == 'zstd' and zstandard is None:
+        compression = 'zlib'
+    if len(out) < WIRE_COMPRESS_MIN:
+        compression = None
+    if compression == 'zlib':
+        out = zlib.compress(bytes(out))
+    elif compression == 'zstd':
+        out = zstandard.ZstdCompressor().compress(bytes(out))
+    return MAGIC + bytes([COMPRESSIONS[compression]]) + bytes(out)
+
+
+@timed('blockchain_wire_decode_seconds', 'Reading a message in the binary format')
+def decode(data):
+    """
+    Args:
+        :param data: bytes written by encode
+    Returns:
+        :return: the message as json compatible builtins
+    """
+    if data[:len(MAGIC)] != MAGIC or len(data) <= len(MAGIC):
+        raise ValueError('Not a binary message')
+    compression, body = data[len(MAGIC)], data[len(MAGIC) + 1:]
+    if compression == COMPRESSIONS['zlib']:
+        body = zlib.decompress(body)
+    elif compression == COMPRESSIONS['zstd']:
+        if zstandard is None:
+            raise ValueError('zstandard is not installed')
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif compression != COMPRESSIONS[None]:
+        raise ValueError('Unknown compression')
+    reader = _Reader(body)
+    message = reader.value()
+    if reader.position != len(body):
+        raise ValueError('Trailing bytes after message')
+    return message
+
+
+def loads(body, content_type):
+    """
+    Reads a message in either format
+
+    JSON messages from older nodes are a json string holding the json of the
+    message, so a string is decoded a second time.
+
+    Args:
+        :param body: bytes of the message
+        :param content_type: Content-Type it was sent with
+    Returns:
+        :return: the message as json compatible builtins
+    """
+    if content_type is not None and content_type.split(';')[0].strip() == BINARY:
+        return decode(body)
+    message = json.loads(body)
+    if isinstance(message, str):
+        message = json.loads(message)
+    return message
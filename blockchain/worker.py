@@ -0,0 +1,86 @@
+from queue import Queue, Empty
+from threading import Thread, Event, Lock
+import traceback
+
+from blockchain.difficulty import INITIAL_TARGET
+
+
+class MiningWorker:
+    """
+    Thread that mines block templates one at a time, off the request threads
+
+    Templates are taken from a queue. When several are waiting only the newest
+    is mined, since it was assembled from the latest tip and mempool. Mining can
+    be cancelled, e.g. because a competing block or chain moved our tip, and the
+    worker then goes on with the next template. A cancel also drops every
+    template queued before it, even one the worker has taken but not started
+    on yet, so no cancel is ever lost.
+
+    Attributes:
+        commit: called with each mined block, from the worker thread
+        current: called with a template before mining it, templates it returns False for are dropped
+    """
+
+    def __init__(self, commit, current=lambda block: True):
+        self.commit = commit
+        self.current = current
+        self._templates = Queue()
+        self._cancel = Event()
+        self._lock = Lock()
+        self._generation = 0
+        self._thread = None
+
+    def submit(self, block, target=INITIAL_TARGET):
+        """
+        Queues a block template, starting the worker thread if needed
+
+        Args:
+            :param block: unmined Block
+            :param target: proof of work target of the height the block is for
+        """
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='mining', daemon=True)
+            self._thread.start()
+        with self._lock:
+            self._templates.put((block, target, self._generation))
+
+    def cancel(self):
+        """
+        Abandons the block being mined, if any, and the templates queued so far
+        """
+        with self._lock:
+            self._generation += 1
+            self._cancel.set()
+
+    def busy(self):
+        """
+        :return: if a template is queued or being mined
+        """
+        return self._templates.unfinished_tasks > 0
+
+    def _newest(self):
+        template = self._templates.get()
+        while True:
+            try:
+                newer = self._templates.get_nowait()
+            except Empty:
+                return template
+            self._templates.task_done()
+            template = newer
+
+    def _run(self):
+        while True:
+            block, target, generation = self._newest()
+            with self._lock:
+                #  Checked together with the clear, so a cancel either drops this template or stops its mining
+                cancelled = generation != self._generation
+                if not cancelled:
+                    self._cancel.clear()
+            try:
+                if not cancelled and self.current(block) and block.mine(self._cancel, target):
+                    self.commit(block)
+            except Exception:
+                #  Keep the thread alive for the next template
+                traceback.print_exc()
+            finally:
+                self._templates.task_done()
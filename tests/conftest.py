@@ -0,0 +1,90 @@
+"""
+Sets up a throwaway project directory before blockchain is imported
+
+Importing blockchain reads me.json, users.json and nodes.json from the
+working directory, so they are written to a temporary directory when the
+session starts, before any test module is collected. The keys are small so
+the tests do not spend their time generating them.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+from Cryptodome.Hash import SHA3_512
+from Cryptodome.PublicKey import RSA
+import pytest
+
+NUM_USERS = 4
+TEST_KEY_BITS = 1024
+INITIAL_BALANCE = 10 ** 6
+
+PROJECT = tempfile.mkdtemp(prefix='blockchain-tests-')
+
+
+def _write_project(directory):
+    users = []
+    for index in range(NUM_USERS):
+        key = RSA.generate(TEST_KEY_BITS)
+        users.append({'alias': f'test{index}',
+                      'hashed_id': SHA3_512.new(f'test{index}'.encode()).hexdigest(),
+                      'public_key': key.publickey().export_key().decode(),
+                      'private_key': key.export_key().decode(),
+                      'initial_balance': INITIAL_BALANCE})
+    with open(os.path.join(directory, 'me.json'), 'w') as f:
+        json.dump(users[0], f)
+    with open(os.path.join(directory, 'users.json'), 'w') as f:
+        json.dump([dict(user, private_key=None) for user in users], f)
+    with open(os.path.join(directory, 'nodes.json'), 'w') as f:
+        json.dump([], f)
+    return users
+
+
+USER_DICTS = []
+
+
+def pytest_sessionstart(session):
+    USER_DICTS.extend(_write_project(PROJECT))
+    os.environ['BLOCKCHAIN_START_FROM_BOOTNODE'] = '0'
+    os.environ['BLOCKCHAIN_STORE_DIR'] = os.path.join(PROJECT, 'blocks')
+    os.chdir(PROJECT)
+    #  Run the miners and verifiers in processes even on a machine with one cpu. Like the node,
+    #  they are forked while no other thread is running, the miners before the verifiers
+    from blockchain import miner, verifier
+    miner.start_miners(2)
+    verifier.start_pool(2)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    from blockchain import verifier
+    if verifier._pool is not None:
+        verifier._pool.terminate()
+    shutil.rmtree(PROJECT, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def signers():
+    """
+    :return: list of Users that can sign, each known to the registry with INITIAL_BALANCE
+    """
+    from blockchain.classes import user_from_dict
+    return [user_from_dict(user) for user in USER_DICTS]
+
+
+@pytest.fixture
+def make_chain(signers):
+    """
+    :return: function from (number of blocks, transactions per block, offset) to a valid Blockchain
+    """
+    from blockchain.classes import Blockchain
+    from benchmarks.synthetic import signed_transactions, mined_block
+
+    def make(num_blocks, per_block=2, start=0, base=None):
+        blockchain = Blockchain(list(base.chain)) if base is not None else Blockchain()
+        for height in range(len(blockchain.chain), num_blocks):
+            transactions = signed_transactions(signers, per_block, start + height * per_block)
+            blockchain.add_block(mined_block(signers, blockchain.tip_hash(), transactions,
+                                             (start + height) % len(signers), blockchain.next_target()))
+        return blockchain
+
+    return make
@@ -0,0 +1,131 @@
+from urllib.parse import quote
+
+import pytest
+
+import blockchain.views.api as api
+from blockchain.serializer import to_dict, to_json
+from blockchain.state import ChainState
+from benchmarks.synthetic import mined_block, signed_transactions
+
+
+@pytest.fixture
+def node(make_chain, monkeypatch):
+    """
+    :return: (Flask test client, Blockchain) of a node serving a short chain of its own
+    """
+    blockchain = make_chain(5)
+    blockchain.build_index()
+    monkeypatch.setattr(api, 'chain_state', ChainState(blockchain))
+    return api.app.test_client(), blockchain
+
+
+def test_chain_pages_cover_the_whole_chain(node):
+    client, blockchain = node
+    blocks, from_height = [], 0
+    while from_height is not None:
+        page = client.get('/api/chain', query_string={'from_height': from_height, 'limit': 2}).get_json()
+        assert page['height'] == len(blockchain.chain)
+        assert 0 < len(page['chain']) <= 2
+        blocks.extend(page['chain'])
+        from_height = page['next_height']
+    assert blocks == to_dict(blockchain.chain)
+    past_the_tip = client.get('/api/chain', query_string={'from_height': 10, 'limit': 2}).get_json()
+    assert past_the_tip['chain'] == [] and past_the_tip['next_height'] is None
+
+
+@pytest.mark.parametrize('path', ['/api/chain', '/api/headers', '/api/blocks'])
+@pytest.mark.parametrize('arguments', [{'limit': 0}, {'limit': -1}, {'from_height': -1}, {'limit': 'two'}])
+def test_bad_ranges_are_rejected(node, path, arguments):
+    client, _ = node
+    r = client.get(path, query_string=arguments)
+    assert r.status_code == 408
+    assert 'message' in r.get_json()
+
+
+def test_transactions_are_found_by_hash(node, signers):
+    client, blockchain = node
+    height = 2
+    transaction = blockchain.chain[height].transactions[1]
+    found = client.get(f'/api/tx/{transaction.hash()}').get_json()
+    assert found['status'] == 'confirmed'
+    assert (found['height'], found['position']) == (height, 1)
+    assert found['block_hash'] == blockchain.chain[height].hash()
+    assert found['confirmations'] == len(blockchain.chain) - height
+    assert found['transaction'] == to_dict(transaction)
+    block = client.get(f'/api/block/{blockchain.chain[height].hash()}').get_json()
+    assert block['height'] == height
+
+    pending = signed_transactions(signers, 1, 900)[0]
+    assert client.get(f'/api/tx/{pending.hash()}').status_code == 408
+    with api.chain_state.write() as my_chain:
+        my_chain.transactions.add(pending)
+    found = client.get(f'/api/tx/{pending.hash()}').get_json()
+    assert found == {'status': 'pending', 'transaction': to_dict(pending)}
+    assert client.get('/api/block/unknown').status_code == 408
+
+
+def test_address_history_lists_every_transaction_of_the_key_in_order(node, signers):
+    client, blockchain = node
+    public_key = signers[1].public_key
+    expected = [(height, position)
+                for height, block in enumerate(blockchain.chain)
+                for position, transaction in enumerate(block.transactions)
+                if public_key in (transaction.sender.public_key, transaction.recipient.public_key)]
+    assert expected
+    history = client.get(f'/api/address/{quote(public_key, safe="")}/history').get_json()
+    assert [(entry['height'], entry['position']) for entry in history] == expected
+    assert all(entry['block_hash'] == blockchain.chain[entry['height']].hash() for entry in history)
+    assert client.get(f'/api/address/{quote("unknown key", safe="")}/history').get_json() == []
+
+
+def announce(client, block, height, block_hash=None):
+    return client.post('/api/accept_block', content_type='application/json',
+                       data=to_json({'block': to_dict(block),
+                                     'hash': block.hash() if block_hash is None else block_hash,
+                                     'height': height,
+                                     'node_url': 'http://unknown.invalid'}))
+
+
+def next_block(signers, blockchain, prev_hash=None, start=1100):
+    return mined_block(signers, blockchain.tip_hash() if prev_hash is None else prev_hash,
+                       signed_transactions(signers, 2, start), 1, blockchain.next_target())
+
+
+def test_a_block_on_our_tip_is_added(node, signers):
+    client, blockchain = node
+    height = len(blockchain.chain)
+    block = next_block(signers, blockchain)
+    assert announce(client, block, height).status_code == 200
+    assert api.chain_state.snapshot.height == height + 1
+    assert api.chain_state.snapshot.tip_hash == block.hash()
+    #  Announcing it again is a block of a chain no longer than ours
+    assert announce(client, block, height).status_code == 407
+
+
+def test_bad_announcements_are_rejected(node, signers):
+    client, blockchain = node
+    height = len(blockchain.chain)
+    block = next_block(signers, blockchain)
+    assert announce(client, block, height, block_hash='0' * 128).status_code == 408
+    assert client.post('/api/accept_block', content_type='application/json',
+                       data=to_json({'block': to_dict(block), 'hash': block.hash()})).status_code == 408
+    block.signature = blockchain.chain[-1].signature
+    assert announce(client, block, height).status_code == 408
+    assert api.chain_state.snapshot.height == height
+
+
+def test_blocks_of_other_chains_follow_the_fork_choice(node, signers):
+    client, blockchain = node
+    height = len(blockchain.chain)
+    #  A block of a shorter chain is refused without asking anyone
+    shorter = next_block(signers, blockchain, prev_hash=blockchain.chain[-3].hash())
+    assert announce(client, shorter, height - 2).status_code == 407
+    #  An equally long chain only has to be synced if its tip wins the tie
+    rival = next_block(signers, blockchain, prev_hash=blockchain.chain[-2].hash())
+    status = announce(client, rival, height - 1).status_code
+    assert status == (408 if rival.hash() < blockchain.tip_hash() else 407)
+    #  A block past our tip needs the blocks before it, which no known peer has here
+    ahead = next_block(signers, blockchain, prev_hash='0' * 128)
+    r = announce(client, ahead, height + 1)
+    assert r.status_code == 408 and r.get_json()['message'] == "Could not sync with you"
+    assert api.chain_state.snapshot.tip_hash == blockchain.tip_hash()
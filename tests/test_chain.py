@@ -0,0 +1,92 @@
+import pytest
+
+from blockchain.classes import Blockchain, takes_over
+from blockchain.index import ChainIndex
+from blockchain.store import BlockStore, blockchain_from_store
+
+
+def assert_matches_fresh_build(blockchain):
+    fresh = Blockchain(list(blockchain.chain))
+    fresh.build_index()
+    #  Rolling back can leave balances that changed by nothing in the ledger
+    assert {key: delta for key, delta in blockchain._ledger.deltas.items() if delta} == \
+           {key: delta for key, delta in fresh._ledger.deltas.items() if delta}
+    assert blockchain.compute_balances() == fresh.compute_balances()
+    assert blockchain._index.blocks == fresh._index.blocks
+    assert blockchain._index.transactions == fresh._index.transactions
+    assert blockchain._index.addresses == fresh._index.addresses
+    assert len(blockchain._index) == len(blockchain.chain)
+    assert [blockchain.target(height) for height in range(len(blockchain.chain) + 1)] == \
+           [fresh.target(height) for height in range(len(fresh.chain) + 1)]
+
+
+@pytest.fixture
+def ours_and_theirs(make_chain):
+    ours = make_chain(6)
+    ours.build_index()
+    theirs = make_chain(8, start=100, base=Blockchain(list(ours.chain[:3])))
+    return ours, theirs
+
+
+def test_replace_chain(ours_and_theirs):
+    ours, theirs = ours_and_theirs
+    dropped = ours.chain[3:]
+    ours.replace_chain(theirs.chain)
+    assert [block.hash() for block in ours.chain] == [block.hash() for block in theirs.chain]
+    assert_matches_fresh_build(ours)
+    #  Transactions of the dropped blocks are pending again
+    assert all(transaction in ours.transactions for block in dropped for transaction in block.transactions)
+    assert ours.is_valid()
+
+
+def test_replace_chain_back_and_forth(ours_and_theirs):
+    ours, theirs = ours_and_theirs
+    original = list(ours.chain)
+    ours.replace_chain(theirs.chain)
+    ours.replace_chain(original)
+    assert_matches_fresh_build(ours)
+    assert ours.tip_hash() == original[-1].hash()
+
+
+def test_replace_stored_chain(tmp_path, ours_and_theirs):
+    ours, theirs = ours_and_theirs
+    stored = Blockchain()
+    stored.attach(BlockStore(str(tmp_path)))
+    stored.build_index()
+    for block in ours.chain:
+        stored.add_block(block)
+    stored.replace_chain(theirs.chain)
+    assert_matches_fresh_build(stored)
+    restarted = blockchain_from_store(BlockStore(str(tmp_path)))
+    assert restarted.tip_hash() == theirs.tip_hash()
+    assert_matches_fresh_build(restarted)
+
+
+def test_index_truncate_matches_fresh_index(ours_and_theirs):
+    ours, _ = ours_and_theirs
+    index = ChainIndex(ours.chain)
+    index.truncate(2, ours.chain)
+    fresh = ChainIndex(ours.chain[:2])
+    assert (index.blocks, index.transactions, index.addresses) == (fresh.blocks, fresh.transactions, fresh.addresses)
+
+
+
+def test_takes_over(ours_and_theirs):
+    ours, theirs = ours_and_theirs
+    assert takes_over(theirs.chain, len(ours.chain), ours.tip_hash())
+    assert not takes_over(ours.chain, len(theirs.chain), theirs.tip_hash())
+    #  Between chains of the same length the lower tip hash wins, so exactly one of them does
+    same_length = theirs.chain[:len(ours.chain)]
+    assert takes_over(same_length, len(ours.chain), ours.tip_hash()) != \
+           takes_over(ours.chain, len(same_length), same_length[-1].hash())
+    assert not takes_over(ours.chain, len(ours.chain), ours.tip_hash())
+
+
+def test_no_tie_break_when_a_chain_has_to_be_several_blocks_longer(ours_and_theirs, monkeypatch):
+    monkeypatch.setattr('blockchain.classes.LENGTH_DIFFERENCE', 2)
+    ours, theirs = ours_and_theirs
+    assert not takes_over(theirs.chain[:len(ours.chain) + 1], len(ours.chain), ours.tip_hash())
+    assert takes_over(theirs.chain, len(ours.chain), ours.tip_hash())
+    same_length = theirs.chain[:len(ours.chain)]
+    assert not takes_over(same_length, len(ours.chain), ours.tip_hash())
+    assert not takes_over(ours.chain, len(same_length), same_length[-1].hash())
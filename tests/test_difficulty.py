@@ -0,0 +1,97 @@
+from itertools import count
+
+import pytest
+
+from blockchain.chain_settings import MAX_FUTURE_BLOCK_TIME, MAX_RETARGET_FACTOR, RETARGET_INTERVAL, TARGET_BLOCK_TIME
+from blockchain.classes import Block, Blockchain, timestamp
+from blockchain.difficulty import (INITIAL_TARGET, MAX_TARGET, TargetSchedule, median_time, meets_target,
+                                   retarget, time_valid)
+from benchmarks.synthetic import mined_block, signed_transactions
+
+EXPECTED = TARGET_BLOCK_TIME * (RETARGET_INTERVAL - 1)
+NOW = 10 ** 9
+
+
+def test_median_time():
+    assert median_time([]) is None
+    assert median_time([5]) == 5
+    assert median_time([9, 1, 5, 7, 3]) == 5
+    assert median_time([4, 1, 3, 2]) == 3
+
+
+def test_time_valid():
+    earlier = [NOW - 50, NOW - 40, NOW - 30]
+    assert time_valid(NOW - 40, earlier, NOW)
+    assert not time_valid(NOW - 41, earlier, NOW)
+    assert time_valid(NOW + MAX_FUTURE_BLOCK_TIME, earlier, NOW)
+    assert not time_valid(NOW + MAX_FUTURE_BLOCK_TIME + 1, earlier, NOW)
+    assert not time_valid(None, earlier, NOW)
+    assert time_valid(0, [], NOW)
+
+
+def test_retarget_follows_the_block_time_within_bounds():
+    target = MAX_TARGET // 64
+    assert retarget(target, EXPECTED) == target
+    assert retarget(target, EXPECTED // 2) == target // 2
+    assert retarget(target, EXPECTED * 2) == target * 2
+    assert retarget(target, 0) == target // MAX_RETARGET_FACTOR
+    assert retarget(target, -EXPECTED) == target // MAX_RETARGET_FACTOR
+    assert retarget(target, EXPECTED * 100) == target * MAX_RETARGET_FACTOR
+    #  Never easier than DIFFICULTY, never impossible
+    assert retarget(MAX_TARGET, EXPECTED * 2) == MAX_TARGET
+    assert retarget(1, 0) == 1
+
+
+@pytest.fixture
+def short_windows(monkeypatch):
+    monkeypatch.setattr('blockchain.difficulty.RETARGET_INTERVAL', 4)
+
+
+def test_schedule_retargets_each_window(short_windows):
+    times = {height: timestamp(NOW + height * TARGET_BLOCK_TIME) for height in range(8)}
+    #  The second window took half as long as it should have
+    times.update({height: timestamp(NOW + 4 * TARGET_BLOCK_TIME + (height - 4) * TARGET_BLOCK_TIME // 2)
+                  for height in range(4, 8)})
+    schedule = TargetSchedule(times.get)
+    assert [schedule.target(height) for height in range(4)] == [INITIAL_TARGET] * 4
+    assert schedule.target(4) == INITIAL_TARGET
+    assert schedule.target(8) == INITIAL_TARGET // 2
+    #  Cutting the chain back forgets the targets that depended on the cut blocks
+    times.update({height: timestamp(NOW + height * TARGET_BLOCK_TIME // 4) for height in range(4, 8)})
+    assert schedule.target(8) == INITIAL_TARGET // 2
+    schedule.truncate(6)
+    assert schedule.target(8) == INITIAL_TARGET // 4
+
+
+def easy_block(signers, blockchain):
+    #  Meets the initial target but not the target of the next height
+    block = Block(prev_hash=blockchain.tip_hash(), miner=signers[0].public_version(),
+                  transactions=signed_transactions(signers, 2, 1300), time=blockchain.next_time())
+    for nonce in count():
+        block.nonce = nonce
+        if not meets_target(block.digest(), blockchain.next_target()) and meets_target(block.digest(), INITIAL_TARGET):
+            signers[0].sign(block)
+            return block
+
+
+def test_chain_rejects_blocks_that_miss_the_target_of_their_height(make_chain, signers, short_windows):
+    #  make_chain mines its blocks within a second or two, far quicker than TARGET_BLOCK_TIME
+    blockchain = make_chain(5)
+    assert blockchain.next_target() == INITIAL_TARGET // MAX_RETARGET_FACTOR
+    assert blockchain.is_valid()
+    block = easy_block(signers, blockchain)
+    assert not blockchain.valid_next_block(block)
+    assert not Blockchain(blockchain.chain + [block]).is_valid()
+    block = mined_block(signers, blockchain.tip_hash(), signed_transactions(signers, 2, 1400), 0,
+                        blockchain.next_target())
+    assert blockchain.valid_next_block(block)
+
+
+def test_chain_rejects_blocks_before_the_median_time(make_chain, signers):
+    blockchain = make_chain(4)
+    early = Block(prev_hash=blockchain.tip_hash(), miner=signers[0].public_version(),
+                  transactions=signed_transactions(signers, 2, 1500), time=timestamp(NOW))
+    early.mine(target=blockchain.next_target())
+    signers[0].sign(early)
+    assert not blockchain.valid_next_block(early)
+    assert not Blockchain(blockchain.chain + [early]).is_valid()
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+
+from flask import Flask, jsonify, request
+import pytest
+from werkzeug.serving import make_server
+
+from blockchain import gossip, wire
+from blockchain.gossip import broadcast, new_session, post
+
+MESSAGE = json.dumps({'hello': 'peer'})
+
+
+class StandIn:
+    """
+    Flask app on a local port that answers posts the way it is told to
+
+    Attributes:
+        url: url the app is served on
+        received: Content-Type of every post it got
+        release: Event a slow stand-in waits on before answering
+    """
+
+    def __init__(self, status=200, slow=False, takes_binary=True):
+        self.received = []
+        self.release = threading.Event()
+        app = Flask(__name__)
+
+        @app.route('/api/<path:api_url>', methods=['POST'])
+        def answer(api_url):
+            self.received.append(request.headers.get('Content-Type'))
+            if slow:
+                self.release.wait(5)
+            if request.headers.get('Content-Type') == wire.BINARY and not takes_binary:
+                return jsonify(message='Unknown user reference'), 415
+            response = jsonify(message='Accepted' if status == 200 else 'Not willing')
+            response.headers['Accept-Post'] = f'{wire.BINARY}, {wire.JSON}'
+            return response, status
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.release.set()
+        self.server.shutdown()
+
+
+@pytest.fixture
+def peers(monkeypatch):
+    monkeypatch.setattr(gossip, 'BINARY_PEERS', set())
+    started = []
+
+    def start(**kwargs):
+        started.append(StandIn(**kwargs))
+        return started[-1]
+
+    yield start
+    for peer in started:
+        peer.stop()
+
+
+def test_post_reports_the_answer(peers):
+    accepting, rejecting = peers(), peers(status=407)
+    session = new_session()
+    assert post(accepting.url, 'block', MESSAGE, session=session) == (200, 'Accepted')
+    assert post(rejecting.url, 'block', MESSAGE, session=session) == (407, 'Not willing')
+    #  Both said they take the binary format
+    assert gossip.BINARY_PEERS == {accepting.url, rejecting.url}
+
+
+def test_post_to_unreachable_peer(peers):
+    gone = peers()
+    gone.stop()
+    assert post(gone.url, 'block', MESSAGE, timeout=1, session=new_session()) is None
+
+
+def test_binary_only_goes_to_peers_that_take_it(peers):
+    peer = peers()
+    session = new_session()
+    binary_data = wire.encode(json.loads(MESSAGE))
+    assert post(peer.url, 'block', MESSAGE, session=session, binary_data=binary_data) == (200, 'Accepted')
+    assert post(peer.url, 'block', MESSAGE, session=session, binary_data=binary_data) == (200, 'Accepted')
+    assert peer.received == [wire.JSON, wire.BINARY]
+
+
+def test_415_falls_back_to_json(peers):
+    peer = peers(takes_binary=False)
+    gossip.BINARY_PEERS.add(peer.url)
+    binary_data = wire.encode(json.loads(MESSAGE))
+    assert post(peer.url, 'block', MESSAGE, session=new_session(), binary_data=binary_data) == (200, 'Accepted')
+    assert peer.received == [wire.BINARY, wire.JSON]
+
+
+def test_broadcast_returns_once_a_majority_accepts(peers):
+    slow = peers(slow=True)
+    nodes = [peers().url, peers().url, slow.url]
+    answered = threading.Event()
+    answers = []
+
+    def on_answer(node, status, message):
+        answers.append(node)
+        if node == slow.url:
+            answered.set()
+
+    started = time.monotonic()
+    assert broadcast(nodes, 'block', MESSAGE, on_answer, session=new_session()) == (2, 0, None)
+    assert time.monotonic() - started < 2
+    assert slow.url not in answers
+    #  The slow post carries on and is still reported
+    slow.release.set()
+    assert answered.wait(5)
+    assert sorted(answers) == sorted(nodes)
+
+
+def test_broadcast_returns_once_half_reject(peers):
+    slow = [peers(slow=True), peers(slow=True)]
+    nodes = [peers(status=407).url, peers(status=407).url] + [peer.url for peer in slow]
+    started = time.monotonic()
+    assert broadcast(nodes, 'block', MESSAGE, session=new_session()) == (0, 2, 'Not willing')
+    assert time.monotonic() - started < 2
+
+
+def test_broadcast_does_not_count_peers_that_time_out(peers):
+    slow = peers(slow=True)
+    gone = peers()
+    gone.stop()
+    nodes = [peers().url, slow.url, gone.url]
+    started = time.monotonic()
+    assert broadcast(nodes, 'block', MESSAGE, timeout=0.5, session=new_session()) == (1, 0, None)
+    assert time.monotonic() - started < 2
@@ -0,0 +1,42 @@
+from Cryptodome.Hash import SHA3_512
+
+from blockchain.keys import KeyCache
+
+
+def test_each_key_is_parsed_once(signers):
+    keys = KeyCache()
+    first = keys.scheme(signers[0].public_key)
+    assert keys.scheme(signers[0].public_key) is first
+    keys.scheme(signers[1].public_key)
+    assert keys.stats() == {'hits': 1, 'misses': 2, 'keys': 2}
+
+
+def test_least_recently_used_key_is_evicted(signers):
+    keys = KeyCache(size=2)
+    first = keys.scheme(signers[0].public_key)
+    keys.scheme(signers[1].public_key)
+    keys.scheme(signers[0].public_key)
+    keys.scheme(signers[2].public_key)
+    assert keys.stats()['keys'] == 2
+    #  signers[1] was the least recently used, signers[0] is still cached
+    assert keys.scheme(signers[0].public_key) is first
+    misses = keys.misses
+    keys.scheme(signers[1].public_key)
+    assert keys.misses == misses + 1
+
+
+def test_invalidate_parses_the_key_again(signers):
+    keys = KeyCache()
+    first = keys.scheme(signers[0].public_key)
+    keys.invalidate(signers[0].public_key)
+    keys.invalidate(signers[1].public_key)
+    assert keys.scheme(signers[0].public_key) is not first
+    assert keys.stats() == {'hits': 0, 'misses': 2, 'keys': 1}
+
+
+def test_private_keys_sign_what_public_keys_verify(signers):
+    keys = KeyCache()
+    message = SHA3_512.new(b'message')
+    signature = keys.scheme(signers[0].private_key).sign(message)
+    keys.scheme(signers[0].public_key).verify(message, signature)
+    assert keys.stats()['keys'] == 2
@@ -0,0 +1,115 @@
+from blockchain.classes import Blockchain, Transaction, registry
+from blockchain.mempool import Mempool, cost
+from benchmarks.synthetic import mined_block
+
+
+def transaction(signers, sender, recipient, value, fee):
+    made = Transaction(sender=signers[sender].public_version(), recipient=signers[recipient].public_version(),
+                       value=value, fee=fee)
+    signers[sender].sign(made)
+    return made
+
+
+def test_add_keeps_fees_and_spend(signers):
+    first = transaction(signers, 0, 1, 10, 2)
+    second = transaction(signers, 0, 2, 5, 3)
+    third = transaction(signers, 1, 0, 7, 1)
+    pool = Mempool([first, second, third])
+    assert len(pool) == 3
+    assert pool.total_fees == 6
+    assert pool.spend(signers[0].public_key) == 20
+    assert pool.spend(signers[1].public_key) == 8
+    assert pool.spend(signers[2].public_key) == 0
+    assert list(pool) == [first, second, third]
+    assert pool.get(second.hash()) is second
+
+
+def test_add_twice_counts_once(signers):
+    pending = transaction(signers, 0, 1, 10, 2)
+    pool = Mempool([pending])
+    assert pool.add(pending) is False
+    assert pool.total_fees == 2
+    assert pool.spend(signers[0].public_key) == 12
+
+
+def test_sending_to_yourself_only_costs_the_fee(signers):
+    to_self = transaction(signers, 0, 0, 100, 4)
+    assert cost(to_self) == 4
+    assert Mempool([to_self]).spend(signers[0].public_key) == 4
+
+
+def test_remove_undoes_add(signers):
+    kept = transaction(signers, 0, 1, 10, 2)
+    removed = transaction(signers, 0, 2, 5, 3)
+    pool = Mempool([kept, removed])
+    pool.remove(removed)
+    pool.remove(removed)
+    assert removed not in pool
+    assert pool.total_fees == 2
+    assert pool.spend(signers[0].public_key) == 12
+    pool.remove(kept)
+    assert len(pool) == 0
+    assert pool.total_fees == 0
+    assert pool.spend(signers[0].public_key) == 0
+
+
+def test_remove_confirmed(signers, make_chain):
+    blockchain = make_chain(1, per_block=3)
+    extra = transaction(signers, 3, 2, 1, 1)
+    pool = Mempool(blockchain.chain[0].transactions + [extra])
+    pool.remove_confirmed(blockchain.chain)
+    assert list(pool) == [extra]
+    assert pool.total_fees == extra.fee
+
+
+def test_assemble_takes_best_fee_rate_first_and_skips_what_cannot_be_paid(signers):
+    cheap = transaction(signers, 0, 1, 10, 1)
+    dear = transaction(signers, 1, 2, 10, 50)
+    unaffordable = transaction(signers, 2, 3, 1000, 2)
+    pool = Mempool([cheap, dear, unaffordable])
+    balances = {signers[0].public_key: 100, signers[1].public_key: 100, signers[2].public_key: 100}
+    assert pool.assemble(balances.get) == [dear, cheap]
+    #  The picked transactions stay pending, the one that cannot be paid for is dropped
+    assert list(pool) == [cheap, dear]
+    assert pool.total_fees == 51
+    assert pool.spend(signers[2].public_key) == 0
+    assert pool.assemble(balances.get, limit=1) == [dear]
+    assert len(pool) == 2
+
+
+def test_evict_unaffordable_keeps_the_best_paying(signers):
+    first = transaction(signers, 0, 1, 40, 1)
+    best = transaction(signers, 0, 2, 40, 9)
+    last = transaction(signers, 0, 3, 40, 1)
+    other = transaction(signers, 1, 2, 500, 1)
+    pool = Mempool([first, best, last, other])
+    balances = {signers[0].public_key: 95, signers[1].public_key: 10}
+    assert pool.evict_unaffordable(balances.get, [signers[0].public_key]) == [last]
+    assert list(pool) == [first, best, other]
+    assert pool.spend(signers[0].public_key) == 90
+    assert pool.evict_unaffordable(balances.get) == [other]
+    assert pool.spend(signers[1].public_key) == 0
+
+
+def test_reorg_evicts_what_senders_can_no_longer_afford(signers):
+    sender = signers[1].public_key
+    start = registry.initial_balance(sender)
+    ours = Blockchain()
+    gift = transaction(signers, 0, 1, start // 2, 1)
+    ours.add_block(mined_block(signers, ours.tip_hash(), [gift], 3, ours.next_target()))
+    #  Only affordable thanks to the gift
+    spend_gift = transaction(signers, 1, 2, start + start // 4, 1)
+    ours.add_block(mined_block(signers, ours.tip_hash(), [spend_gift], 3, ours.next_target()))
+    theirs = Blockchain()
+    for value in range(1, 4):
+        theirs.add_block(mined_block(signers, theirs.tip_hash(), [transaction(signers, 2, 3, value, 1)], 3,
+                                     theirs.next_target()))
+    ours.replace_chain(theirs.chain)
+    pool = ours.transactions
+    assert gift in pool
+    assert spend_gift not in pool
+    assert pool.spend(sender) == 0
+    assert pool.total_fees == gift.fee
+    #  The sender can still send what their confirmed balance covers
+    small = transaction(signers, 1, 2, 10, 1)
+    assert ours.balance(sender) - pool.spend(sender) >= cost(small)
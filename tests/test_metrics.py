@@ -0,0 +1,55 @@
+import pytest
+
+from blockchain import metrics
+from blockchain.metrics import Counter, Histogram
+from blockchain.serializer import to_json
+from blockchain.views.api import app
+from benchmarks.synthetic import signed_transactions
+
+
+def test_counter_counts_per_label():
+    count = Counter('test_requests_total', 'Requests')
+    count.inc(endpoint='b')
+    count.inc(endpoint='a')
+    count.inc(2, endpoint='a')
+    assert count.render() == ['# HELP test_requests_total Requests',
+                              '# TYPE test_requests_total counter',
+                              'test_requests_total{endpoint="a"} 3',
+                              'test_requests_total{endpoint="b"} 1']
+
+
+def test_histogram_buckets_are_cumulative():
+    seconds = Histogram('test_seconds', 'Durations', buckets=(0.1, 1))
+    for value in [0.05, 0.1, 0.5, 3]:
+        seconds.observe(value)
+    assert seconds.render()[2:] == ['test_seconds_bucket{le="0.1"} 2',
+                                    'test_seconds_bucket{le="1"} 3',
+                                    'test_seconds_bucket{le="+Inf"} 4',
+                                    'test_seconds_sum 3.65',
+                                    'test_seconds_count 4']
+
+
+def test_time_observes_calls_that_raise(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS', dict())
+
+    @metrics.timed('test_call_seconds', 'Calls')
+    def fails():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        fails()
+    with metrics.histogram('test_call_seconds', 'Calls').time():
+        pass
+    assert list(metrics.METRICS) == ['test_call_seconds']
+    assert 'test_call_seconds_count 2' in metrics.render().splitlines()
+
+
+def test_metrics_are_served(signers):
+    to_json(signed_transactions(signers, 1)[0])
+    r = app.test_client().get('/api/metrics')
+    assert r.status_code == 200
+    assert r.mimetype == 'text/plain'
+    lines = r.get_data(as_text=True).splitlines()
+    assert any(line.startswith('blockchain_uptime_seconds ') for line in lines)
+    assert '# TYPE blockchain_serialize_seconds histogram' in lines
+    assert any(line.startswith('blockchain_serialize_seconds_count{type="Transaction"} ') for line in lines)
@@ -0,0 +1,64 @@
+import multiprocessing
+import threading
+
+from blockchain import miner
+from blockchain.classes import Block
+from blockchain.difficulty import meets_target
+from blockchain.miner import PARALLEL_MINING_TARGET, HashTemplate, mine, search
+from benchmarks.synthetic import signed_transactions
+
+
+def unmined_block(signers):
+    return Block(prev_hash='0', miner=signers[0].public_version(), transactions=signed_transactions(signers, 1))
+
+
+def test_template_digest_matches_block_hash(signers):
+    block = unmined_block(signers)
+    template = HashTemplate(block.signing_bytes().decode())
+    for nonce in [0, 1, 8, 9, 10, 99, 12345]:
+        template.seek(nonce)
+        block.nonce = nonce
+        assert template.digest() == block.digest()
+    #  Incrementing carries through the digits, including past all nines
+    template.seek(98)
+    for nonce in range(99, 1002):
+        template.increment()
+        assert template.nonce == nonce
+    block.nonce = 1001
+    assert template.digest() == block.digest()
+
+
+def test_search_finds_the_first_nonce_below_the_target(signers):
+    template = HashTemplate(unmined_block(signers).signing_bytes().decode())
+    target = miner.INITIAL_TARGET
+    nonce = search(template, target, 0, 10000)
+    assert nonce is not None
+    template.seek(nonce)
+    assert meets_target(template.digest(), target)
+    for earlier in range(nonce):
+        template.seek(earlier)
+        assert not meets_target(template.digest(), target)
+
+
+def test_mining_uses_the_processes_started_at_import(signers, monkeypatch):
+    assert len(miner._jobs) == 2
+
+    def no_fork(process):
+        raise AssertionError('mining must not fork')
+
+    monkeypatch.setattr(multiprocessing.process.BaseProcess, 'start', no_fork)
+    for _ in range(3):
+        block = unmined_block(signers)
+        assert block.mine(target=PARALLEL_MINING_TARGET)
+        assert block.difficulty_valid(PARALLEL_MINING_TARGET)
+
+
+def test_cancel_stops_the_search(signers):
+    cancel = threading.Event()
+    threading.Timer(0.3, cancel.set).start()
+    #  No digest is below 1, so only the cancel stops the search
+    assert mine(unmined_block(signers).signing_bytes().decode(), target=1, cancel=cancel) is None
+    #  The processes are free for the next block
+    block = unmined_block(signers)
+    assert block.mine(target=PARALLEL_MINING_TARGET)
+    assert block.difficulty_valid(PARALLEL_MINING_TARGET)
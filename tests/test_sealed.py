@@ -0,0 +1,96 @@
+import json
+import sys
+import threading
+
+import pytest
+
+from blockchain.classes import Block, Sealed, block_from_dict, to_dict, to_json
+from benchmarks.synthetic import signed_transactions
+
+
+def signed_block(signers, start=0):
+    block = Block(prev_hash='0', miner=signers[0].public_version(),
+                  transactions=signed_transactions(signers, 3, start))
+    signers[0].sign(block)
+    return block
+
+
+def test_signing_bytes_leave_out_the_signature(signers):
+    block = signed_block(signers)
+    unsigned = json.loads(to_json(block))
+    unsigned['signature'] = None
+    assert block.signing_bytes() == json.dumps(unsigned, sort_keys=True).encode()
+    assert block.signature is not None
+
+
+def test_hash_is_cached_and_dropped_when_a_field_changes(signers):
+    block = signed_block(signers)
+    first = block.hash()
+    assert block.hash() == first
+    assert block_from_dict(json.loads(to_json(block))).hash() == first
+    block.nonce += 1
+    assert block.hash() != first
+    #  The signature is not part of what is hashed
+    transaction = block.transactions[0]
+    hashed = transaction.hash()
+    transaction.signature = None
+    assert transaction.hash() == hashed
+
+
+@pytest.fixture
+def busy_switching():
+    #  Switch threads as often as possible so the hashing and reading threads interleave
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_signing_bytes_never_assign_the_signature(signers, monkeypatch):
+    block = signed_block(signers)
+    assigned = []
+    original = Sealed.__setattr__
+
+    def record(obj, name, value):
+        assigned.append(name)
+        original(obj, name, value)
+
+    block.unseal()
+    block.transactions[0].unseal()
+    monkeypatch.setattr(Sealed, '__setattr__', record)
+    block.hash()
+    block.transactions[0].hash()
+    assert 'signature' not in assigned
+
+
+def test_signature_survives_concurrent_hashing(signers, busy_switching):
+    block = signed_block(signers)
+    signature = block.signature.hex()
+    done = threading.Event()
+    seen = []
+
+    def hash_it():
+        for _ in range(300):
+            #  Drop the cached hash so every call serializes the block again
+            block.unseal()
+            block.transactions[0].unseal()
+            block.hash()
+            block.transactions[0].hash()
+
+    def read_it():
+        while not done.is_set():
+            seen.append(to_dict(block)['signature'])
+            seen.append(to_dict(block.transactions[0])['signature'])
+
+    hashers = [threading.Thread(target=hash_it) for _ in range(2)]
+    readers = [threading.Thread(target=read_it) for _ in range(2)]
+    for thread in readers + hashers:
+        thread.start()
+    for thread in hashers:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+    assert seen and None not in seen
+    assert block.signature.hex() == signature
+    assert json.loads(to_json(block))['signature'] == signature
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from blockchain.classes import Block, Blockchain, Transaction, User
+from blockchain.serializer import reflective_to_dict, to_bytes, to_dict, to_json, to_signing_bytes
+from benchmarks.synthetic import signed_transactions
+
+
+def canonical(obj):
+    #  What the reflective serializer wrote before the schemas
+    return json.dumps(reflective_to_dict(obj), sort_keys=True)
+
+
+@pytest.fixture
+def objects(signers, make_chain):
+    odd_user = User('ünïcode "alias"\n', 'hashed', signers[1].public_key, None)
+    odd_transaction = Transaction(sender=odd_user, recipient=signers[2].public_version(),
+                                  value=10 ** 30, fee=0, time=1234.5)
+    unsigned = Block(prev_hash='0', miner=signers[0].public_version(), transactions=signed_transactions(signers, 2))
+    blockchain = make_chain(3)
+    blockchain.transactions.add(signed_transactions(signers, 1, 500)[0])
+    return [signers[0], signers[0].public_version(), odd_user, odd_transaction, unsigned,
+            *signed_transactions(signers, 2, 300), *blockchain.chain, blockchain]
+
+
+def test_json_matches_json_dumps(objects):
+    for obj in objects:
+        assert to_json(obj) == canonical(obj)
+        assert to_bytes(obj) == canonical(obj).encode()
+        assert to_dict(obj) == reflective_to_dict(obj)
+
+
+def test_cached_json_follows_changes_and_compaction(signers):
+    transaction = signed_transactions(signers, 1, 700)[0]
+    to_json(transaction)
+    transaction.fee = 7
+    assert to_json(transaction) == canonical(transaction)
+    block = Block(prev_hash='0', miner=signers[0].public_version(), transactions=[transaction])
+    block.compact()
+    assert to_json(block) == canonical(block)
+    assert '_json' not in block.__dict__ and '_json' not in transaction.__dict__
+
+
+def test_signing_bytes_leave_out_the_signature(objects):
+    for obj in objects:
+        if isinstance(obj, (Transaction, Block)):
+            unsigned = dict(reflective_to_dict(obj), signature=None)
+            assert to_signing_bytes(obj) == json.dumps(unsigned, sort_keys=True).encode()
+            assert obj.signing_bytes() == to_signing_bytes(obj)
@@ -0,0 +1,81 @@
+import random
+
+from blockchain.classes import Transaction
+from blockchain.state import REMOVED, ChainState, LayeredMap
+from benchmarks.synthetic import mined_block, signed_transactions
+
+
+def test_layered_map_matches_a_dict():
+    rng = random.Random(7)
+    expected, layered, maps = dict(), LayeredMap(), []
+    for _ in range(500):
+        changes = dict()
+        for _ in range(rng.randint(1, 4)):
+            key = rng.randrange(60)
+            if key in expected and rng.random() < 0.3:
+                changes[key] = REMOVED
+                expected.pop(key)
+            else:
+                changes[key] = expected[key] = rng.random()
+        layered = layered.with_changes(changes)
+        maps.append((layered, dict(expected)))
+        assert len(layered._layers) <= 16
+    #  Every earlier map still holds what it held when it was made
+    for layered, held in maps[::25]:
+        assert dict(layered) == held
+        assert all(layered.get(key) == held.get(key) for key in range(60))
+
+
+def test_layered_map_keeps_insertion_order():
+    layered = LayeredMap().with_changes({'a': 1, 'b': 2}).with_changes({'c': 3}).with_changes({'a': REMOVED})
+    assert list(layered) == ['b', 'c']
+    assert list(layered.values()) == [2, 3]
+    assert 'a' not in layered
+
+
+def test_snapshots_are_isolated_from_later_writes(signers, make_chain):
+    blockchain = make_chain(3)
+    blockchain.build_index()
+    state = ChainState(blockchain)
+    before = state.snapshot
+    deltas = dict(before.deltas)
+    pending = Transaction(sender=signers[1].public_version(), recipient=signers[2].public_version(), value=777, fee=1)
+    signers[1].sign(pending)
+    with state.write() as chain:
+        chain.transactions.add(pending)
+    with_pending = state.snapshot
+    transactions = signed_transactions(signers, 2, 500)
+    block = mined_block(signers, blockchain.tip_hash(), transactions + [pending], 0, blockchain.next_target())
+    with state.write() as chain:
+        chain.add_block(block)
+    after = state.snapshot
+    assert before.height == 3 and after.height == 4
+    assert before.tip_hash != after.tip_hash
+    assert dict(before.deltas) == deltas
+    assert len(before.transactions) == 0
+    assert list(with_pending.transactions.values()) == [pending]
+    assert len(after.transactions) == 0
+    assert before.find_transaction(pending.hash()) is None
+    assert after.find_transaction(pending.hash()) == (3, 2)
+    assert before.find_block(block.hash()) is None
+    assert all((3, 2) not in before.history(key) for key in (signers[1].public_key, signers[2].public_key))
+    assert after.balance(signers[0].public_key) == blockchain.balance(signers[0].public_key)
+    assert dict(after.deltas) == blockchain._ledger.deltas
+
+
+def test_publish_only_takes_what_changed(signers, make_chain, monkeypatch):
+    blockchain = make_chain(2)
+    state = ChainState(blockchain)
+    published = []
+    original = LayeredMap.with_changes
+    monkeypatch.setattr(LayeredMap, 'with_changes',
+                        lambda layered, changes: published.append(len(changes)) or original(layered, changes))
+    pending = Transaction(sender=signers[1].public_version(), recipient=signers[2].public_version(), value=777, fee=1)
+    signers[1].sign(pending)
+    with state.write() as chain:
+        chain.transactions.add(pending)
+    #  Nothing changed in the ledger, one transaction in the mempool
+    assert published == [0, 1]
+    with state.write():
+        pass
+    assert published == [0, 1, 0, 0]
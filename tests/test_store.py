@@ -0,0 +1,126 @@
+import os
+
+from blockchain.classes import Blockchain, to_json
+from blockchain.index import ChainIndex
+from blockchain.store import BlockStore, INDEX_RECORD, blockchain_from_store
+
+
+def stored_chain(directory, blockchain):
+    store = BlockStore(directory)
+    stored = Blockchain()
+    stored.attach(store)
+    stored.build_index()
+    for block in blockchain.chain:
+        stored.add_block(block)
+    return store, stored
+
+
+def test_opening_creates_nothing(tmp_path):
+    store = BlockStore(str(tmp_path / 'blocks'))
+    assert len(store) == 0
+    assert not os.path.exists(store.directory)
+
+
+def test_blocks_read_back(tmp_path, make_chain):
+    blockchain = make_chain(5)
+    store, _ = stored_chain(str(tmp_path), blockchain)
+    reopened = BlockStore(str(tmp_path))
+    assert len(reopened) == 5
+    assert [digest.hex() for digest in reopened.digests()] == [block.hash() for block in blockchain.chain]
+    for height, block in enumerate(blockchain.chain):
+        assert reopened.read_json(height) == to_json(block)
+        assert reopened.read(height).hash() == block.hash()
+
+
+def test_truncate(tmp_path, make_chain):
+    blockchain = make_chain(6)
+    store, stored = stored_chain(str(tmp_path), blockchain)
+    view = store.view()
+    store.truncate(3)
+    assert len(store) == 3
+    assert len(store.digests()) == 3
+    #  A view made before the cut still sees every block it had
+    assert [view[height].hash() for height in range(6)] == [block.hash() for block in blockchain.chain]
+    reopened = BlockStore(str(tmp_path))
+    assert len(reopened) == 3
+    reopened.append(blockchain.chain[3])
+    assert reopened.read(3).hash() == blockchain.chain[3].hash()
+    assert len(BlockStore(str(tmp_path))) == 4
+
+
+def test_repair_drops_half_written_block(tmp_path, make_chain):
+    blockchain = make_chain(4)
+    stored_chain(str(tmp_path), blockchain)
+    segment = os.path.join(str(tmp_path), f'{0:08d}.log')
+    heights = os.path.join(str(tmp_path), 'heights')
+    size = os.path.getsize(segment)
+    #  A crash in the middle of writing a block, then in the middle of its index record
+    with open(segment, 'ab') as f:
+        f.write(to_json(blockchain.chain[0]).encode()[:20])
+    with open(heights, 'ab') as f:
+        f.write(bytes(INDEX_RECORD.size // 2))
+    repaired = BlockStore(str(tmp_path))
+    assert len(repaired) == 4
+    assert os.path.getsize(segment) == size
+    assert os.path.getsize(heights) == 4 * INDEX_RECORD.size
+    assert repaired.read(3).hash() == blockchain.chain[3].hash()
+
+
+def test_repair_drops_unindexed_segments(tmp_path, make_chain, monkeypatch):
+    monkeypatch.setattr('blockchain.store.SEGMENT_BLOCKS', 2)
+    blockchain = make_chain(4)
+    stored_chain(str(tmp_path), blockchain)
+    BlockStore(str(tmp_path)).truncate(2)
+    #  A crash while the first block of a new segment was written
+    with open(os.path.join(str(tmp_path), f'{1:08d}.log'), 'ab') as f:
+        f.write(b'{"half": ')
+    repaired = BlockStore(str(tmp_path))
+    assert len(repaired) == 2
+    assert not os.path.exists(os.path.join(str(tmp_path), f'{1:08d}.log'))
+    repaired.append(blockchain.chain[2])
+    assert BlockStore(str(tmp_path)).read(2).hash() == blockchain.chain[2].hash()
+
+
+def test_restart_only_reads_blocks_after_checkpoint(tmp_path, make_chain, monkeypatch):
+    monkeypatch.setattr('blockchain.classes.CHECKPOINT_INTERVAL', 4)
+    blockchain = make_chain(6)
+    stored_chain(str(tmp_path), blockchain)
+    read = []
+    original = BlockStore.read_json
+    monkeypatch.setattr(BlockStore, 'read_json', lambda store, height: read.append(height) or original(store, height))
+    restarted = blockchain_from_store(BlockStore(str(tmp_path)))
+    assert read == [4, 5]
+    assert restarted.tip_hash() == blockchain.tip_hash()
+    assert restarted._ledger.deltas == blockchain._ledger.deltas
+    fresh = ChainIndex(blockchain.chain)
+    assert restarted._index.blocks == fresh.blocks
+    assert restarted._index.transactions == fresh.transactions
+    assert restarted._index.addresses == fresh.addresses
+    assert restarted.is_valid()
+
+
+def test_reorg_only_checkpoints_when_it_has_to(tmp_path, make_chain, monkeypatch):
+    monkeypatch.setattr('blockchain.classes.CHECKPOINT_INTERVAL', 4)
+    blockchain = make_chain(6)
+    store, stored = stored_chain(str(tmp_path), blockchain)
+    assert store.checkpoint_height == 4
+    written = []
+    original = BlockStore.checkpoint
+    monkeypatch.setattr(BlockStore, 'checkpoint', lambda store, chain: written.append(len(chain.chain))
+                        or original(store, chain))
+    #  Swapping the tip for another block at the same height keeps the checkpoint
+    tip_swap = make_chain(6, start=100, base=Blockchain(list(blockchain.chain[:5])))
+    stored.replace_chain(tip_swap.chain)
+    assert written == []
+    restarted = blockchain_from_store(BlockStore(str(tmp_path)))
+    assert restarted.tip_hash() == tip_swap.tip_hash()
+    assert restarted._ledger.deltas == tip_swap._ledger.deltas
+    #  Cutting below the checkpoint writes a new one
+    deep = make_chain(7, start=200, base=Blockchain(list(blockchain.chain[:2])))
+    stored.replace_chain(deep.chain)
+    assert written == [7]
+    restarted = blockchain_from_store(BlockStore(str(tmp_path)))
+    assert restarted.tip_hash() == deep.tip_hash()
+    assert {key: delta for key, delta in restarted._ledger.deltas.items() if delta} == \
+           {key: delta for key, delta in deep._ledger.deltas.items() if delta}
+    assert restarted.is_valid()
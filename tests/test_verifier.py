@@ -0,0 +1,57 @@
+import pytest
+
+from blockchain import verifier
+from blockchain.chain_settings import PARALLEL_VERIFICATION_MIN
+from blockchain.verifier import first_invalid, verify
+from benchmarks.synthetic import signed_transactions
+
+
+def signature_items(signers, count):
+    return [(f'transaction {index}', transaction.sender.public_key, transaction.signing_bytes(), transaction.signature)
+            for index, transaction in enumerate(signed_transactions(signers, count, 1000))]
+
+
+@pytest.fixture
+def items(signers):
+    return signature_items(signers, PARALLEL_VERIFICATION_MIN * 3)
+
+
+def in_process_only(*args):
+    raise AssertionError('large batches are verified by the pool')
+
+
+def test_the_pool_verifies_large_batches(items, monkeypatch):
+    assert verifier._pool is not None
+    monkeypatch.setattr(verifier, 'verify', in_process_only)
+    assert first_invalid(items) is None
+    label, public_key, message, signature = items[150]
+    items[150] = (label, public_key, message, signature[:-1] + bytes([signature[-1] ^ 1]))
+    assert first_invalid(items) == 'transaction 150'
+
+
+def test_small_batches_and_no_pool_give_the_same_answer(items, monkeypatch):
+    label, public_key, message, _ = items[5]
+    items[5] = (label, public_key, message, items[6][3])
+    assert first_invalid(items[:PARALLEL_VERIFICATION_MIN - 1]) == 'transaction 5'
+    monkeypatch.setattr(verifier, '_pool', None)
+    assert first_invalid(items) == 'transaction 5'
+    assert first_invalid(items[6:]) is None
+
+
+def test_malformed_signatures_are_invalid(signers):
+    _, public_key, message, signature = signature_items(signers, 1)[0]
+    assert verify(public_key, message, signature.hex())
+    assert not verify(public_key, message, 'not hex')
+    assert not verify(public_key, message, None)
+    assert not verify(signers[1].public_key, message, signature)
+    assert not verify('not a key', message, signature)
+
+
+def test_chain_reports_the_first_bad_signature(make_chain, monkeypatch):
+    monkeypatch.setattr(verifier, '_pool', None)
+    blockchain = make_chain(3)
+    assert blockchain.invalid_signature() is None
+    transactions = blockchain.chain[1].transactions
+    transactions[0].signature = transactions[1].signature
+    assert blockchain.invalid_signature() == 'transaction 0 of block 1'
+    assert blockchain.invalid_signature(start=2) is None
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from blockchain import wire
+from blockchain.classes import User, to_dict, to_json, block_from_dict
+
+MESSAGE = {'none': None, 'yes': True, 'no': False,
+           'ints': [0, 1, -1, 63, -64, 127, 128, 2 ** 70, -(2 ** 70)],
+           'float': 2.5,
+           'text': 'plain string',
+           'short hex': 'abcd',
+           'hash': 'ab' * 64,
+           'upper hex': 'AB' * 32,
+           'nested': {'list': [[], {}, ['x', {'y': 1}]]}}
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib', 'zstd'])
+def test_round_trip(compression):
+    assert wire.decode(wire.encode(MESSAGE, compression)) == MESSAGE
+
+
+def test_long_messages_are_compressed():
+    message = {'text': 'x' * 4 * wire.WIRE_COMPRESS_MIN}
+    data = wire.encode(message, 'zlib')
+    assert data[len(wire.MAGIC)] == wire.COMPRESSIONS['zlib']
+    assert len(data) < len(json.dumps(message))
+    assert wire.decode(data) == message
+
+
+def test_block_round_trip(make_chain):
+    block = make_chain(1, per_block=3).chain[0]
+    message = json.loads(to_json(block))
+    data = wire.encode(message)
+    assert wire.decode(data) == message
+    assert block_from_dict(wire.decode(data)).hash() == block.hash()
+    #  Users are sent as references and hashes and signatures as raw bytes
+    assert len(wire.encode(message, None)) < len(to_json(block)) // 2
+
+
+def test_known_users_become_references(signers):
+    user = to_dict(signers[1].public_version())
+    data = wire.encode(user, None)
+    assert data[len(wire.MAGIC) + 1] == wire.USER
+    assert wire.decode(data) == user
+
+
+def test_unknown_user_is_sent_in_full():
+    stranger = to_dict(User('stranger', 'ff' * 64, 'not a key', None))
+    data = wire.encode(stranger, None)
+    assert data[len(wire.MAGIC) + 1] == wire.DICT
+    assert wire.decode(data) == stranger
+
+
+def test_unknown_reference():
+    data = wire.MAGIC + bytes([wire.COMPRESSIONS[None], wire.USER]) + bytes(8)
+    with pytest.raises(wire.UnknownReference):
+        wire.decode(data)
+
+
+@pytest.mark.parametrize('data', [b'', b'{}', wire.MAGIC,
+                                  wire.MAGIC + bytes([9, wire.NONE]),
+                                  wire.encode([1, 2], None) + bytes([wire.NONE]),
+                                  wire.encode('some text', None)[:-1]])
+def test_decode_rejects_bad_messages(data):
+    with pytest.raises(ValueError):
+        wire.decode(data)
+
+
+def test_loads_reads_both_formats():
+    assert wire.loads(wire.encode(MESSAGE), wire.BINARY) == MESSAGE
+    assert wire.loads(json.dumps(MESSAGE).encode(), wire.JSON) == MESSAGE
+    assert wire.loads(json.dumps(MESSAGE).encode(), None) == MESSAGE
+    #  Older nodes send a json string holding the json of the message
+    assert wire.loads(json.dumps(json.dumps(MESSAGE)).encode(), 'application/json; charset=utf-8') == MESSAGE
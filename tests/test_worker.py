@@ -0,0 +1,83 @@
+import threading
+import time
+
+from blockchain.classes import Block
+from blockchain.difficulty import INITIAL_TARGET
+from blockchain.worker import MiningWorker
+from benchmarks.synthetic import signed_transactions
+
+#  No digest is below 1, so a template mined against it only ends when it is cancelled
+IMPOSSIBLE_TARGET = 1
+
+
+def unmined_block(signers):
+    return Block(prev_hash='0', miner=signers[0].public_version(), transactions=signed_transactions(signers, 1))
+
+
+def wait_until(condition, timeout=30):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_cancel_abandons_the_block_and_goes_on_with_the_next(signers):
+    mined = []
+    started = threading.Event()
+
+    def current(block):
+        started.set()
+        return True
+
+    worker = MiningWorker(mined.append, current)
+    stuck = unmined_block(signers)
+    worker.submit(stuck, IMPOSSIBLE_TARGET)
+    assert started.wait(10)
+    worker.cancel()
+    following = unmined_block(signers)
+    worker.submit(following, INITIAL_TARGET)
+    wait_until(lambda: not worker.busy())
+    assert mined == [following]
+    assert following.difficulty_valid(INITIAL_TARGET)
+
+
+def test_cancel_drops_the_templates_queued_before_it(signers):
+    mined = []
+    release = threading.Event()
+
+    def current(block):
+        #  Hold the worker on its first template while more are queued and cancelled
+        release.wait(10)
+        return True
+
+    worker = MiningWorker(mined.append, current)
+    worker.submit(unmined_block(signers), IMPOSSIBLE_TARGET)
+    wait_until(lambda: worker._templates.qsize() == 0)
+    for _ in range(3):
+        worker.submit(unmined_block(signers), INITIAL_TARGET)
+    worker.cancel()
+    release.set()
+    wait_until(lambda: not worker.busy())
+    assert mined == []
+
+
+def test_only_the_newest_waiting_template_is_mined(signers):
+    mined = []
+    release = threading.Event()
+    first = unmined_block(signers)
+
+    def current(block):
+        if block is first:
+            release.wait(10)
+            return False
+        return True
+
+    worker = MiningWorker(mined.append, current)
+    worker.submit(first)
+    wait_until(lambda: worker._templates.qsize() == 0)
+    templates = [unmined_block(signers) for _ in range(3)]
+    for block in templates:
+        worker.submit(block)
+    release.set()
+    wait_until(lambda: not worker.busy())
+    assert mined == templates[-1:]